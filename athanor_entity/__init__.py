@@ -1,3 +1,5 @@
+import os
+
 # This one should be loaded FIRST, period.
 LOAD_PRIORITY = -1000000
 
@@ -10,5 +12,38 @@ def load(settings):
     # Gotta provide a default starting spot for Entity characters.
     settings.ENTITY_DEFAULT_HOME = "limbo/limbo_room"
     settings.ENTITY_START_LOCATION = "limbo/limbo_room"
+    # Gateways link maps together. They're newer than the other entity kinds, so make sure they're set up.
+    settings.MIXINS.setdefault("ENTITY_GATEWAY", list())
+    settings.DEFAULT_ENTITY_CLASSES.setdefault('gateways', "athanor_entity.entities.gateways.AthanorGateway")
+    # Likewise for instanced maps.
+    settings.MIXINS.setdefault("ENTITY_INSTANCE", list())
+    settings.DEFAULT_ENTITY_CLASSES.setdefault('instances', "athanor_entity.entities.instances.AthanorInstance")
     settings.GLOBAL_SCRIPTS['gamedata'] = {'typeclass': 'athanor_entity.controllers.gamedata.AthanorGameDataController',
                                            'repeats': -1, 'interval': 50, 'desc': 'Controller for Data System'}
+    # Central tick scheduler for map entities. Resolution and budget are in seconds.
+    settings.ENTITY_TICK_RESOLUTION = 1.0
+    settings.ENTITY_TICK_SLOTS = 60
+    settings.ENTITY_TICK_BUDGET = 0.01
+    # Where the runtime entity graph is stashed during a reload.
+    settings.ENTITY_SNAPSHOT_FILE = os.path.join(settings.GAME_DIR, "server", "entity_snapshot.bin")
+    # Whether entity operations start out instrumented. Can be toggled live with @entprofile, once
+    # athanor_entity.commands.admin.EntityAdminCmdSet has been added to your admin cmdset.
+    settings.ENTITY_PROFILING = False
+    # Route finding: how many landmarks to precompute for a map, once it has answered this many queries.
+    # Precomputing walks the whole map twice per landmark, about 1.8s of CPU for 8 landmarks on a 100k
+    # room map. It's done in the background, this many seconds per reactor iteration, and queries use
+    # plain breadth-first search until it's finished.
+    settings.ENTITY_PATH_LANDMARKS = 8
+    settings.ENTITY_PATH_HOT_QUERIES = 50
+    settings.ENTITY_PATH_LANDMARK_BUDGET = 0.01
+    # How many exits away says can be heard from.
+    settings.ENTITY_HEARING_RANGE = 2
+    # Seconds of zone reset work to do per reactor iteration.
+    settings.ENTITY_RESET_BUDGET = 0.01
+    # Where compiled map bundles are cached, one per plugin, such as
+    # os.path.join(GAME_DIR, "server", "bundles"). None prepares maps from plugin data every time.
+    settings.ENTITY_MAP_BUNDLE_DIR = None
+    # Worker processes to compile plugin templates and maps in at startup, one plugin per job. 0 compiles in-process.
+    settings.ENTITY_COMPILE_WORKERS = 0
+    # Whether plugin data is checked for mistakes before loading, reporting them all at once.
+    settings.ENTITY_VALIDATE_DATA = True
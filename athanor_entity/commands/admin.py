@@ -0,0 +1,101 @@
+from evennia import GLOBAL_SCRIPTS
+from evennia.commands.cmdset import CmdSet
+from evennia.commands.default.muxcommand import MuxCommand
+
+
+class CmdEntityProfile(MuxCommand):
+    """
+    Inspect where time goes in entity operations.
+
+    Usage:
+        @entprofile
+        @entprofile/on
+        @entprofile/off
+        @entprofile/reset
+        @entprofile/rooms [<operation>]
+        @entprofile/maps [<operation>]
+
+    With no switch, shows totals per operation. /rooms and /maps list the
+    rooms or maps that have eaten the most time, optionally for only one
+    operation (move_to, msg_contents, return_appearance, search_entities,
+    map_load, location_save).
+    """
+    key = "@entprofile"
+    locks = "cmd:perm(Developer)"
+    help_category = "System"
+    switch_options = ("on", "off", "reset", "rooms", "maps")
+
+    def func(self):
+        controller = GLOBAL_SCRIPTS.entity
+        profiler = controller.profiler
+
+        if "on" in self.switches:
+            controller.profile(True)
+            self.caller.msg("Entity profiling enabled.")
+            return
+        if "off" in self.switches:
+            controller.profile(False)
+            self.caller.msg("Entity profiling disabled.")
+            return
+        if "reset" in self.switches:
+            controller.profile(profiler.enabled, reset=True)
+            self.caller.msg("Entity profiling data cleared.")
+            return
+
+        lines = [f"Entity profiling is |w{'on' if profiler.enabled else 'off'}|n."]
+        if "rooms" in self.switches or "maps" in self.switches:
+            breakdown = "rooms" if "rooms" in self.switches else "maps"
+            for op, key, stats in profiler.slowest(breakdown, operation=self.args.strip() or None, count=20):
+                lines.append(f"{op:<18} {key:<40} {stats.count:>8} calls {stats.total * 1000:>10.1f} ms "
+                             f"max {stats.max * 1000:.2f} ms")
+        else:
+            for op, stats in sorted(profiler.operations.items()):
+                lines.append(f"{op:<18} {stats.count:>8} calls avg {stats.average * 1000:.3f} ms "
+                             f"p99 {stats.percentile(0.99) * 1000:.3f} ms max {stats.max * 1000:.3f} ms")
+        self.caller.msg("\n".join(lines))
+
+
+class CmdEntityReset(MuxCommand):
+    """
+    Restore rooms to the population listed in their map data.
+
+    Usage:
+        @entreset <region>[/<room>][,<region>[/<room>]...]
+        @entreset/strays <region>[/<room>]
+        @entreset/now <region>[/<room>]
+
+    Only the difference is spawned or despawned, and rooms belonging to an
+    area are reconciled with the rest of their area. /strays also removes
+    spawned things whose template the rooms don't list. Resets are worked
+    through in the background unless /now is given.
+    """
+    key = "@entreset"
+    locks = "cmd:perm(Builder)"
+    help_category = "Building"
+    switch_options = ("strays", "now")
+
+    def func(self):
+        if not self.lhslist:
+            self.caller.msg("Usage: @entreset <region>[/<room>]")
+            return
+        controller = GLOBAL_SCRIPTS.entity
+        caller = self.caller
+        try:
+            groups = controller.reset(self.lhslist, strays="strays" in self.switches, immediate="now" in self.switches,
+                                      callback=lambda: caller.msg("Reset complete."))
+        except (KeyError, ValueError) as err:
+            caller.msg(f"Cannot reset {self.lhs}: {err}")
+            return
+        caller.msg(f"Resetting {groups} area(s) and room(s).")
+
+
+class EntityAdminCmdSet(CmdSet):
+    """
+    Not added anywhere automatically. Add it to whichever cmdset your admins get, such as your
+    game's CharacterCmdSet, with self.add(EntityAdminCmdSet).
+    """
+    key = "EntityAdminCmdSet"
+
+    def at_cmdset_creation(self):
+        self.add(CmdEntityProfile)
+        self.add(CmdEntityReset)
@@ -0,0 +1,146 @@
+"""
+Scoped broadcasts to every puppet in an area or on a map.
+
+OccupancyHandler keeps a set of the puppeted entities at every level, so an area or region echo
+only visits the entities somebody is actually playing, never exits, items or idle NPCs.
+
+Sounds can also be propagated beyond their room: propagate() delivers a variant of the message
+per distance to puppets in nearby rooms, using the neighborhoods cached by the map's MapGraph.
+
+Output can be batched per session (batch=True): everything broadcast to a session during one
+reactor turn is joined and sent with a single data_out per set of options, so a weather change, a
+zone echo and a shout landing together cost one send instead of three. Batching is opt-in, since
+batched text arrives on the next reactor turn, after anything sent directly in this one. Runtime
+entities flush their sessions' pending batch before any direct msg(), but other objects can't be
+relied on to, so only batch messages whose order against direct sends doesn't matter.
+"""
+from evennia.utils import logger
+from evennia.utils.utils import make_iter
+
+
+class MessageBatcher(object):
+
+    def __init__(self):
+        self.pending = dict()
+        self.scheduled = False
+
+    def add(self, session, text, options=None):
+        # Consecutive messages with the same options are joined; a change of options starts a new send.
+        options = options or dict()
+        groups = self.pending.setdefault(session, list())
+        if groups and groups[-1][1] == options:
+            groups[-1][0].append(text)
+        else:
+            groups.append(([text], options))
+        if not self.scheduled:
+            from twisted.internet import reactor
+            self.scheduled = True
+            reactor.callLater(0, self.flush)
+
+    def send(self, session, groups):
+        for texts, options in groups:
+            try:
+                session.data_out(text=("\n".join(texts), options))
+            except Exception:
+                logger.log_trace()
+
+    def flush(self):
+        pending, self.pending = self.pending, dict()
+        self.scheduled = False
+        for session, groups in pending.items():
+            self.send(session, groups)
+
+    def flush_sessions(self, sessions):
+        """
+        Sends whatever is pending for some sessions right away, so that a direct send to them
+        doesn't overtake it.
+        """
+        if not self.pending:
+            return
+        for session in sessions:
+            if (groups := self.pending.pop(session, None)):
+                self.send(session, groups)
+
+
+BATCHER = MessageBatcher()
+
+
+def broadcast(recipients, text, exclude=None, from_obj=None, mapping=None, batch=False, **kwargs):
+    """
+    Sends a message to many puppets at once.
+
+    Args:
+        recipients (iterable): The entities to message, such as OccupancyHandler.puppets.
+        text (str or tuple): The message, or (message, outkwargs) as per msg_contents.
+        exclude (list, optional): Entities not to send to.
+        from_obj (entity, optional): Who the message is from. Gets at_msg_send called as usual.
+        mapping (dict, optional): Substitutions for the message, rendered per recipient with
+            get_display_name, as per msg_contents.
+        batch (bool): If True, batch output per session until the next reactor turn instead of
+            sending immediately through each recipient's msg().
+        **kwargs: Passed on to msg() when not batching.
+
+    Returns:
+        count (int): How many recipients were sent to.
+    """
+    is_outcmd = isinstance(text, (tuple, list))
+    message = text[0] if is_outcmd else text
+    options = text[1] if is_outcmd and len(text) > 1 else dict()
+    exclude = set(make_iter(exclude)) if exclude else None
+    senders = make_iter(from_obj) if from_obj else list()
+    count = 0
+
+    for obj in list(recipients):
+        if exclude and obj in exclude:
+            continue
+        if mapping:
+            out = message.format(**{t: sub.get_display_name(obj) if hasattr(sub, 'get_display_name') else str(sub)
+                                    for t, sub in mapping.items()})
+        else:
+            out = message
+        count += 1
+        if not batch:
+            obj.msg(text=(out, options), from_obj=from_obj, **kwargs)
+            continue
+        for sender in senders:
+            try:
+                sender.at_msg_send(text=out, to_obj=obj)
+            except Exception:
+                logger.log_trace()
+        try:
+            if not obj.at_msg_receive(text=out):
+                continue
+        except Exception:
+            logger.log_trace()
+        for session in obj.sessions.all():
+            BATCHER.add(session, out, options)
+    return count
+
+
+def propagate(room, variants, exclude=None, from_obj=None, mapping=None, batch=False):
+    """
+    Carries a sound out of a room, getting fainter with every exit it passes.
+
+    Args:
+        room (AthanorRoom): Where the sound was made. Its own occupants aren't messaged.
+        variants (list): What is heard at each distance: variants[0] one exit away, variants[1]
+            two away and so on. Entries may be None for silence at that distance.
+        exclude (list, optional): Entities not to send to.
+        from_obj (entity, optional): Who made the sound.
+        mapping (dict, optional): Per-recipient substitutions, as per msg_contents.
+        batch (bool): Whether to batch output per session.
+
+    Returns:
+        count (int): How many puppets heard it.
+    """
+    if not variants or not hasattr(room, 'handler'):
+        return 0
+    puppets = room.handler.owner.occupancy.puppets
+    if not puppets:
+        return 0
+    count = 0
+    for distance, listeners in room.handler.graph.audience(room, len(variants), puppets).items():
+        if (text := variants[distance - 1]):
+            count += broadcast(listeners, text, exclude=exclude, from_obj=from_obj, mapping=mapping, batch=batch)
+    return count
+
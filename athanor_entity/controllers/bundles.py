@@ -0,0 +1,367 @@
+"""
+Precompiled map bundles: a plugin's maps compiled once into a compact binary file, which later
+startups read instead of preparing every map from its YAML again.
+
+A prepared map (as made by the controller's prepare_map) is a dict per room and per exit, each
+holding a merged copy of its templates. A bundle keeps only what differs: every area, room,
+gateway and exit is stored as the ids of its templates plus its own data, and exits are integer
+tables indexed by room, CSR-style (the exits of room i are exit_offsets[i] to exit_offsets[i+1]).
+Strings are interned before being written, so marshal stores each distinct one once and loading
+interns them again, sharing a single copy of every key and class path across all maps.
+
+Each map is its own section of the file, read through mmap, so loading a map never reads the
+others. It comes back as a BundledMap, which quacks like a prepared map: areas and gateways are
+prepared up front, but rooms and exits are merged with their templates only when something asks
+for them (a MapHandler loading, an instance building a room), and aren't kept afterwards. Routing
+and path topologies read the exit tables directly, through mapdata.iter_room_exits().
+
+Bundles are written by the controller whenever a plugin's map data is newer than its bundle (much
+like .pyc files), and used as-is for plugins which ship a bundle and no map data at all.
+
+The file is: magic, format version and header length (see _PREAMBLE), the marshalled header, then
+the marshalled map sections.
+"""
+import hashlib
+import marshal
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+BUNDLE_MAGIC = b'ATHB'
+BUNDLE_VERSION = 1
+BUNDLE_EXTENSION = '.athb'
+_PREAMBLE = struct.Struct('<4sII')
+
+
+def source_digest(data):
+    """
+    Fingerprints raw map data, to tell whether a bundle (or a reload) is out of date.
+
+    Returns:
+        digest (bytes)
+    """
+    try:
+        raw = marshal.dumps(data)
+    except ValueError:
+        # YAML can produce things marshal doesn't know about, such as dates.
+        raw = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def template_names(data):
+    """
+    Returns:
+        templates (list): The templates a piece of raw data inherits from. Like make_iter, but
+            without needing Evennia, so that worker processes can use it.
+    """
+    if not (templates := data.get('templates', None)):
+        return list()
+    if isinstance(templates, str):
+        return [templates]
+    return list(templates)
+
+
+def intern_all(value):
+    """
+    Returns:
+        value: A copy of value with every string in it, keys included, interned.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {intern_all(key): intern_all(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [intern_all(val) for val in value]
+    if isinstance(value, tuple):
+        return tuple(intern_all(val) for val in value)
+    return value
+
+
+class BundleWriter(object):
+    """
+    Compiles raw map data, as found in plugin YAML, into a bundle. Only the compiler's
+    resolve_path() is used, so this works in worker processes too.
+    """
+
+    def __init__(self, controller, plugin_key):
+        self.controller = controller
+        self.plugin = plugin_key
+        self.templates = list()
+        self.template_ids = dict()
+
+    def compile_thing(self, kind, data):
+        """
+        Returns:
+            thing (tuple): (template ids, own data) for one area, room, gateway, exit or map.
+        """
+        ids = list()
+        for template in template_names(data):
+            path = self.controller.resolve_path(template, self.plugin, kind)
+            if (found := self.template_ids.get(path, None)) is None:
+                found = len(self.templates)
+                self.template_ids[path] = found
+                self.templates.append(path)
+            ids.append(found)
+        return tuple(ids), intern_all({key: value for key, value in data.items() if key != 'templates'})
+
+    def compile_map(self, map_key, data):
+        rooms = data.get('rooms', dict())
+        room_keys = [sys.intern(key) for key in rooms.keys()]
+        index = {key: i for i, key in enumerate(room_keys)}
+        exits = data.get('exits', dict())
+        for room_key in exits:
+            if room_key not in index:
+                raise ValueError(f"{self.plugin}/{map_key}: exits listed for unknown room {room_key}")
+
+        room_templates, room_data = list(), list()
+        exit_offsets, exit_targets = array('i', [0]), array('i')
+        exit_keys, exit_templates, exit_data = list(), list(), list()
+        for room_key, thing in rooms.items():
+            ids, own = self.compile_thing('rooms', thing)
+            room_templates.append(ids)
+            room_data.append(own)
+            for dest_key, exit_thing in (exits.get(room_key, None) or dict()).items():
+                ids, own = self.compile_thing('exits', exit_thing)
+                exit_keys.append(sys.intern(dest_key))
+                exit_targets.append(index.get(dest_key, -1))
+                exit_templates.append(ids)
+                exit_data.append(own)
+            exit_offsets.append(len(exit_keys))
+
+        return {
+            'map': self.compile_thing('maps', data.get('map', dict())),
+            'areas': [(sys.intern(key),) + self.compile_thing('areas', thing)
+                      for key, thing in data.get('areas', dict()).items()],
+            'gateways': [(sys.intern(key),) + self.compile_thing('gateways', thing)
+                         for key, thing in data.get('gateways', dict()).items()],
+            'rooms': room_keys,
+            'room_templates': room_templates,
+            'room_data': room_data,
+            'exit_offsets': exit_offsets.tobytes(),
+            'exit_targets': exit_targets.tobytes(),
+            'exit_keys': exit_keys,
+            'exit_templates': exit_templates,
+            'exit_data': exit_data,
+        }
+
+    def compile(self, maps):
+        """
+        Compiles maps into bundle sections.
+
+        Args:
+            maps (dict): Map key -> raw map data.
+
+        Returns:
+            templates (list): The (plugin, kind, key) of every template the sections refer to by id.
+            sections (dict): Map key -> (marshalled section, digest of its raw data).
+        """
+        sections = {key: (marshal.dumps(self.compile_map(key, data)), source_digest(data)) for key, data in maps.items()}
+        return self.templates, sections
+
+    def write(self, maps, path):
+        """
+        Compiles maps and writes them to a bundle file, atomically.
+
+        Args:
+            maps (dict): Map key -> raw map data.
+            path (str): Where to write the bundle.
+
+        Returns:
+            size (int): Bytes written.
+        """
+        templates, sections = self.compile(maps)
+        offsets, position = dict(), 0
+        for map_key, (section, digest) in sections.items():
+            offsets[map_key] = (position, len(section), digest)
+            position += len(section)
+        header = marshal.dumps({'plugin': self.plugin, 'templates': templates, 'maps': offsets})
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(header)))
+            f.write(header)
+            for section, _ in sections.values():
+                f.write(section)
+        os.replace(temp_path, path)
+        return _PREAMBLE.size + len(header) + position
+
+
+def ensure_bundle(compiler, plugin_key, maps, path):
+    """
+    Rebuilds a plugin's bundle unless it's up to date with its raw maps.
+
+    Args:
+        compiler (DataCompiler): Used to resolve template paths.
+        plugin_key (str): The plugin.
+        maps (dict): Map key -> raw map data.
+        path (str): The bundle file.
+
+    Returns:
+        rebuilt (bool)
+    """
+    if os.path.exists(path):
+        try:
+            with MapBundle(path) as bundle:
+                if set(bundle.maps) == set(maps) and all(bundle.digest(key) == source_digest(data)
+                                                         for key, data in maps.items()):
+                    return False
+        except ValueError:
+            pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    BundleWriter(compiler, plugin_key).write(maps, path)
+    return True
+
+
+class MapBundle(object):
+    """
+    An open bundle file. Use it as a context manager, since it holds the file mapped until closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = _PREAMBLE.unpack_from(self.mmap, 0) if len(self.mmap) >= _PREAMBLE.size \
+            else (None, None, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a map bundle this version can read.")
+        header = self.read(_PREAMBLE.size, length)
+        self.base = _PREAMBLE.size + length
+        self.plugin = header['plugin']
+        self.templates = [tuple(template) for template in header['templates']]
+        self.maps = header['maps']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.mmap.close()
+
+    def read(self, offset, length):
+        with memoryview(self.mmap) as view, view[offset:offset + length] as section:
+            return marshal.loads(section)
+
+    def digest(self, map_key):
+        return self.maps[map_key][2]
+
+    def load(self, controller, map_key):
+        """
+        Returns:
+            map (BundledMap)
+        """
+        offset, length, _ = self.maps[map_key]
+        return BundledMap(controller, self.plugin, map_key, self.templates,
+                          self.read(self.base + offset, length))
+
+
+class BundledMap(Mapping):
+    """
+    A map read from a bundle. Stands in for the dict prepare_map makes: it has the same 'map',
+    'areas', 'rooms' and 'gateways', but rooms are prepared each time one is looked up.
+    """
+
+    def __init__(self, controller, plugin_key, map_key, templates, section):
+        self.controller = controller
+        self.plugin = plugin_key
+        self.map_key = map_key
+        self.templates = templates
+        self.room_keys = section['rooms']
+        self.index = {key: i for i, key in enumerate(self.room_keys)}
+        self.room_templates = section['room_templates']
+        self.room_data = section['room_data']
+        self.exit_offsets = array('i')
+        self.exit_offsets.frombytes(section['exit_offsets'])
+        self.exit_targets = array('i')
+        self.exit_targets.frombytes(section['exit_targets'])
+        self.exit_keys = section['exit_keys']
+        self.exit_templates = section['exit_templates']
+        self.exit_data = section['exit_data']
+        self.data = {
+            'map': self.prepare('maps', *section['map'], no_class=True),
+            'areas': {key: self.prepare('areas', ids, own) for key, ids, own in section['areas']},
+            'rooms': BundledRooms(self),
+            'gateways': {key: self.prepare('gateways', ids, own) for key, ids, own in section['gateways']},
+        }
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return f"{self.plugin}/{self.map_key}"
+
+    def prepare(self, kind, template_ids, own, no_class=False):
+        """
+        Merges one thing with its templates, exactly as the controller's prepare_data would.
+        """
+        data = dict()
+        for template_id in template_ids:
+            data.update(self.controller.get_template(*self.templates[template_id]))
+        data.update(own)
+        if not no_class:
+            data['class'] = self.controller.get_class(kind, own.get('class', None))
+        return data
+
+    def field(self, template_ids, own, name):
+        """
+        Returns:
+            value: What name would be in the merged data of a thing, without merging it.
+        """
+        if name in own:
+            return own[name]
+        for template_id in reversed(template_ids):
+            if name in (template := self.controller.get_template(*self.templates[template_id])):
+                return template[name]
+        return None
+
+    def room(self, i):
+        data = self.prepare('rooms', self.room_templates[i], self.room_data[i])
+        data['exits'] = {self.exit_keys[j]: self.prepare('exits', self.exit_templates[j], self.exit_data[j])
+                         for j in range(self.exit_offsets[i], self.exit_offsets[i + 1])}
+        return data
+
+    def room_exits(self, *fields):
+        offsets, keys, templates, own = self.exit_offsets, self.exit_keys, self.exit_templates, self.exit_data
+        # Most exits share a handful of template lists, so what those provide is only looked up once.
+        inherited = dict()
+        for i, room_key in enumerate(self.room_keys):
+            room_exits = list()
+            for j in range(offsets[i], offsets[i + 1]):
+                if (defaults := inherited.get(templates[j], None)) is None:
+                    defaults = inherited[templates[j]] = tuple(self.field(templates[j], {}, name) for name in fields)
+                data = own[j]
+                room_exits.append((keys[j], tuple(data[name] if name in data else default
+                                                  for name, default in zip(fields, defaults))))
+            yield room_key, room_exits
+
+
+class BundledRooms(Mapping):
+
+    def __init__(self, bundled):
+        self.bundled = bundled
+
+    def __getitem__(self, key):
+        return self.bundled.room(self.bundled.index[key])
+
+    def __contains__(self, key):
+        return key in self.bundled.index
+
+    def __iter__(self):
+        return iter(self.bundled.room_keys)
+
+    def __len__(self):
+        return len(self.bundled.room_keys)
+
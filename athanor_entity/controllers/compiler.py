@@ -0,0 +1,190 @@
+"""
+Compiling plugin data: resolving template inheritance and preparing maps from raw plugin data.
+
+DataCompiler holds the logic. The entity controller is one, and so is PluginCompiler, which does
+the same work for a single plugin inside a worker process. With ENTITY_COMPILE_WORKERS set, the
+controller's compile_plugins() hands every plugin to compile_plugin() in a process pool, and merges
+the results back in: templates, and maps compiled into bundle sections (see bundles.py). Workers
+leave class paths as strings (None standing for the kind's default class), since resolving them
+means importing typeclasses; the main process resolves them as it takes the results in.
+
+Workers are started fresh (the 'spawn' method) rather than forked from the running server, so this
+module and bundles.py must stay importable without Django or Evennia being set up.
+"""
+import os
+import traceback
+from collections import defaultdict
+
+from athanor_entity.controllers.bundles import BundleWriter, ensure_bundle, template_names
+
+
+class DataCompiler(object):
+    """
+    Template merging and map preparation. Subclasses provide get_class, get_template and
+    set_template, which decide what classes are and where merged templates are kept.
+    """
+
+    def get_class(self, kind, path):
+        raise NotImplementedError()
+
+    def get_template(self, plugin_key, kind, key):
+        raise NotImplementedError()
+
+    def set_template(self, template, data):
+        raise NotImplementedError()
+
+    def resolve_path(self, path, plugin, kind):
+        split_path = path.split('/')
+        if len(split_path) == 1:
+            plugin_path = plugin
+            kind_path = kind
+            key_path = split_path[0]
+        if len(split_path) == 2:
+            plugin_path = plugin
+            kind_path, key_path = split_path
+        if len(split_path) == 3:
+            plugin_path, kind_path, key_path = split_path
+        return plugin_path, kind_path, key_path
+
+    def merge_templates(self, templates_raw, pending, loaded=None):
+        """
+        Resolves template inheritance for the given templates.
+
+        Args:
+            templates_raw (dict): (plugin, kind, key) -> raw template data, for every template.
+            pending (set): The (plugin, kind, key) of the templates to merge.
+            loaded (set, optional): Templates which are already merged, and may be inherited from.
+        """
+        templates_left = set(pending)
+        loaded_set = set(loaded or ())
+        current_count = 0
+        while len(templates_left) > 0:
+            start_count = current_count
+            for template in templates_left:
+                template_data = templates_raw[template]
+                template_list = template_names(template_data)
+                resolved = [self.resolve_path(template_par, template[0], template[1]) for template_par in template_list]
+                if len(set(resolved) - loaded_set) > 0:
+                    continue
+                final_data = dict()
+                for template_par in resolved:
+                    final_data.update(templates_raw[template_par])
+                final_data.update(templates_raw[template])
+                if "templates" in final_data:
+                    del final_data['templates']
+                final_data['class'] = self.get_class(template[1], final_data.get('class', None))
+                self.set_template(template, final_data)
+                loaded_set.add(template)
+                current_count += 1
+            templates_left -= loaded_set
+            if start_count == current_count:
+                raise ValueError(
+                    f"Unresolveable old_templates detected! Error for template {template} ! Potential endless loop broken! old_templates left: {templates_left}")
+
+    def prepare_data(self, kind, start_data, plugin, no_class=False):
+        # start_data is left untouched, since it's kept as the source for reload_data().
+        data = dict()
+        for template in template_names(start_data):
+            data.update(self.get_template(plugin, kind, template))
+        data.update(start_data)
+        data.pop('templates', None)
+        if not no_class:
+            data['class'] = self.get_class(kind, start_data.get('class', None))
+        return data
+
+    def prepare_map(self, plugin_key, data):
+        """
+        Builds a map's runtime data from its raw plugin data, merging in templates.
+
+        Returns:
+            map_data (dict): With 'map', 'areas', 'rooms' (each holding its 'exits') and 'gateways'.
+        """
+        map_data = defaultdict(dict)
+        map_data['map'] = self.prepare_data('maps', data.get('map', dict()), plugin_key, no_class=True)
+        for kind in ('areas', 'rooms', 'gateways'):
+            for thing_key, thing_data in data.get(kind, dict()).items():
+                map_data[kind][thing_key] = self.prepare_data(kind, thing_data, plugin_key)
+
+        for room_key, room_exits in data.get('exits', dict()).items():
+            map_data['rooms'][room_key]['exits'] = dict()
+            if not room_exits:
+                continue
+            for dest_key, exit_data in room_exits.items():
+                map_data['rooms'][room_key]['exits'][dest_key] = self.prepare_data('exits', exit_data, plugin_key)
+        return map_data
+
+    def template_closure(self, templates_raw, keys):
+        """
+        Returns:
+            closure (set): keys, plus every template they inherit from, directly or not. Parents
+                which don't exist are left out, for merge_templates to complain about.
+        """
+        closure = set()
+        pending = list(keys)
+        while pending:
+            if (template := pending.pop()) in closure or template not in templates_raw:
+                continue
+            closure.add(template)
+            pending.extend(self.resolve_path(parent, template[0], template[1])
+                           for parent in template_names(templates_raw[template]))
+        return closure
+
+
+class PluginCompiler(DataCompiler):
+    """
+    Compiles one plugin in a worker process, keeping class paths as strings.
+    """
+
+    def __init__(self, plugin_key):
+        self.plugin = plugin_key
+        self.templates = dict()
+
+    def get_class(self, kind, path):
+        return path
+
+    def get_template(self, plugin_key, kind, key):
+        if not (found := self.templates.get((plugin_key, kind, key), None)):
+            raise ValueError(f"No Template Key: {plugin_key}/{kind}/{key}")
+        return found
+
+    def set_template(self, template, data):
+        self.templates[template] = data
+
+
+def compile_plugin(job):
+    """
+    Compiles one plugin's templates and maps. This is what the controller's compile_plugins()
+    runs in its worker processes.
+
+    Maps are compiled into bundle sections rather than prepared, since sending prepared maps back
+    to the main process would cost about as much as preparing them there. If the plugin has a
+    bundle file, that's brought up to date instead, and nothing is sent back for its maps.
+
+    Args:
+        job (tuple): (plugin key, raw templates: the plugin's own and every template they inherit
+            from, raw maps, bundle path or None).
+
+    Returns:
+        result (dict): 'plugin', 'templates' (the plugin's merged templates), 'sections' (as per
+            BundleWriter.compile(), or None if the bundle file holds them), 'warning' and 'error'
+            (formatted tracebacks, or None).
+    """
+    plugin_key, templates_raw, maps, bundle_path = job
+    result = {'plugin': plugin_key, 'templates': None, 'sections': None, 'warning': None, 'error': None}
+    try:
+        compiler = PluginCompiler(plugin_key)
+        compiler.merge_templates(templates_raw, set(templates_raw))
+        result['templates'] = {template: data for template, data in compiler.templates.items()
+                               if template[0] == plugin_key}
+        if bundle_path:
+            try:
+                if maps:
+                    ensure_bundle(compiler, plugin_key, maps, bundle_path)
+                if os.path.exists(bundle_path):
+                    return result
+            except Exception:
+                result['warning'] = traceback.format_exc()
+        result['sections'] = BundleWriter(compiler, plugin_key).compile(maps)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    return result
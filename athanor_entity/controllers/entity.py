@@ -1,55 +1,269 @@
-from django.conf import settings
+import marshal
+import multiprocessing
+import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
 
 from evennia import GLOBAL_SCRIPTS
+from evennia.utils import logger
 from evennia.utils.utils import class_from_module, make_iter
 
 from athanor.gamedb.objects import AthanorObject
 from athanor.gamedb.scripts import AthanorGlobalScript
+from athanor_entity.models import MapBridge
 from athanor_entity.gamedb.regions import AthanorRegion
+from athanor_entity.entities.handlers import LocationHandler
+from athanor_entity.controllers.scheduler import TickScheduler
+from athanor_entity.controllers.registry import EntityRegistry
+from athanor_entity.controllers.snapshot import EntitySnapshot
+from athanor_entity.controllers.profiler import PROFILER
+from athanor_entity.controllers.routing import GatewayRouter
+from athanor_entity.controllers.spawner import SpawnEngine
+from athanor_entity.controllers.resets import ResetEngine
+from athanor_entity.controllers.reloader import DataReloader
+from athanor_entity.controllers.bundles import BUNDLE_EXTENSION, BundledMap, MapBundle, ensure_bundle, source_digest
+from athanor_entity.controllers.compiler import DataCompiler, compile_plugin
+from athanor_entity.controllers.validation import validate_plugins
+from athanor_entity.entities.components import ComponentStore
+from athanor_entity.entities.instances import MapBlueprint
 
 MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["CONTROLLERS_ENTITY"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
-class AthanorEntityController(*MIXINS, AthanorGlobalScript):
+class AthanorEntityController(*MIXINS, DataCompiler, AthanorGlobalScript):
     system_name = 'ENTITY'
 
     def at_start(self):
         self.load()
+        self.profile(settings.ENTITY_PROFILING)
+        try:
+            EntitySnapshot(self).load(settings.ENTITY_SNAPSHOT_FILE)
+        except Exception:
+            logger.log_trace("Could not restore entity snapshot. Entities will have to be respawned.")
+        self.ndb.ticks.start()
+
+    def at_server_reload(self):
+        try:
+            EntitySnapshot(self).save(settings.ENTITY_SNAPSHOT_FILE)
+        except Exception:
+            logger.log_trace("Could not save entity snapshot.")
+
+    def at_stop(self):
+        if self.ndb.ticks:
+            self.ndb.ticks.stop()
+
+    @property
+    def profiler(self):
+        return PROFILER
 
-    def load(self):
-        self.ndb.plugins = GLOBAL_SCRIPTS.gamedata.ndb.plugins
+    def profile(self, enabled=True, reset=False):
+        """
+        Switches hot-path instrumentation of entity operations on or off.
+
+        Args:
+            enabled (bool): Whether to record timings.
+            reset (bool): Whether to throw away everything recorded so far.
+        """
+        if reset:
+            PROFILER.reset()
+        if enabled:
+            PROFILER.enable()
+        else:
+            PROFILER.disable()
+
+    def load(self, plugins=None):
+        """
+        (Re)builds all runtime state: templates, maps and regions.
+
+        Args:
+            plugins (dict, optional): Plugin key -> plugin data to load from. Defaults to
+                whatever the gamedata controller has loaded. Mostly useful for benchmarks.
+        """
+        # The previous scheduler would otherwise keep ticking the old entities.
+        ticking = False
+        if (old_ticks := self.ndb.ticks) is not None:
+            ticking = old_ticks.running
+            old_ticks.shutdown()
+        self.ndb.ticks = TickScheduler(resolution=settings.ENTITY_TICK_RESOLUTION, slots=settings.ENTITY_TICK_SLOTS,
+                                       budget=settings.ENTITY_TICK_BUDGET)
+        self.ndb.registry = EntityRegistry()
+        self.ndb.component_stores = dict()
+        self.ndb.plugins = plugins if plugins is not None else GLOBAL_SCRIPTS.gamedata.ndb.plugins
         self.ndb.class_cache = defaultdict(dict)
-        self.prepare_templates()
+        self.ndb.routes = GatewayRouter()
+        if settings.ENTITY_VALIDATE_DATA:
+            self.validate_data(self.ndb.plugins)
+        if (workers := settings.ENTITY_COMPILE_WORKERS) and len(self.ndb.plugins) > 1:
+            self.compile_plugins(workers)
+        else:
+            self.prepare_templates()
+            self.prepare_maps()
+        self.ndb.spawner = SpawnEngine(self)
+        self.ndb.resets = ResetEngine(self.ndb.spawner, budget=settings.ENTITY_RESET_BUDGET)
         self.ndb.regions = dict()
-        self.prepare_maps()
+        self.ndb.map_blueprints = dict()
+        self.ndb.instances = dict()
+        self.ndb.instance_counter = 0
         self.load_regions()
+        self.load_routes()
+        if ticking:
+            self.ndb.ticks.start()
+
+    def reload_data(self, plugins=None):
+        """
+        Applies changed plugin data to the running game without rebuilding it: only templates and
+        maps which changed are redone, and loaded maps are patched in place. See reloader.py.
+
+        Args:
+            plugins (dict, optional): Plugin key -> freshly loaded plugin. Defaults to whatever the
+                gamedata controller has loaded now, which must have re-read its plugins' data
+                since load(). A plugin whose data has no 'templates' or 'maps' keeps what it has.
+
+        Returns:
+            report (dict): What was reloaded, as per DataReloader.reload().
+
+        Raises:
+            ValueError: If given plugins whose data has already been taken in, since reloading
+                them would look like every template and map had been deleted.
+        """
+        if plugins is None:
+            plugins = GLOBAL_SCRIPTS.gamedata.ndb.plugins
+        consumed = [key for key, plugin in plugins.items() if plugin is self.ndb.plugins.get(key, None)
+                    and not any(section in plugin.data for section in ('templates', 'maps', 'regions'))]
+        if consumed:
+            raise ValueError(f"The data of plugin(s) {', '.join(consumed)} was already loaded. Re-read it "
+                             f"from disk before reloading.")
+        if settings.ENTITY_VALIDATE_DATA:
+            self.validate_data(plugins, templates={template: data for template, data
+                                                   in self.ndb.template_sources.items()
+                                                   if template[0] not in plugins
+                                                   or 'templates' not in plugins[template[0]].data},
+                               known_maps={key: set(self.ndb.plugins[key].maps) for key, plugin in plugins.items()
+                                           if 'maps' not in plugin.data and key in self.ndb.plugins})
+        return DataReloader(self).reload(plugins)
+
+    def validate_data(self, plugins, templates=None, known_maps=None):
+        """
+        Checks raw plugin data before anything is built from it. See validation.py.
+
+        Args:
+            plugins (dict): Plugin key -> plugin, with its raw data.
+            templates (dict, optional): Raw templates of loaded plugins not being checked.
+            known_maps (dict, optional): Plugin key -> keys of maps which exist without being in
+                its data.
+
+        Raises:
+            ValueError: If anything is wrong. Every problem is logged first.
+        """
+        known_maps = dict(known_maps or dict())
+        for plugin_key, plugin in plugins.items():
+            if not plugin.data.get('maps', None) and (path := self.bundle_path(plugin_key)) and os.path.exists(path):
+                with MapBundle(path) as bundle:
+                    known_maps[plugin_key] = set(bundle.maps)
+        problems = validate_plugins({key: plugin.data for key, plugin in plugins.items()},
+                                    workers=settings.ENTITY_COMPILE_WORKERS, templates=templates,
+                                    known_maps=known_maps)
+        if problems:
+            for problem in problems:
+                logger.log_err(f"Plugin data: {problem}")
+            raise ValueError(f"Found {len(problems)} problem(s) in plugin data. See the log, or run "
+                             f"python -m athanor_entity.lint on the plugins.")
+
+    def get_entity(self, entity_id):
+        """
+        Looks up a non-persistent entity by its dense entity_id.
+
+        Args:
+            entity_id (int): The id to look up.
+
+        Returns:
+            entity (AthanorGameEntity or None)
+        """
+        return self.ndb.registry.get(entity_id)
 
-    def resolve_path(self, path, plugin, kind):
-        split_path = path.split('/')
-        if len(split_path) == 1:
-            plugin_path = plugin
-            kind_path = kind
-            key_path = split_path[0]
-        if len(split_path) == 2:
-            plugin_path = plugin
-            kind_path, key_path = split_path
-        if len(split_path) == 3:
-            plugin_path, kind_path, key_path = split_path
-        return plugin_path, kind_path, key_path
+    def get_component_store(self, key):
+        """
+        Retrieves (creating it if necessary) a ComponentStore for columnar entity state.
+
+        Args:
+            key (str): The store's name, such as 'mobiles'.
+
+        Returns:
+            store (ComponentStore)
+        """
+        if not (found := self.ndb.component_stores.get(key, None)):
+            found = ComponentStore(key)
+            self.ndb.component_stores[key] = found
+        return found
+
+    def spawn(self, template, room=None, plugin=None, kind=None, overrides=None):
+        """
+        Spawns a runtime entity from a template. See SpawnEngine.spawn.
+        """
+        return self.ndb.spawner.spawn(template, room=room, plugin=plugin, kind=kind, overrides=overrides)
+
+    def spawn_many(self, template, count, room=None, plugin=None, kind=None, overrides=None):
+        """
+        Spawns many identical runtime entities from a template, placing them in room as one batch.
+        See SpawnEngine.spawn_many.
+
+        Returns:
+            entities (list)
+        """
+        return self.ndb.spawner.spawn_many(template, count, room=room, plugin=plugin, kind=kind,
+                                           overrides=overrides)
+
+    def despawn_many(self, entities):
+        self.ndb.spawner.despawn_many(entities)
+
+    def reset(self, target, strays=False, immediate=False, callback=None):
+        """
+        Restores rooms to the population listed in their map data, spawning and despawning only
+        the difference. Unless immediate, the work is staggered across reactor iterations.
+
+        Args:
+            target (AthanorRoom, AthanorArea, map owner, str, or a list of them): What to reset.
+                Strings are region keys, or room paths as per resolve_room_path.
+            strays (bool): Also despawn entities spawned from templates the rooms don't list.
+            immediate (bool): Do it all right now.
+            callback (callable, optional): Called once the reset is done.
+
+        Returns:
+            groups (int): How many groups of rooms were queued.
+        """
+        targets = list()
+        for thing in make_iter(target):
+            if isinstance(thing, str):
+                thing = self.resolve_room_path(thing) if '/' in thing else self.ndb.regions[thing]
+            targets.append(thing)
+        return self.ndb.resets.reset(targets, strays=strays, immediate=immediate, callback=callback)
 
     def get_class(self, kind, path):
         if path and not isinstance(path, str):
             return path
         if not path:
-            return class_from_module(settings.DEFAULT_ENTITY_CLASSES[kind])
+            path = settings.DEFAULT_ENTITY_CLASSES[kind]
         if not (found := self.ndb.class_cache[kind].get(path, None)):
             found = class_from_module(path)
             self.ndb.class_cache[kind][path] = found
         return found
 
     def resolve_room_path(self, path):
+        owner, room_key = self.resolve_room_owner(path)
+        if not (room := owner.map.get_room(room_key)):
+            raise ValueError(f"Cannot find that room_key in {owner}!")
+        return room
+
+    def resolve_room_owner(self, path):
+        """
+        Finds whose map a room path points into, without loading that map.
+
+        Returns:
+            owner, room_key (tuple): The region, structure or instance, and the room's key.
+        """
         if '/' not in path:
             raise ValueError(f"Path is malformed. Must be in format of OBJ/ROOM_KEY")
         obj, room_key = path.split('/', 1)
@@ -63,15 +277,97 @@ class AthanorEntityController(*MIXINS, AthanorGlobalScript):
             else:
                 raise ValueError(f"Path is malformed. Must be in format of OBJ/ROOM_KEY")
         else:
-            if not (found := self.ndb.regions.get(obj, None)):
+            if not (found := self.ndb.regions.get(obj, None)) and not (found := self.ndb.instances.get(obj, None)):
                 raise ValueError(f"Cannot find a region for {obj}!")
         if not room_key:
             raise ValueError(f"Path is malformed. Must be in format of OBJ/ROOM_KEY")
-        if not (room := found.map.get_room(room_key)):
-            raise ValueError(f"Cannot find that room_key in {found}!")
-        return room
+        return found, room_key
 
-    def prepare_templates(self):
+    def move_many(self, entities, destination, quiet=False, move_hooks=True, **kwargs):
+        """
+        Moves a whole group of entities (followers, zone resets, evacuations...) to a single destination.
+
+        This is the group equivalent of move_to. Per-entity hooks (at_before_move, at_after_move) are
+        still called for each mover, but the entities are grouped by source room once so that every
+        room involved gets its aggregate hooks called and its announcement sent only once.
+
+        Args:
+            entities (iterable): The entities to move.
+            destination (AthanorRoom or str): Where to move them. Strings are resolved via resolve_room_path.
+            quiet (bool): If True, don't announce the move.
+            move_hooks (bool): If False, skip the move hooks entirely.
+            **kwargs: Passed on to the hooks and announcements.
+
+        Returns:
+            moved (list): The entities which were actually moved.
+        """
+        if isinstance(destination, str):
+            destination = self.resolve_room_path(destination)
+        if not destination:
+            return list()
+
+        movers = list()
+        for entity in entities:
+            if move_hooks:
+                try:
+                    if not entity.at_before_move(destination):
+                        continue
+                except Exception:
+                    logger.log_trace()
+                    continue
+            movers.append(entity)
+
+        sources = defaultdict(list)
+        for entity in movers:
+            sources[entity.location].append(entity)
+
+        for source, group in list(sources.items()):
+            if not source:
+                continue
+            if move_hooks:
+                try:
+                    source.at_objects_leave(group, destination, **kwargs)
+                except Exception:
+                    logger.log_trace()
+                    del sources[source]
+                    continue
+            if not quiet:
+                try:
+                    source.announce_group_move_from(group, destination, **kwargs)
+                except Exception:
+                    logger.log_trace()
+
+        movers = [entity for group in sources.values() for entity in group]
+        LocationHandler.set_many(movers, destination)
+
+        if not quiet and movers:
+            try:
+                destination.announce_group_move_to(movers, list(sources.keys()), **kwargs)
+            except Exception:
+                logger.log_trace()
+
+        if move_hooks:
+            for source, group in sources.items():
+                try:
+                    destination.at_objects_receive(group, source, **kwargs)
+                except Exception:
+                    logger.log_trace()
+            for source, group in sources.items():
+                for entity in group:
+                    try:
+                        entity.at_after_move(source)
+                    except Exception:
+                        logger.log_trace()
+
+        return movers
+
+    def gather_templates(self):
+        """
+        Takes every plugin's raw templates out of its data.
+
+        Returns:
+            templates_raw (dict): (plugin, kind, key) -> raw template data.
+        """
         templates_raw = dict()
 
         for plugin in self.ndb.plugins.values():
@@ -79,31 +375,16 @@ class AthanorEntityController(*MIXINS, AthanorGlobalScript):
                 for template_key, template_data in templates.items():
                     templates_raw[(plugin.key, template_type, template_key)] = template_data
 
-        templates_left = set(templates_raw.keys())
-        loaded_set = set()
-        current_count = 0
-        while len(templates_left) > 0:
-            start_count = current_count
-            for template in templates_left:
-                template_data = templates_raw[template]
-                template_list = make_iter(template_data.get('templates', list()))
-                resolved = [self.resolve_path(template_par, template[0], template[1]) for template_par in template_list]
-                if len(set(resolved) - loaded_set) > 0:
-                    continue
-                final_data = dict()
-                for template_par in resolved:
-                    final_data.update(templates_raw[template_par])
-                final_data.update(templates_raw[template])
-                if "templates" in final_data:
-                    del final_data['templates']
-                final_data['class'] = self.get_class(template[1], final_data.get('class', None))
-                self.ndb.plugins[template[0]].templates[template[1]][template[2]] = final_data
-                loaded_set.add(template)
-                current_count += 1
-            templates_left -= loaded_set
-            if start_count == current_count:
-                raise ValueError(
-                    f"Unresolveable old_templates detected! Error for template {template} ! Potential endless loop broken! old_templates left: {templates_left}")
+        # The raw data is kept so that reload_data() can tell what changed.
+        self.ndb.template_sources = templates_raw
+        return templates_raw
+
+    def prepare_templates(self):
+        templates_raw = self.gather_templates()
+        self.merge_templates(templates_raw, set(templates_raw.keys()))
+
+    def set_template(self, template, data):
+        self.ndb.plugins[template[0]].templates[template[1]][template[2]] = data
 
     def get_template(self, plugin_key, kind, key):
         if not (plugin := self.ndb.plugins.get(plugin_key, None)):
@@ -114,35 +395,101 @@ class AthanorEntityController(*MIXINS, AthanorGlobalScript):
             raise ValueError(f"No Template Key: {plugin_key}/{kind}/{key}")
         return k
 
-    def prepare_data(self, kind, start_data, plugin, no_class=False):
-        data = dict()
-        if (templates := start_data.get('templates', None)):
-            for template in make_iter(templates):
-                data.update(self.get_template(plugin, kind, template))
-            start_data.pop('templates')
-        data.update(start_data)
-        if not no_class:
-            data['class'] = self.get_class(kind, start_data.pop('class', None))
-        return data
+    def bundle_path(self, plugin_key):
+        """
+        Returns:
+            path (str or None): Where a plugin's map bundle lives, if bundles are enabled.
+        """
+        if not (directory := settings.ENTITY_MAP_BUNDLE_DIR):
+            return None
+        return os.path.join(directory, f"{plugin_key}{BUNDLE_EXTENSION}")
+
+    def open_bundle(self, plugin_key, maps):
+        """
+        Opens a plugin's map bundle, (re)building it first if it's missing or older than maps.
+
+        Returns:
+            bundle (MapBundle or None): None if there's no usable bundle.
+        """
+        if not (path := self.bundle_path(plugin_key)):
+            return None
+        try:
+            if maps:
+                ensure_bundle(self, plugin_key, maps, path)
+            if os.path.exists(path):
+                return MapBundle(path)
+        except Exception:
+            logger.log_trace(f"Could not use map bundle {path}. Maps will be prepared from plugin data.")
+        return None
 
     def prepare_maps(self):
+        self.ndb.map_sources = dict()
         for plugin_key, plugin in self.ndb.plugins.items():
-            for key, data in plugin.data.pop("maps", dict()).items():
-                map_data = defaultdict(dict)
-                map_data['map'] = self.prepare_data('maps', data.get('map', dict()), plugin_key, no_class=True)
-                for kind in ('areas', 'rooms', 'gateways'):
-                    for thing_key, thing_data in data.get(kind, dict()).items():
-                        map_data[kind][thing_key] = self.prepare_data(kind, thing_data, plugin_key)
-
-                for room_key, room_exits in data.get('exits', dict()).items():
-                    map_data['rooms'][room_key]['exits'] = dict()
-                    if not room_exits:
-                        continue
-                    for dest_key, exit_data in room_exits.items():
-                        map_data['rooms'][room_key]['exits'][dest_key] = self.prepare_data('exits', exit_data,
-                                                                                           plugin_key)
+            maps = plugin.data.pop("maps", dict())
+            bundle = self.open_bundle(plugin_key, maps)
+            if bundle:
+                with bundle:
+                    for key in bundle.maps:
+                        self.ndb.map_sources[(plugin_key, key)] = bundle.digest(key)
+                        plugin.maps[key] = bundle.load(self, key)
+            else:
+                for key, data in maps.items():
+                    self.ndb.map_sources[(plugin_key, key)] = source_digest(data)
+                    plugin.maps[key] = self.prepare_map(plugin_key, data)
+            for key, map_data in plugin.maps.items():
+                self.ndb.routes.add_map(plugin_key, key, map_data)
+
+    def compile_plugins(self, workers):
+        """
+        Does the work of prepare_templates() and prepare_maps() with each plugin compiled in a
+        worker process. See compiler.py. Maps end up as BundledMaps, as if read from bundles.
+
+        Args:
+            workers (int): How many worker processes to use.
+
+        Raises:
+            ValueError: If any plugin failed to compile. Every failure is logged first.
+        """
+        templates_raw = self.gather_templates()
+        jobs = list()
+        for plugin_key, plugin in self.ndb.plugins.items():
+            own = [template for template in templates_raw if template[0] == plugin_key]
+            needed = {template: templates_raw[template] for template in self.template_closure(templates_raw, own)}
+            jobs.append((plugin_key, needed, plugin.data.pop("maps", dict()), self.bundle_path(plugin_key)))
 
-                plugin.maps[key] = map_data
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(compile_plugin, jobs))
+
+        errors = list()
+        for result in results:
+            if result['error']:
+                logger.log_err(f"Could not compile plugin {result['plugin']}:\n{result['error']}")
+                errors.append(result['plugin'])
+                continue
+            for template, data in result['templates'].items():
+                data['class'] = self.get_class(template[1], data['class'])
+                self.set_template(template, data)
+        if errors:
+            raise ValueError(f"Could not compile plugin data for: {', '.join(errors)}")
+
+        self.ndb.map_sources = dict()
+        for result in results:
+            plugin_key = result['plugin']
+            plugin = self.ndb.plugins[plugin_key]
+            if result['warning']:
+                logger.log_warn(f"Could not use the map bundle of {plugin_key}:\n{result['warning']}")
+            if result['sections'] is None:
+                with MapBundle(self.bundle_path(plugin_key)) as bundle:
+                    for key in bundle.maps:
+                        self.ndb.map_sources[(plugin_key, key)] = bundle.digest(key)
+                        plugin.maps[key] = bundle.load(self, key)
+            else:
+                templates, sections = result['sections']
+                for key, (section, digest) in sections.items():
+                    self.ndb.map_sources[(plugin_key, key)] = digest
+                    plugin.maps[key] = BundledMap(self, plugin_key, key, templates, marshal.loads(section))
+            for key, map_data in plugin.maps.items():
+                self.ndb.routes.add_map(plugin_key, key, map_data)
 
     def load_regions(self):
         for plugin_key, plugin in self.ndb.plugins.items():
@@ -153,3 +500,132 @@ class AthanorEntityController(*MIXINS, AthanorGlobalScript):
                 else:
                     found.update_data(data)
                 self.ndb.regions[key] = found
+
+    def route_key(self, owner):
+        """
+        Returns:
+            key (str): How the routing table refers to a map owner: its region key for regions,
+                #DBREF otherwise. Either works as the first half of a room path.
+        """
+        if isinstance(owner, AthanorRegion):
+            return owner.region_bridge.system_key
+        if (instance_key := getattr(owner, 'instance_key', None)):
+            return instance_key
+        return f"#{owner.id}"
+
+    def route_node(self, room):
+        return self.route_key(room.handler.owner), room.unique_key
+
+    def structure_outside(self, structure):
+        """
+        Finds the room a structure sits in without loading any maps, preferring its live location
+        and falling back to its last saved one.
+        """
+        if (room := structure.locations.room):
+            return self.route_node(room)
+        if (loc := structure.saved_locations.filter(name="logout").first()):
+            return self.route_key(loc.map), loc.room_key
+        return None
+
+    def get_map_blueprint(self, plugin_key, map_key):
+        """
+        Retrieves (compiling it if necessary) the shared blueprint of a map, for instancing.
+
+        Returns:
+            blueprint (MapBlueprint)
+        """
+        if not (found := self.ndb.map_blueprints.get((plugin_key, map_key), None)):
+            if not (plugin := self.ndb.plugins.get(plugin_key, None)):
+                raise ValueError(f"No such Plugin: {plugin_key}")
+            if not (map_data := plugin.maps.get(map_key, None)):
+                raise ValueError(f"No such map: {plugin_key}/{map_key}")
+            found = MapBlueprint(plugin_key, map_key, map_data)
+            self.ndb.map_blueprints[(plugin_key, map_key)] = found
+        return found
+
+    def create_instance(self, plugin_key, map_key, name=None, populate=True, data=None):
+        """
+        Creates a runtime copy of a map. It costs almost nothing until its rooms are used.
+
+        Args:
+            plugin_key (str): Plugin of the map to copy.
+            map_key (str): Key of the map to copy.
+            name (str, optional): Display name of the instance.
+            populate (bool): Whether rooms spawn their items and mobiles as they're built.
+            data (dict, optional): Extra data for the instance class.
+
+        Returns:
+            instance (AthanorInstance): Its rooms can be found with instance.map.get_room(), or
+                by room path using instance.instance_key.
+        """
+        blueprint = self.get_map_blueprint(plugin_key, map_key)
+        data = dict(data or dict())
+        data.setdefault('name', name or blueprint.data['map'].get('name', map_key))
+        data['populate'] = populate
+        self.ndb.instance_counter += 1
+        instance_key = f"instance_{self.ndb.instance_counter}"
+        instance_class = self.get_class('instances', data.pop('class', None))
+        instance = instance_class(instance_key, blueprint, data)
+        self.ndb.instances[instance_key] = instance
+        return instance
+
+    def destroy_instance(self, instance, destination=None):
+        """
+        Tears an instance down. Persistent and puppeted entities inside are moved out first; all
+        other entities in it are despawned.
+
+        Args:
+            instance (AthanorInstance or str): The instance or its instance_key.
+            destination (AthanorRoom or str, optional): Where to move whoever is inside. Defaults to
+                settings.ENTITY_DEFAULT_HOME.
+        """
+        if isinstance(instance, str):
+            instance = self.ndb.instances.get(instance, None)
+        if not instance or self.ndb.instances.pop(instance.instance_key, None) is None:
+            return
+        movers, leftovers = list(), list()
+        for entity in list(instance.entities):
+            if hasattr(entity, 'unique_key'):
+                continue
+            (leftovers if self.ndb.resets.can_despawn(entity) else movers).append(entity)
+        if movers:
+            self.move_many(movers, destination or settings.ENTITY_DEFAULT_HOME, quiet=True)
+        if leftovers:
+            self.despawn_many(leftovers)
+        instance.map.unload()
+
+    def load_routes(self):
+        routes = self.ndb.routes
+        for bridge in MapBridge.objects.select_related('object'):
+            owner = bridge.object
+            outside = None if isinstance(owner, AthanorRegion) else self.structure_outside(owner)
+            routes.add_owner(self.route_key(owner), bridge.plugin, bridge.map_key, outside=outside)
+        routes.rebuild()
+
+    def update_structure(self, structure):
+        """
+        Called when a structure with an interior map moves, to reconnect its doors.
+        """
+        self.ndb.routes.set_outside(self.route_key(structure), self.structure_outside(structure))
+
+    def find_route(self, start, goal):
+        """
+        Plans a route across maps through gateways, without loading any maps along the way.
+
+        Args:
+            start (AthanorRoom): Where to start.
+            goal (AthanorRoom, map owner or str): A room, a region/structure (meaning anywhere in it),
+                or a room path string as per resolve_room_path.
+
+        Returns:
+            route (tuple or None): (cost, waypoints) as per GatewayRouter.route.
+        """
+        if isinstance(goal, str):
+            owner_key, _, room_key = goal.partition('/')
+            goal = (owner_key, room_key or None)
+        elif hasattr(goal, 'unique_key'):
+            goal = self.route_node(goal)
+        else:
+            goal = (self.route_key(goal), None)
+        return self.ndb.routes.route(self.route_node(start), goal)
+
@@ -0,0 +1,148 @@
+"""
+Lightweight instrumentation for hot entity operations.
+
+Methods decorated with @instrumented record a call count, total/max time and a latency histogram
+per operation, broken down per map and per room. While profiling is disabled the decorator costs
+one attribute check per call.
+
+The shared PROFILER is switched on and queried through the entity controller or the
+@entprofile admin command.
+"""
+import time
+from collections import defaultdict
+from functools import wraps
+
+# Histogram bucket N holds calls which took less than 2**N microseconds.
+BUCKETS = 21
+
+
+class OperationStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * BUCKETS
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram[min(BUCKETS - 1, int(elapsed * 1000000).bit_length())] += 1
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """
+        Estimates a latency percentile from the histogram.
+
+        Args:
+            fraction (float): Between 0 and 1, such as 0.99.
+
+        Returns:
+            seconds (float): The upper bound of the bucket the percentile falls in.
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * fraction
+        seen = 0
+        for bucket, hits in enumerate(self.histogram):
+            seen += hits
+            if seen >= target:
+                return (2 ** bucket) / 1000000
+        return self.max
+
+    def export(self):
+        return {'count': self.count, 'total': self.total, 'average': self.average, 'max': self.max,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99), 'histogram': list(self.histogram)}
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.operations = defaultdict(OperationStats)
+        self.maps = defaultdict(OperationStats)
+        self.rooms = defaultdict(OperationStats)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, operation, elapsed, where=None):
+        """
+        Args:
+            operation (str): The operation's name.
+            elapsed (float): Seconds taken.
+            where (AthanorRoom or map owner, optional): What to attribute the call to.
+                Rooms count toward both their own and their map's breakdown.
+        """
+        self.operations[operation].record(elapsed)
+        if where is None:
+            return
+        if hasattr(where, 'unique_key') and hasattr(where, 'handler'):
+            map_key = str(where.handler.owner)
+            self.rooms[(operation, f"{map_key}/{where.unique_key}")].record(elapsed)
+        else:
+            map_key = str(where)
+        self.maps[(operation, map_key)].record(elapsed)
+
+    def slowest(self, breakdown='rooms', operation=None, count=10):
+        """
+        Finds the worst offenders for a breakdown.
+
+        Args:
+            breakdown (str): 'rooms' or 'maps'.
+            operation (str, optional): Only consider this operation.
+            count (int): How many results to return.
+
+        Returns:
+            results (list): Tuples of (operation, map or room path, OperationStats),
+                sorted by total time spent.
+        """
+        data = self.rooms if breakdown == 'rooms' else self.maps
+        results = [(op, key, stats) for (op, key), stats in data.items() if not operation or op == operation]
+        results.sort(key=lambda x: x[2].total, reverse=True)
+        return results[:count]
+
+    def export(self):
+        return {
+            'operations': {op: stats.export() for op, stats in self.operations.items()},
+            'maps': {f"{op}:{key}": stats.export() for (op, key), stats in self.maps.items()},
+            'rooms': {f"{op}:{key}": stats.export() for (op, key), stats in self.rooms.items()},
+        }
+
+
+PROFILER = Profiler()
+
+
+def instrumented(operation, locate=None):
+    """
+    Decorator for methods which should be profiled.
+
+    Args:
+        operation (str): Name to record calls under.
+        locate (callable, optional): Called with the method's `self` to find the room (or map
+            owner) the call should be attributed to, for the per-map/per-room breakdown.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not PROFILER.enabled:
+                return func(self, *args, **kwargs)
+            where = locate(self) if locate else None
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                PROFILER.record(operation, time.perf_counter() - start, where)
+        return wrapper
+    return decorator
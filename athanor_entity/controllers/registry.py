@@ -0,0 +1,97 @@
+import heapq
+import weakref
+
+
+class EntityRegistry(object):
+    """
+    Hands out dense, reusable integer ids to non-persistent entities and keeps a weak
+    id -> entity table for O(1) lookups. The lowest free id is always reused first so
+    the table stays compact enough to index arrays with.
+
+    Because ids get reused, anything that holds onto an entity for a while (caches,
+    queued messages...) should keep a ref() instead of the bare id. A ref packs the id
+    together with a generation counter, so resolving a ref to a since-recycled id
+    safely returns None instead of the wrong entity.
+    """
+    id_bits = 32
+    id_mask = (1 << id_bits) - 1
+
+    def __init__(self):
+        self.entities = list()
+        self.generations = list()
+        self.finalizers = list()
+        self.free = list()
+
+    def __len__(self):
+        return len(self.entities) - len(self.free)
+
+    def register(self, entity):
+        """
+        Args:
+            entity (AthanorGameEntity): The entity to assign an id to.
+
+        Returns:
+            entity_id (int)
+        """
+        if self.free:
+            entity_id = heapq.heappop(self.free)
+            self.generations[entity_id] += 1
+        else:
+            entity_id = len(self.entities)
+            self.entities.append(None)
+            self.generations.append(0)
+            self.finalizers.append(None)
+        self.entities[entity_id] = weakref.ref(entity)
+        self.finalizers[entity_id] = weakref.finalize(entity, self.release, entity_id)
+        return entity_id
+
+    def release(self, entity_id):
+        if self.entities[entity_id] is None:
+            return
+        self.entities[entity_id] = None
+        self.finalizers[entity_id].detach()
+        self.finalizers[entity_id] = None
+        heapq.heappush(self.free, entity_id)
+
+    def get(self, entity_id):
+        """
+        Args:
+            entity_id (int): The id to look up.
+
+        Returns:
+            entity (AthanorGameEntity or None)
+        """
+        if entity_id < 0 or entity_id >= len(self.entities):
+            return None
+        if (found := self.entities[entity_id]) is None:
+            return None
+        return found()
+
+    def ref(self, entity):
+        """
+        Builds a compact integer reference to an entity that stays safe after its id is recycled.
+
+        Args:
+            entity (AthanorGameEntity): A registered entity.
+
+        Returns:
+            ref (int)
+        """
+        entity_id = entity.entity_id
+        return (self.generations[entity_id] << self.id_bits) | entity_id
+
+    def resolve(self, ref):
+        """
+        Args:
+            ref (int): A reference made by ref().
+
+        Returns:
+            entity (AthanorGameEntity or None): None if the entity is gone.
+        """
+        entity_id = ref & self.id_mask
+        if entity_id >= len(self.generations) or self.generations[entity_id] != ref >> self.id_bits:
+            return None
+        return self.get(entity_id)
+
+    def all(self):
+        return [found for ref in self.entities if ref is not None and (found := ref()) is not None]
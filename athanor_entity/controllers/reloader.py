@@ -0,0 +1,164 @@
+"""
+Hot reloading of plugin data, so that builders can iterate on content without a restart.
+
+The controller keeps the raw template data every plugin was loaded from, and a digest of every
+raw map. Reloading compares new raw data against those, and only redoes what changed:
+
+* Templates whose data changed, appeared or vanished are re-merged, along with every template
+  inheriting from them.
+* Maps whose data changed, or which use any of those templates, are prepared again, and every
+  loaded MapHandler using them is patched in place by MapHandler.patch(), so rooms keep their
+  entities (and players) while descriptions, exits, locks and areas change around them.
+* Maps which are gone from a plugin's data are dropped, and loaded MapHandlers using them are
+  unloaded, sending whatever was in them to settings.ENTITY_DEFAULT_HOME.
+* Spawn blueprints and room populations built from changed templates are thrown away, to be
+  recompiled on next use. Entities already spawned are left as they are.
+
+A plugin whose data has no 'templates' (or 'maps') key keeps the templates (or maps) it has; only
+what's given is compared.
+
+Instanced maps keep the blueprint they were created from.
+"""
+from collections import defaultdict
+
+from evennia.utils import logger
+from evennia.utils.utils import make_iter
+
+from athanor_entity.models import MapBridge
+from athanor_entity.controllers.bundles import source_digest
+
+
+class DataReloader(object):
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def template_parents(self, template, data):
+        return {self.controller.resolve_path(parent, template[0], template[1])
+                for parent in make_iter(data.get('templates', list()))}
+
+    def affected_templates(self, old_sources, new_sources):
+        """
+        Returns:
+            affected (set): Every template which changed, appeared or vanished, plus every
+                template inheriting from one of those.
+        """
+        affected = {key for key in set(old_sources) | set(new_sources)
+                    if old_sources.get(key, None) != new_sources.get(key, None)}
+        children = defaultdict(set)
+        for template, data in new_sources.items():
+            for parent in self.template_parents(template, data):
+                children[parent].add(template)
+        pending = list(affected)
+        while pending:
+            for child in children.get(pending.pop(), ()):
+                if child not in affected:
+                    affected.add(child)
+                    pending.append(child)
+        return affected
+
+    @staticmethod
+    def map_templates(plugin_key, data):
+        """
+        Returns:
+            templates (set): The (plugin, kind, key) of every template a raw map uses directly.
+        """
+        used = {(plugin_key, 'maps', key) for key in make_iter(data.get('map', dict()).get('templates', list()))}
+        for kind in ('areas', 'rooms', 'gateways'):
+            for thing_data in data.get(kind, dict()).values():
+                used.update((plugin_key, kind, key) for key in make_iter(thing_data.get('templates', list())))
+        for room_exits in data.get('exits', dict()).values():
+            for exit_data in (room_exits or dict()).values():
+                used.update((plugin_key, 'exits', key) for key in make_iter(exit_data.get('templates', list())))
+        return used
+
+    def reload(self, plugins):
+        """
+        Applies new plugin data.
+
+        Args:
+            plugins (dict): Plugin key -> freshly loaded plugin. Plugins left out are untouched.
+
+        Returns:
+            report (dict): 'templates' and 'maps' (lists of what was redone), 'removed' (maps
+                dropped), and 'rooms' (totals of MapHandler.patch changes, plus rooms unloaded).
+        """
+        controller = self.controller
+        ndb = controller.ndb
+
+        old_sources = ndb.template_sources
+        new_sources = {key: data for key, data in old_sources.items()
+                       if key[0] not in plugins or "templates" not in plugins[key[0]].data}
+        new_maps, removed_maps = dict(), list()
+        for plugin_key, plugin in plugins.items():
+            for template_type, templates in plugin.data.pop("templates", dict()).items():
+                for template_key, template_data in templates.items():
+                    new_sources[(plugin_key, template_type, template_key)] = template_data
+            if "maps" not in plugin.data:
+                continue
+            maps = plugin.data.pop("maps")
+            for map_key, map_data in maps.items():
+                new_maps[(plugin_key, map_key)] = map_data
+            if (current := ndb.plugins.get(plugin_key, None)) is not None:
+                removed_maps.extend((plugin_key, map_key) for map_key in current.maps if map_key not in maps)
+        for plugin_key, plugin in plugins.items():
+            if (current := ndb.plugins.get(plugin_key, None)) is not None:
+                # Keep the plugin objects everything already refers to, with the new leftover data.
+                current.data = plugin.data
+            else:
+                ndb.plugins[plugin_key] = plugin
+
+        affected = self.affected_templates(old_sources, new_sources)
+        for plugin_key, kind, key in affected - set(new_sources):
+            ndb.plugins[plugin_key].templates[kind].pop(key, None)
+        controller.merge_templates(new_sources, affected & set(new_sources), set(new_sources) - affected)
+        ndb.template_sources = new_sources
+        for path in affected:
+            ndb.spawner.blueprints.pop(path, None)
+
+        changed_maps = list()
+        for (plugin_key, map_key), data in new_maps.items():
+            digest = source_digest(data)
+            if ndb.map_sources.get((plugin_key, map_key), None) == digest \
+                    and not (self.map_templates(plugin_key, data) & affected):
+                continue
+            ndb.map_sources[(plugin_key, map_key)] = digest
+            ndb.plugins[plugin_key].maps[map_key] = controller.prepare_map(plugin_key, data)
+            ndb.routes.add_map(plugin_key, map_key, ndb.plugins[plugin_key].maps[map_key])
+            ndb.map_blueprints.pop((plugin_key, map_key), None)
+            changed_maps.append((plugin_key, map_key))
+        for plugin_key, map_key in removed_maps:
+            ndb.plugins[plugin_key].maps.pop(map_key, None)
+            ndb.map_sources.pop((plugin_key, map_key), None)
+            ndb.routes.remove_map(plugin_key, map_key)
+            ndb.map_blueprints.pop((plugin_key, map_key), None)
+
+        # Regions may have been added or switched maps, which load_regions() takes care of. It's done
+        # first so that a region moved off a removed map is patched onto its new one, not unloaded.
+        controller.load_regions()
+
+        rooms = defaultdict(int)
+        populations = any(kind in ('items', 'mobiles') for _, kind, _ in affected)
+        for bridge in MapBridge.objects.select_related('object'):
+            if (handler := bridge.object.__dict__.get('map', None)) is None or not handler.loaded:
+                continue
+            if (bridge.plugin, bridge.map_key) in removed_maps:
+                try:
+                    rooms['removed'] += len(handler.rooms)
+                    handler.unload()
+                except Exception:
+                    logger.log_trace(f"Could not unload the map of {bridge.object}")
+            elif (bridge.plugin, bridge.map_key) in changed_maps:
+                try:
+                    for change, count in handler.patch(ndb.plugins[bridge.plugin].maps[bridge.map_key]).items():
+                        rooms[change] += count
+                except Exception:
+                    logger.log_trace(f"Could not patch the map of {bridge.object}")
+            elif populations:
+                for room in handler.rooms.values():
+                    room.population = None
+
+        controller.load_routes()
+        return {'templates': sorted('/'.join(key) for key in affected),
+                'maps': [f"{plugin_key}/{map_key}" for plugin_key, map_key in changed_maps],
+                'removed': [f"{plugin_key}/{map_key}" for plugin_key, map_key in removed_maps], 'rooms': dict(rooms)}
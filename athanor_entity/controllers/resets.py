@@ -0,0 +1,246 @@
+"""
+Zone resets: bringing rooms back to the population listed in their map data (item_data and
+mobile_data), by spawning or despawning only the difference.
+
+Rooms keep a reverse index of the entities in them by the template they were spawned from, so
+working out what a room is missing costs one lookup per template it lists, however crowded it is.
+Rooms which belong to an area are reconciled area-wide: a goblin which wandered two rooms over
+still counts towards its area's goblins, instead of being duplicated by every reset.
+
+Resets are queued and worked through across reactor iterations, never spending more than the
+budget in one go, so resetting a whole region doesn't stall the server.
+"""
+import time
+from collections import deque, defaultdict
+
+from twisted.internet import reactor
+
+from evennia.utils import logger
+from evennia.utils.utils import make_iter
+
+
+class ResetEngine(object):
+    """
+    Owned by the entity controller. Reset targets are split into groups (an area's rooms, or a
+    single room with no area), each group is planned in one step, and the resulting spawns and
+    despawns are carried out a room at a time.
+    """
+
+    def __init__(self, spawner, budget=0.01):
+        self.spawner = spawner
+        self.budget = budget
+        self.groups = deque()
+        self.actions = deque()
+        self.queued = set()
+        self.callbacks = list()
+        self.draining = False
+
+    def population(self, room):
+        """
+        Compiles what a room should contain, once per room until invalidate() is called on it.
+
+        Returns:
+            population (dict): Template path -> (Blueprint, count, overrides)
+        """
+        if room.population is not None:
+            return room.population
+        population = dict()
+        for kind, entries in (('items', room.item_data), ('mobiles', room.mobile_data)):
+            for entry in make_iter(entries):
+                if isinstance(entry, str):
+                    template, count, overrides = entry, 1, None
+                else:
+                    template, count = entry['template'], entry.get('count', 1)
+                    overrides = {key: value for key, value in entry.items()
+                                 if key not in ('template', 'count')} or None
+                blueprint = self.spawner.blueprint(template, room.handler.plugin, kind)
+                if (found := population.get(blueprint.path, None)):
+                    population[blueprint.path] = (blueprint, found[1] + count, found[2])
+                else:
+                    population[blueprint.path] = (blueprint, count, overrides)
+        room.population = population
+        return population
+
+    def invalidate(self, room):
+        room.population = None
+
+    @staticmethod
+    def units(entity):
+        """
+        Returns:
+            units (int): How many of its template an entity counts for: a stack's count, else 1.
+        """
+        return entity.stack_count if getattr(entity, 'stackable', False) else 1
+
+    @staticmethod
+    def can_despawn(entity):
+        return not entity.persistent and not entity.has_account
+
+    def plan(self, rooms, strays=False):
+        """
+        Works out the difference between what a group of rooms should contain and what they do.
+
+        Args:
+            rooms (list): The rooms to reconcile together.
+            strays (bool): Also despawn template-spawned entities whose template none of these
+                rooms list.
+
+        Returns:
+            actions (list): (room, spawns, despawns) for every room needing changes, where spawns
+                is a list of (Blueprint, count, overrides) and despawns a list of entities, or of
+                (stack, count) to take count items off a stack.
+        """
+        wanted = defaultdict(dict)
+        for room in rooms:
+            for path, (blueprint, count, overrides) in self.population(room).items():
+                wanted[path][room] = count
+
+        spawns, despawns = defaultdict(list), defaultdict(list)
+        for path, per_room in wanted.items():
+            have = {room: room.template_index.get(path, ()) for room in rooms}
+            held = {room: sum(self.units(ent) for ent in found) for room, found in have.items()}
+            balance = sum(held.values()) - sum(per_room.values())
+            for room in rooms:
+                if not balance:
+                    break
+                difference = held[room] - per_room.get(room, 0)
+                if balance < 0 and difference < 0:
+                    count = min(-difference, -balance)
+                    blueprint, _, overrides = self.population(room)[path]
+                    spawns[room].append((blueprint, count, overrides))
+                    balance += count
+                elif balance > 0 and difference > 0:
+                    excess = min(difference, balance)
+                    for ent in have[room]:
+                        if excess <= 0:
+                            break
+                        if not self.can_despawn(ent):
+                            continue
+                        if (units := self.units(ent)) > excess:
+                            despawns[room].append((ent, excess))
+                            units = excess
+                        else:
+                            despawns[room].append(ent)
+                        excess -= units
+                        balance -= units
+
+        if strays:
+            for room in rooms:
+                for path, found in room.template_index.items():
+                    if path not in wanted:
+                        despawns[room].extend(ent for ent in found if self.can_despawn(ent))
+
+        return [(room, spawns.get(room, list()), despawns.get(room, list()))
+                for room in rooms if room in spawns or room in despawns]
+
+    def groups_for(self, target):
+        """
+        Splits a reset target into groups of rooms to be reconciled together.
+
+        Args:
+            target (AthanorRoom, AthanorArea, map owner, or a list of them)
+
+        Returns:
+            groups (list): Lists of rooms.
+        """
+        rooms = list()
+        for thing in make_iter(target):
+            if hasattr(thing, 'room_exits'):
+                rooms.append(thing)
+            elif hasattr(thing, 'rooms'):
+                rooms.extend(thing.rooms)
+            else:
+                if not thing.map.loaded:
+                    thing.map.load()
+                rooms.extend(thing.map.rooms.values())
+        areas = defaultdict(list)
+        groups = list()
+        for room in rooms:
+            if room.area:
+                areas[room.area].append(room)
+            else:
+                groups.append([room])
+        # An area is always reconciled as a whole, even if only some of its rooms were asked for.
+        groups.extend(list(area.rooms) for area in areas)
+        return groups
+
+    def reset(self, target, strays=False, immediate=False, callback=None):
+        """
+        Queues a reset.
+
+        Args:
+            target (AthanorRoom, AthanorArea, map owner, or a list of them): What to reset.
+            strays (bool): Also despawn entities spawned from templates the rooms don't list.
+            immediate (bool): Do the whole reset right now instead of staggering it.
+            callback (callable, optional): Called with no arguments once the queue is empty.
+
+        Returns:
+            groups (int): How many groups were queued. Groups already queued are skipped.
+        """
+        queued = 0
+        for group in self.groups_for(target):
+            key = frozenset(group)
+            if key in self.queued:
+                continue
+            self.queued.add(key)
+            self.groups.append((key, group, strays))
+            queued += 1
+        if callback:
+            self.callbacks.append(callback)
+        if immediate:
+            self.drain(unlimited=True)
+        elif not self.draining:
+            self.draining = True
+            reactor.callLater(0, self.drain)
+        return queued
+
+    def apply(self, room, spawns, despawns):
+        whole = list()
+        for entry in despawns:
+            if isinstance(entry, tuple):
+                stack, count = entry
+                stack.stack_count -= count
+            else:
+                whole.append(entry)
+        if whole:
+            self.spawner.despawn_many(whole)
+        for blueprint, count, overrides in spawns:
+            # Stackables top up the stack already here, rather than piling up stacks beside it.
+            if blueprint.stackable and (stack := next((ent for ent in room.template_index.get(blueprint.path, ())
+                                                       if getattr(ent, 'stackable', False)), None)):
+                stack.stack_count += count
+                continue
+            self.spawner.spawn_many(blueprint, count, room, overrides=overrides)
+
+    def drain(self, unlimited=False):
+        """
+        Works through queued resets until done or out of time, then reschedules itself.
+
+        Args:
+            unlimited (bool): Ignore the budget and finish everything now.
+        """
+        self.draining = False
+        start = time.perf_counter()
+        while self.actions or self.groups:
+            try:
+                if self.actions:
+                    self.apply(*self.actions.popleft())
+                else:
+                    key, group, strays = self.groups.popleft()
+                    self.queued.discard(key)
+                    self.actions.extend(self.plan(group, strays=strays))
+            except Exception:
+                logger.log_trace()
+            if not unlimited and time.perf_counter() - start > self.budget:
+                break
+        if self.actions or self.groups:
+            if not self.draining:
+                self.draining = True
+                reactor.callLater(0, self.drain)
+            return
+        callbacks, self.callbacks = self.callbacks, list()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.log_trace()
@@ -0,0 +1,316 @@
+"""
+Cross-map routing through gateways.
+
+Every map owner (region or structure) is a copy of a map template from plugin data. Routing works
+on those templates directly, so planning a route never instantiates the maps along the way:
+
+* MapRoutes holds one template's room adjacency (from its exit data) and which rooms have exits
+  through which gateways, and caches room-to-room distances within the template.
+* GatewayRouter knows which template each owner uses and where its gateways lead. Its graph has
+  one node per (owner key, room key) where a gateway can be entered or left, with edges for
+  walking between those rooms inside an owner and for hopping through gateways. Structures are
+  linked to whatever room they currently sit in, so the graph is patched whenever one moves:
+  only its doors' hops and the walks inside the owners at either end are redone.
+
+Owner keys are region keys for regions and #DBREF for anything else, so that a node's pieces form
+a room path understood by AthanorEntityController.resolve_room_path.
+"""
+import heapq
+from collections import Counter, defaultdict, deque
+
+from athanor_entity.mapdata import iter_room_exits
+
+
+def parse_room_path(path):
+    """
+    Splits an OWNER/ROOM_KEY path into an (owner key, room key) node.
+    """
+    owner, _, room_key = path.partition('/')
+    if not owner or not room_key:
+        raise ValueError(f"Path is malformed. Must be in format of OBJ/ROOM_KEY")
+    return owner, room_key
+
+
+class MapRoutes(object):
+    # Distance tables are kept for this many start rooms per template.
+    cache_size = 512
+
+    def __init__(self, map_data):
+        """
+        Args:
+            map_data (dict or BundledMap): A prepared map, as stored in plugin.maps by prepare_maps.
+        """
+        rooms = map_data.get('rooms', dict())
+        self.gateways = dict(map_data.get('gateways', dict()))
+        self.adjacency = dict()
+        self.portals = defaultdict(list)
+        for room_key, room_exits in iter_room_exits(map_data, 'gateway'):
+            links = list()
+            for dest_key, (gateway,) in room_exits:
+                if gateway in self.gateways:
+                    self.portals[room_key].append(gateway)
+                elif dest_key in rooms:
+                    links.append(dest_key)
+            self.adjacency[room_key] = links
+        self._distances = dict()
+
+    def distances(self, room_key):
+        """
+        Returns:
+            distances (dict): Room key -> number of exits from room_key, for every reachable room.
+        """
+        if (found := self._distances.get(room_key, None)) is not None:
+            return found
+        found = {room_key: 0}
+        queue = deque((room_key,))
+        while queue:
+            node = queue.popleft()
+            step = found[node] + 1
+            for target in self.adjacency.get(node, ()):
+                if target not in found:
+                    found[target] = step
+                    queue.append(target)
+        if len(self._distances) >= self.cache_size:
+            self._distances.clear()
+        self._distances[room_key] = found
+        return found
+
+    def distance(self, start, goal):
+        return self.distances(start).get(goal, None)
+
+
+class GatewayRouter(object):
+
+    def __init__(self):
+        self.maps = dict()
+        self.owners = dict()
+        self.outside = dict()
+        self.hops = defaultdict(list)
+        # Owner key -> Counter of room keys, counting the hops leaving or entering each room.
+        self.departures = defaultdict(Counter)
+        self.arrivals = defaultdict(Counter)
+        self.links = dict()
+
+    def add_map(self, plugin_key, map_key, map_data):
+        self.maps[(plugin_key, map_key)] = MapRoutes(map_data)
+
+    def remove_map(self, plugin_key, map_key):
+        self.maps.pop((plugin_key, map_key), None)
+
+    def add_owner(self, owner_key, plugin_key, map_key, outside=None):
+        """
+        Args:
+            owner_key (str): The owner's routing key.
+            plugin_key (str): Plugin of the map template the owner uses.
+            map_key (str): Key of the map template.
+            outside (tuple, optional): For structures, the (owner key, room key) they sit in.
+        """
+        self.owners[owner_key] = (plugin_key, map_key)
+        if outside:
+            self.outside[owner_key] = outside
+
+    def remove_owner(self, owner_key):
+        self.owners.pop(owner_key, None)
+        self.outside.pop(owner_key, None)
+
+    def set_outside(self, owner_key, outside):
+        """
+        Records that a structure has moved, and patches the graph around it.
+
+        Args:
+            owner_key (str): The structure's routing key.
+            outside (tuple or None): The (owner key, room key) it now sits in.
+        """
+        if (old := self.outside.get(owner_key, None)) == outside:
+            return
+        for source, target, gateway_key in (old_hops := self.outside_hops(owner_key, old)):
+            self.remove_hop(source, target, gateway_key)
+        if outside:
+            self.outside[owner_key] = outside
+        else:
+            self.outside.pop(owner_key, None)
+        for source, target, gateway_key in self.outside_hops(owner_key, outside):
+            self.add_hop(source, target, gateway_key)
+
+        # Only the walks inside the owners at either end of the moved doors can have changed.
+        stale = defaultdict(set)
+        for source, target, _ in old_hops:
+            stale[source[0]].add(source[1])
+            stale[target[0]].add(target[1])
+        for other_key in {owner_key} | {node[0] for node in (old, outside) if node}:
+            self.relink(other_key, stale.get(other_key, ()))
+
+    def outside_hops(self, owner_key, outside):
+        """
+        Returns:
+            hops (list): (source, target, gateway key) for both ways through every door of a
+                structure's map which leads outside, were it sitting in outside.
+        """
+        if not outside or not (routes := self.routes_for(owner_key)):
+            return list()
+        hops = list()
+        for room_key, gateway_keys in routes.portals.items():
+            for gateway_key in gateway_keys:
+                if routes.gateways[gateway_key].get('outside', False):
+                    hops.append(((owner_key, room_key), outside, gateway_key))
+                    hops.append((outside, (owner_key, room_key), gateway_key))
+        return hops
+
+    def add_hop(self, source, target, gateway_key):
+        self.hops[source].append((target, gateway_key))
+        self.departures[source[0]][source[1]] += 1
+        self.arrivals[target[0]][target[1]] += 1
+
+    def remove_hop(self, source, target, gateway_key):
+        if (found := self.hops.get(source, None)) is None or (target, gateway_key) not in found:
+            return
+        found.remove((target, gateway_key))
+        if not found:
+            del self.hops[source]
+        for counts, (owner_key, room_key) in ((self.departures, source), (self.arrivals, target)):
+            counts[owner_key][room_key] -= 1
+            if counts[owner_key][room_key] <= 0:
+                del counts[owner_key][room_key]
+                if not counts[owner_key]:
+                    del counts[owner_key]
+
+    def relink(self, owner_key, stale=()):
+        """
+        Recomputes the walks between gateway rooms inside one owner.
+
+        Args:
+            owner_key (str): The owner whose departures or arrivals changed.
+            stale (iterable): Room keys which may no longer be gateway rooms.
+        """
+        for room_key in stale:
+            self.links.pop((owner_key, room_key), None)
+        if not (routes := self.routes_for(owner_key)):
+            return
+        departures = self.departures.get(owner_key, Counter())
+        for room_key in set(departures) | set(self.arrivals.get(owner_key, ())):
+            self.links[(owner_key, room_key)] = self._walks(routes, owner_key, room_key, departures)
+
+    def routes_for(self, owner_key):
+        if not (template := self.owners.get(owner_key, None)):
+            return None
+        return self.maps.get(template, None)
+
+    def rebuild(self):
+        """
+        Recomputes the gateway graph. Distances inside templates are cached, so this mostly costs a
+        pass over every gateway.
+        """
+        self.hops = defaultdict(list)
+        self.departures = defaultdict(Counter)
+        self.arrivals = defaultdict(Counter)
+        hop = self.add_hop
+
+        for owner_key in self.owners:
+            if not (routes := self.routes_for(owner_key)):
+                continue
+            for room_key, gateway_keys in routes.portals.items():
+                for gateway_key in gateway_keys:
+                    data = routes.gateways[gateway_key]
+                    if data.get('outside', False):
+                        if not (outside := self.outside.get(owner_key, None)):
+                            continue
+                        # Structure doors work both ways.
+                        hop((owner_key, room_key), outside, gateway_key)
+                        hop(outside, (owner_key, room_key), gateway_key)
+                    elif (path := data.get('destination', None)):
+                        target = parse_room_path(path)
+                        if target[0] in self.owners:
+                            hop((owner_key, room_key), target, gateway_key)
+
+        self.links = dict()
+        for owner_key in set(self.departures) | set(self.arrivals):
+            self.relink(owner_key)
+
+    def _walks(self, routes, owner_key, room_key, departures):
+        distances = routes.distances(room_key)
+        return [(distances[target], (owner_key, target)) for target in departures
+                if target != room_key and target in distances]
+
+    def neighbors(self, node):
+        """
+        Yields (cost, next node, gateway key or None) for every move out of a node.
+        """
+        if (walks := self.links.get(node, None)) is None:
+            if (routes := self.routes_for(node[0])):
+                walks = self._walks(routes, node[0], node[1], self.departures.get(node[0], Counter()))
+            else:
+                walks = list()
+        for cost, target in walks:
+            yield cost, target, None
+        for target, gateway_key in self.hops.get(node, ()):
+            yield 1, target, gateway_key
+
+    def route(self, start, goal):
+        """
+        Plans the shortest route between rooms on different maps, by number of exits taken.
+
+        Args:
+            start (tuple): (owner key, room key) to start from.
+            goal (tuple): (owner key, room key) to reach. The room key may be None to accept any
+                room of that owner.
+
+        Returns:
+            route (tuple or None): (cost, waypoints) or None if unreachable. Waypoints are
+                (owner key, room key, gateway key) tuples: walk to that room within that owner,
+                then take that gateway. The last waypoint is the goal, with a gateway key of None.
+        """
+        goal_owner, goal_room = goal
+        goal_routes = self.routes_for(goal_owner)
+        cost = {start: 0}
+        parents = {start: None}
+        heap = [(0, start)]
+        best = None
+        while heap:
+            so_far, node = heapq.heappop(heap)
+            if so_far > cost[node]:
+                continue
+            if best and so_far >= best[0]:
+                break
+            if node[0] == goal_owner:
+                remaining = 0 if goal_room is None else (goal_routes.distance(node[1], goal_room)
+                                                         if goal_routes else None)
+                if remaining is not None and (not best or so_far + remaining < best[0]):
+                    best = (so_far + remaining, node)
+            for step, target, gateway_key in self.neighbors(node):
+                total = so_far + step
+                if total < cost.get(target, total + 1):
+                    cost[target] = total
+                    parents[target] = (node, gateway_key)
+                    heapq.heappush(heap, (total, target))
+        if not best:
+            return None
+
+        total, node = best
+        waypoints = [(goal_owner, goal_room if goal_room is not None else node[1], None)]
+        while (parent := parents[node]) is not None:
+            previous, gateway_key = parent
+            if gateway_key:
+                waypoints.append((previous[0], previous[1], gateway_key))
+            node = previous
+        waypoints.reverse()
+        return total, waypoints
+
+    def nearest_gateway(self, start, goal_owner):
+        """
+        Finds which gateway to head for to reach another owner soonest.
+
+        Args:
+            start (tuple): (owner key, room key) to start from.
+            goal_owner (str): The owner key to reach.
+
+        Returns:
+            result (tuple or None): (room key, gateway key, total cost) or None if the owner is
+                unreachable or we're already in it.
+        """
+        if not (found := self.route(start, (goal_owner, None))):
+            return None
+        total, waypoints = found
+        room_key, gateway_key = waypoints[0][1], waypoints[0][2]
+        if not gateway_key:
+            return None
+        return room_key, gateway_key, total
@@ -0,0 +1,181 @@
+import time
+import weakref
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from evennia.utils import logger
+
+
+class TickEntry(object):
+    """
+    A single scheduled entity. It only keeps a weak reference to the entity so that
+    scheduling something never keeps it alive.
+    """
+
+    def __init__(self, entity, interval, callback):
+        self.ref = weakref.ref(entity)
+        self.interval = interval
+        self.callback = callback
+        self.rounds = 0
+        self.cancelled = False
+
+    @property
+    def entity(self):
+        return self.ref()
+
+
+class TimingWheel(object):
+    """
+    A hashed timing wheel. Each slot covers one resolution step; entries due further out
+    than a full revolution wait there for the required number of extra rounds.
+    """
+
+    def __init__(self, slots, resolution):
+        self.resolution = resolution
+        self.slots = [list() for _ in range(slots)]
+        self.cursor = 0
+
+    def insert(self, entry):
+        steps = max(1, int(round(entry.interval / self.resolution)))
+        entry.rounds = (steps - 1) // len(self.slots)
+        self.slots[(self.cursor + steps) % len(self.slots)].append(entry)
+
+    def advance(self):
+        """
+        Moves the wheel forward by one step.
+
+        Returns:
+            due (list of TickEntry): Entries which are due this step.
+        """
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        slot = self.slots[self.cursor]
+        due, waiting = list(), list()
+        for entry in slot:
+            if entry.cancelled:
+                continue
+            if entry.rounds > 0:
+                entry.rounds -= 1
+                waiting.append(entry)
+            else:
+                due.append(entry)
+        self.slots[self.cursor] = waiting
+        return due
+
+
+class TickScheduler(object):
+    """
+    Central update loop for map entities (mobiles, rooms...), owned by the entity controller.
+
+    Entities are scheduled with an interval and have their callback (at_tick by default)
+    called each time it elapses. Work for entities on maps with no puppeted characters is
+    skipped, and due work is drained across reactor iterations so a single step never
+    spends more than `budget` seconds.
+    """
+
+    def __init__(self, resolution=1.0, slots=60, budget=0.01):
+        self.wheel = TimingWheel(slots, resolution)
+        self.budget = budget
+        self.entries = weakref.WeakKeyDictionary()
+        self.pending = deque()
+        self.draining = False
+        self.looper = None
+
+    def start(self):
+        if self.looper and self.looper.running:
+            return
+        self.looper = LoopingCall(self.step)
+        self.looper.start(self.wheel.resolution, now=False)
+
+    def stop(self):
+        if self.looper and self.looper.running:
+            self.looper.stop()
+        self.looper = None
+
+    @property
+    def running(self):
+        return bool(self.looper and self.looper.running)
+
+    def shutdown(self):
+        """
+        Stops ticking and unschedules everything, for when this scheduler is being replaced.
+        """
+        self.stop()
+        for entry in list(self.entries.values()):
+            entry.cancelled = True
+        self.entries.clear()
+        self.pending.clear()
+        self.wheel.slots = [list() for _ in self.wheel.slots]
+
+    def schedule(self, entity, interval=None, callback='at_tick'):
+        """
+        Start ticking an entity. Re-scheduling an entity replaces its previous schedule.
+
+        Args:
+            entity (AthanorGameEntity): The entity to tick.
+            interval (float or None): Seconds between ticks. Defaults to entity.tick_interval.
+            callback (str): Name of the method to call on the entity.
+        """
+        if interval is None:
+            interval = entity.tick_interval
+        if not interval:
+            raise ValueError(f"{entity} has no tick interval!")
+        self.unschedule(entity)
+        entry = TickEntry(entity, interval, callback)
+        self.entries[entity] = entry
+        self.wheel.insert(entry)
+
+    def unschedule(self, entity):
+        if (entry := self.entries.pop(entity, None)):
+            entry.cancelled = True
+
+    def is_active(self, entity, cache):
+        """
+        Decides whether an entity's map has anyone around to witness it.
+
+        Args:
+            entity (AthanorGameEntity): The entity about to be ticked.
+            cache (dict): Map owner -> bool, shared across one step.
+
+        Returns:
+            active (bool)
+        """
+        handler = getattr(entity, 'handler', None)
+        if handler:
+            owner = handler.owner
+        else:
+            owner = entity.locations.map
+        if not owner:
+            return False
+        if (found := cache.get(owner, None)) is None:
+            found = cache[owner] = owner.occupancy.has_puppets()
+        return found
+
+    def step(self):
+        cache = dict()
+        for entry in self.wheel.advance():
+            if (entity := entry.entity) is None:
+                continue
+            self.wheel.insert(entry)
+            if self.is_active(entity, cache):
+                self.pending.append(entry)
+        if not self.draining:
+            self.drain()
+
+    def drain(self):
+        self.draining = False
+        start = time.perf_counter()
+        while self.pending:
+            entry = self.pending.popleft()
+            if entry.cancelled or (entity := entry.entity) is None:
+                continue
+            try:
+                getattr(entity, entry.callback)()
+            except Exception:
+                logger.log_trace()
+            if time.perf_counter() - start > self.budget:
+                break
+        if self.pending and not self.draining:
+            self.draining = True
+            reactor.callLater(0, self.drain)
@@ -0,0 +1,173 @@
+"""
+Snapshots of the live, non-persistent entity graph, so that a reload can bring everything back
+exactly where it was instead of rebuilding and respawning the world from scratch.
+
+Rooms, exits and other map entities are not stored: they are rebuilt from plugin data by their
+MapHandler the moment a snapshotted location asks for them. Instances aren't stored either, and
+nor is anything inside one, since a reload destroys them. What is stored is every other runtime
+entity (class path + the state its __init__ needs), where it stands (map owner + room key), and
+which inventory or gearset holds it.
+
+The file itself is a zlib-compressed pickle of plain tuples, written atomically.
+"""
+import os
+import pickle
+import zlib
+from collections import defaultdict
+
+from evennia.utils import logger
+
+SNAPSHOT_VERSION = 1
+
+
+def encode_snapshot(payload):
+    return zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def decode_snapshot(raw):
+    payload = pickle.loads(zlib.decompress(raw))
+    if payload.get('version', None) != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported entity snapshot version: {payload.get('version', None)}")
+    return payload
+
+
+class EntitySnapshot(object):
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def capture(self):
+        """
+        Walks the entity registry and builds the snapshot payload.
+
+        Returns:
+            payload (dict)
+        """
+        kept = dict()
+
+        def owners(entity):
+            if (room := entity.locations.room):
+                yield room.handler.owner
+            if (inv := entity.inventory_location):
+                yield inv.handler.owner
+
+        def keep(entity):
+            # Runtime entities (id -1) that hold others must be captured too, or their contents
+            # would have nowhere to go. This leaves out everything inside instances.
+            if (found := kept.get(entity, None)) is None:
+                kept[entity] = False
+                found = kept[entity] = entity.snapshot_restore and all(
+                    owner.id != -1 or keep(owner) for owner in owners(entity))
+            return found
+
+        entities = [ent for ent in self.controller.ndb.registry.all() if keep(ent)]
+        indexes = {ent: i for i, ent in enumerate(entities)}
+
+        def owner_ref(owner):
+            if (index := indexes.get(owner, None)) is not None:
+                return ('ent', index)
+            return ('obj', owner.id)
+
+        records = list()
+        for entity in entities:
+            location = None
+            if (room := entity.locations.room):
+                location = (owner_ref(room.handler.owner), room.unique_key)
+            holder = None
+            if (inv := entity.inventory_location):
+                kind = 'gear' if hasattr(inv, 'gearslots') else 'items'
+                holder = (kind, owner_ref(inv.handler.owner), inv.name)
+            ent_class = entity.__class__
+            records.append((f"{ent_class.__module__}.{ent_class.__qualname__}", entity.snapshot_state(),
+                            location, holder))
+
+        return {'version': SNAPSHOT_VERSION, 'entities': records}
+
+    def save(self, path):
+        """
+        Captures the entity graph and writes it to path.
+
+        Returns:
+            size (int): Bytes written.
+        """
+        raw = encode_snapshot(self.capture())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(temp_path, path)
+        return len(raw)
+
+    def restore(self, payload):
+        """
+        Rebuilds the entity graph from a payload made by capture().
+
+        Returns:
+            entities (list): The restored entities.
+        """
+        from evennia.objects.models import ObjectDB
+        from evennia.utils.utils import class_from_module
+        from athanor_entity.entities.handlers import LocationHandler
+
+        records = payload['entities']
+        obj_ids = set()
+        for class_path, state, location, holder in records:
+            if location and location[0][0] == 'obj':
+                obj_ids.add(location[0][1])
+            if holder and holder[1][0] == 'obj':
+                obj_ids.add(holder[1][1])
+        objects = {obj.id: obj for obj in ObjectDB.objects.filter(id__in=obj_ids)}
+
+        classes = dict()
+        created = list()
+        for class_path, state, location, holder in records:
+            try:
+                if not (ent_class := classes.get(class_path, None)):
+                    ent_class = classes[class_path] = class_from_module(class_path)
+                created.append(ent_class(state))
+            except Exception:
+                logger.log_trace(f"Could not restore entity {state.get('name', None)} ({class_path})")
+                created.append(None)
+
+        def resolve(ref):
+            if ref[0] == 'ent':
+                return created[ref[1]]
+            return objects.get(ref[1], None)
+
+        rooms = defaultdict(list)
+        for entity, (class_path, state, location, holder) in zip(created, records):
+            if not entity:
+                continue
+            try:
+                if location and (owner := resolve(location[0])):
+                    if (room := owner.map.get_room(location[1])):
+                        rooms[room].append(entity)
+                if holder and (owner := resolve(holder[1])):
+                    if holder[0] == 'gear':
+                        owner.gear.get_gearset(holder[2]).equip(entity)
+                        owner.gear.contents.add(entity)
+                    else:
+                        owner.items.get_inventory(holder[2]).add(entity)
+            except Exception:
+                logger.log_trace(f"Could not place restored entity {entity}")
+
+        for room, group in rooms.items():
+            LocationHandler.set_many(group, room, save=False)
+
+        return [entity for entity in created if entity]
+
+    def load(self, path):
+        """
+        Restores the snapshot at path, if there is one, and then removes the file so that
+        it can't be applied twice.
+
+        Returns:
+            entities (list): The restored entities.
+        """
+        if not os.path.exists(path):
+            return list()
+        try:
+            with open(path, 'rb') as f:
+                payload = decode_snapshot(f.read())
+        finally:
+            os.remove(path)
+        return self.restore(payload)
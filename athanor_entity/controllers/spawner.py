@@ -0,0 +1,209 @@
+"""
+Fast spawning of items, mobiles and other runtime entities from templates.
+
+Building an entity from scratch means merging its templates (prepare_data), resolving its class
+and normalizing every tag, permission and attribute it starts with. None of that differs between
+two goblins, so the SpawnEngine compiles each template into a Blueprint once: the resolved class,
+a frozen copy of the merged default state, and pre-normalized tag, permission and attribute
+handlers. Spawning an instance copies those instead of rebuilding them.
+
+spawn_many() places a whole batch in a room with a single LocationHandler.set_many(), so the room,
+its area and its map owner update their entity sets and occupancy once rather than per entity.
+Stackable blueprints (such as arrows) spawn a single stack holding however many were asked for.
+"""
+from types import MappingProxyType
+
+from evennia.utils.utils import make_iter
+
+from athanor_entity.controllers.profiler import instrumented
+from athanor_entity.entities.handlers import LocationHandler
+from athanor_entity.entities.memory import MemoryTagHandler, MemoryPermissionHandler, MemoryAttributeHandler
+
+# State which Blueprints keep in pre-normalized handlers instead of in their default state.
+HANDLER_FIELDS = ('tags', 'permissions', 'attributes')
+
+
+class Blueprint(object):
+    """
+    A compiled template. Its state must be treated as read-only, since every instance shares it.
+    """
+
+    def __init__(self, path, data):
+        """
+        Args:
+            path (str): The template's plugin/kind/key.
+            data (dict): The template's merged data, as made by prepare_templates.
+        """
+        self.path = path
+        self.entity_class = data['class']
+        if self.entity_class.persistent:
+            raise ValueError(f"Cannot compile a blueprint for {path}: {self.entity_class} is persistent.")
+        state = {key: value for key, value in data.items() if key != 'class' and key not in HANDLER_FIELDS}
+        state['template'] = path
+        self.state = MappingProxyType(state)
+        self.stackable = bool(state.get('stackable', getattr(self.entity_class, 'stackable', False)))
+        self.tags = MemoryTagHandler(None)
+        self.permissions = MemoryPermissionHandler(None)
+        self.attributes = MemoryAttributeHandler(None)
+        self.apply(self, data)
+        self.spawned = 0
+
+    @staticmethod
+    def apply(target, data):
+        if (tags := data.get('tags', None)):
+            target.tags.batch_add(*tags)
+        if (permissions := data.get('permissions', None)):
+            target.permissions.batch_add(*permissions)
+        if (attributes := data.get('attributes', None)):
+            if isinstance(attributes, dict):
+                attributes = attributes.items()
+            target.attributes.batch_add(*attributes)
+
+    def __str__(self):
+        return self.path
+
+    def spawn(self, overrides=None):
+        """
+        Creates one instance. It isn't placed anywhere.
+
+        Args:
+            overrides (dict, optional): Data which differs from the template for this instance.
+
+        Returns:
+            entity (AthanorGameEntity)
+        """
+        data = dict(self.state)
+        extra = None
+        if overrides:
+            extra = {key: overrides[key] for key in HANDLER_FIELDS if key in overrides}
+            data.update({key: value for key, value in overrides.items() if key not in HANDLER_FIELDS})
+        entity = self.entity_class(data)
+        entity.tags.copy_from(self.tags)
+        entity.permissions.copy_from(self.permissions)
+        entity.attributes.copy_from(self.attributes)
+        if extra:
+            self.apply(entity, extra)
+        self.spawned += 1
+        return entity
+
+    def spawn_count(self, count, overrides=None):
+        """
+        Creates count items' worth of instances, none of them placed anywhere.
+
+        Returns:
+            entities (list): count entities, or a single stack of count for stackable blueprints.
+        """
+        if self.stackable:
+            return [self.spawn(dict(overrides or dict(), count=count))] if count > 0 else list()
+        return [self.spawn(overrides) for _ in range(count)]
+
+
+class SpawnEngine(object):
+    """
+    Owned by the entity controller. Blueprints are compiled on first use and kept until the
+    templates are reloaded.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.blueprints = dict()
+
+    def clear(self):
+        self.blueprints.clear()
+
+    def blueprint(self, template, plugin=None, kind=None):
+        """
+        Retrieves (compiling it if necessary) the Blueprint for a template.
+
+        Args:
+            template (str or Blueprint): A template path, resolved as per the controller's
+                resolve_path: key, kind/key or plugin/kind/key.
+            plugin (str, optional): Plugin to resolve short paths against.
+            kind (str, optional): Kind to resolve short paths against, such as 'mobiles'.
+
+        Returns:
+            blueprint (Blueprint)
+        """
+        if isinstance(template, Blueprint):
+            return template
+        path = self.controller.resolve_path(template, plugin, kind)
+        if not (found := self.blueprints.get(path, None)):
+            found = Blueprint('/'.join(path), self.controller.get_template(*path))
+            self.blueprints[path] = found
+        return found
+
+    @instrumented('spawn')
+    def spawn(self, template, room=None, plugin=None, kind=None, overrides=None):
+        """
+        Spawns one entity from a template.
+
+        Returns:
+            entity (AthanorGameEntity)
+        """
+        entity = self.blueprint(template, plugin, kind).spawn(overrides)
+        if room:
+            LocationHandler.set_many([entity], room, save=False)
+        return entity
+
+    @instrumented('spawn_many')
+    def spawn_many(self, template, count, room=None, plugin=None, kind=None, overrides=None):
+        """
+        Spawns many identical entities from one template, and places them all in a room at once.
+
+        Args:
+            template (str or Blueprint): The template, as per blueprint().
+            count (int): How many to spawn. Stackable templates spawn one stack of this many.
+            room (AthanorRoom or str, optional): Where to put them.
+            plugin (str, optional): Plugin to resolve short template paths against.
+            kind (str, optional): Kind to resolve short template paths against.
+            overrides (dict, optional): Data which differs from the template for every instance.
+
+        Returns:
+            entities (list)
+        """
+        blueprint = self.blueprint(template, plugin, kind)
+        entities = blueprint.spawn_count(count, overrides)
+        if room and entities:
+            LocationHandler.set_many(entities, room, save=False)
+        return entities
+
+    def despawn_many(self, entities):
+        """
+        Removes runtime entities from the world: they're taken out of their rooms in one batch and
+        stop ticking. Once nothing else refers to them they're garbage collected, which releases
+        their entity ids and component rows.
+
+        Args:
+            entities (list): The entities to despawn.
+        """
+        ticks = self.controller.ndb.ticks
+        for entity in entities:
+            ticks.unschedule(entity)
+        LocationHandler.set_many(entities, None, save=False)
+
+    def spawn_list(self, entries, room=None, plugin=None, kind=None):
+        """
+        Spawns everything in a population list such as a room's item_data or mobile_data.
+
+        Args:
+            entries (list): Template paths, or dicts of {'template': path, 'count': N, ...}
+                where anything else overrides the template's data. N stackable items make one
+                stack of N.
+            room (AthanorRoom, optional): Where to put everything.
+            plugin (str, optional): Plugin to resolve short template paths against.
+            kind (str, optional): Kind to resolve short template paths against.
+
+        Returns:
+            entities (list)
+        """
+        entities = list()
+        for entry in make_iter(entries):
+            if isinstance(entry, str):
+                entities.extend(self.blueprint(entry, plugin, kind).spawn_count(1))
+                continue
+            overrides = {key: value for key, value in entry.items() if key not in ('template', 'count')}
+            blueprint = self.blueprint(entry['template'], plugin, kind)
+            entities.extend(blueprint.spawn_count(entry.get('count', 1), overrides or None))
+        if room and entities:
+            LocationHandler.set_many(entities, room, save=False)
+        return entities
@@ -0,0 +1,452 @@
+"""
+Up-front validation of plugin data, so that mistakes are reported all at once, with the plugin,
+file and key they're in, instead of one at a time from wherever loading happens to trip on them.
+
+Every kind of thing (templates of each kind, rooms, exits, gateways, areas, maps and regions) has a
+schema of the fields the entity system reads and what they must be. Schemas are compiled once into
+lists of checker functions. Fields no schema mentions are left alone, since plugins and mixins add
+their own.
+
+On top of the schemas, references are checked: template parents and inheritance loops, the
+templates things use, exits from and to rooms which don't exist, gateways and areas which don't
+exist, the templates rooms populate themselves with, region maps, and gateway destinations.
+
+validate_plugins() splits the work into one job per plugin's templates, per map and per plugin's
+regions, and runs them in a process pool if asked to. Like compiler.py, this module must stay
+importable without Django or Evennia, both for worker processes and for athanor_entity.lint,
+which runs it straight from YAML files without booting the server.
+"""
+import multiprocessing
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Number
+
+from athanor_entity.controllers.bundles import template_names
+from athanor_entity.controllers.compiler import PluginCompiler
+
+MAP_SECTIONS = ('map', 'areas', 'rooms', 'gateways', 'exits')
+
+
+class Problem(namedtuple('Problem', ('plugin', 'file', 'where', 'message'))):
+
+    def __str__(self):
+        return f"{self.plugin}/{self.file}: {self.where}: {self.message}"
+
+
+# Field checkers. Each returns an error message, or None if the value is fine.
+
+def is_str(value):
+    if not isinstance(value, str):
+        return f"must be text, not {type(value).__name__}"
+
+
+def is_bool(value):
+    if not isinstance(value, bool):
+        return f"must be true or false, not {value!r}"
+
+
+def is_count(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        return f"must be a whole number of at least 1, not {value!r}"
+
+
+def is_interval(value):
+    if isinstance(value, bool) or not isinstance(value, Number) or value < 0:
+        return f"must be a number of seconds, not {value!r}"
+
+
+def is_str_list(value):
+    if isinstance(value, str):
+        return None
+    if not isinstance(value, (list, tuple)) or not all(isinstance(val, str) for val in value):
+        return "must be text or a list of text"
+
+
+def is_class_path(value):
+    if not isinstance(value, str) or '.' not in value.strip('.'):
+        return f"must be a dotted python path to a class, not {value!r}"
+
+
+def is_room_path(value):
+    if not isinstance(value, str) or not all(value.partition('/')[::2]):
+        return f"must be a room path like REGION/ROOM_KEY, not {value!r}"
+
+
+def is_tags(value):
+    if not isinstance(value, (list, tuple)):
+        return "must be a list of tags"
+    for tag in value:
+        if isinstance(tag, str):
+            continue
+        if not isinstance(tag, (list, tuple)) or not 1 <= len(tag) <= 3 or not isinstance(tag[0], str):
+            return f"has a malformed tag: {tag!r}"
+
+
+def is_attributes(value):
+    if isinstance(value, dict):
+        return None
+    if not isinstance(value, (list, tuple)) or not all(isinstance(attr, (list, tuple)) and len(attr) >= 2
+                                                       and isinstance(attr[0], str) for attr in value):
+        return "must be a mapping of attributes, or a list of (key, value) pairs"
+
+
+def is_population(value):
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    problems = list()
+    for entry in value:
+        if isinstance(entry, str):
+            continue
+        if not isinstance(entry, dict) or not isinstance(entry.get('template', None), str):
+            problems.append(f"entries must be template names or mappings with a 'template', not {entry!r}")
+        elif 'count' in entry and (message := is_count(entry['count'])):
+            problems.append(f"has a count which {message}")
+    if problems:
+        return "; ".join(problems)
+
+
+COMMON = {'name': is_str, 'description': is_str, 'templates': is_str_list, 'class': is_class_path,
+          'locks': is_str, 'tags': is_tags, 'permissions': is_str_list, 'attributes': is_attributes,
+          'aliases': is_str_list}
+
+SCHEMAS = {
+    'rooms': dict(COMMON, area=is_str, open=is_bool, tick_interval=is_interval, items=is_population,
+                  mobiles=is_population),
+    'exits': dict(COMMON, gateway=is_str, transparent=is_bool),
+    'gateways': dict(COMMON, destination=is_room_path, outside=is_bool, transparent=is_bool),
+    'areas': dict(COMMON),
+    'maps': {'name': is_str, 'description': is_str, 'templates': is_str_list, 'authors': is_str_list},
+    'regions': {'name': is_str, 'map': is_str, 'class': is_class_path},
+    'items': dict(COMMON, stackable=is_bool, count=is_count),
+    'mobiles': dict(COMMON, tick_interval=is_interval),
+}
+
+# Fields which must be present.
+REQUIRED = {'regions': ('map',)}
+
+
+def compile_schema(fields, required=()):
+    """
+    Builds a checker for one kind of thing.
+
+    Args:
+        fields (dict): Field name -> checker function.
+        required (tuple): Fields which must be present.
+
+    Returns:
+        check (callable): check(data) -> list of (field, message).
+    """
+    checkers = dict(fields)
+
+    def check(data):
+        if not isinstance(data, dict):
+            return [(None, f"must be a mapping, not {type(data).__name__}")]
+        errors = [(field, "is required") for field in required if field not in data]
+        # Things have far fewer fields than schemas do, so it's quicker to go by the data's.
+        for field, value in data.items():
+            if (checker := checkers.get(field, None)) and (message := checker(value)):
+                errors.append((field, message))
+        return errors
+
+    return check
+
+
+CHECKERS = {kind: compile_schema(fields, REQUIRED.get(kind, ())) for kind, fields in SCHEMAS.items()}
+DEFAULT_CHECKER = compile_schema(COMMON)
+
+
+class Validator(object):
+    """
+    Runs one job's checks, collecting Problems.
+    """
+
+    def __init__(self, plugin_key, templates):
+        """
+        Args:
+            plugin_key (str): The plugin being checked.
+            templates (dict): (plugin, kind, key) -> raw template data, for every known template.
+        """
+        self.plugin = plugin_key
+        self.templates = templates
+        self.paths = PluginCompiler(plugin_key)
+        self.merged = dict()
+        # Thousands of rooms and exits share a few template lists, so each list is only looked at once.
+        self.missing = dict()
+        self.inherited = dict()
+        self.problems = list()
+
+    @staticmethod
+    def template_names(data):
+        """
+        Returns:
+            names (tuple): The templates data inherits from. Empty if its list is malformed, which
+                check() reports.
+        """
+        if not isinstance(data, dict) or is_str_list(data.get('templates', None)) is not None:
+            return ()
+        return tuple(template_names(data))
+
+    def report(self, file, where, message):
+        self.problems.append(Problem(self.plugin, file, where, message))
+
+    def check(self, kind, data, file, where):
+        """
+        Checks one thing against its schema and checks the templates it uses exist.
+
+        Returns:
+            valid (bool): Whether data is a mapping, so that further checks make sense.
+        """
+        for field, message in CHECKERS.get(kind, DEFAULT_CHECKER)(data):
+            self.report(file, f"{where}.{field}" if field else where, message)
+        if not isinstance(data, dict):
+            return False
+        if (names := self.template_names(data)):
+            if (missing := self.missing.get((kind, names), None)) is None:
+                missing = self.missing[(kind, names)] = [
+                    template for template in names
+                    if self.paths.resolve_path(template, self.plugin, kind) not in self.templates]
+            for template in missing:
+                self.report(file, where, f"uses template '{template}', which doesn't exist")
+        return True
+
+    def merged_template(self, path):
+        """
+        Returns:
+            data (dict): A template as merge_templates would make it: its parents' data, then its own.
+        """
+        if (found := self.merged.get(path, None)) is None:
+            found = dict()
+            raw = self.templates.get(path, None) or dict()
+            for parent in self.template_names(raw):
+                found.update(self.templates.get(self.paths.resolve_path(parent, path[0], path[1]), None) or dict())
+            found.update(raw)
+            self.merged[path] = found
+        return found
+
+    def effective(self, kind, data, field):
+        """
+        Returns:
+            value: What field will be once data is merged with its templates.
+        """
+        if field in data:
+            return data[field]
+        names = self.template_names(data)
+        if (key := (kind, names, field)) not in self.inherited:
+            self.inherited[key] = None
+            for template in reversed(names):
+                merged = self.merged_template(self.paths.resolve_path(template, self.plugin, kind))
+                if field in merged:
+                    self.inherited[key] = merged[field]
+                    break
+        return self.inherited[key]
+
+    def check_templates(self):
+        file_kinds = dict()
+        for path, data in self.templates.items():
+            if path[0] != self.plugin:
+                continue
+            file = file_kinds.setdefault(path[1], f"templates/{path[1]}.yaml")
+            if not self.check(path[1], data, file, path[2]):
+                continue
+            if (loop := self.find_loop(path)):
+                self.report(file, path[2], f"inherits from itself: {' -> '.join('/'.join(p) for p in loop)}")
+
+    def find_loop(self, start):
+        """
+        Returns:
+            loop (list or None): The templates in an inheritance loop through start, if there is one.
+        """
+        stack = [(start, [start])]
+        seen = set()
+        while stack:
+            path, trail = stack.pop()
+            for parent in self.template_names(self.templates.get(path, None)):
+                parent = self.paths.resolve_path(parent, path[0], path[1])
+                if parent == start:
+                    return trail + [parent]
+                if parent not in seen and parent in self.templates:
+                    seen.add(parent)
+                    stack.append((parent, trail + [parent]))
+        return None
+
+    def check_population(self, kind, entries, file, where):
+        """
+        Checks that every well-formed entry of a room's items or mobiles spawns a template which
+        exists. Malformed entries are left to is_population, which reports them.
+        """
+        if not isinstance(entries, (list, tuple)):
+            entries = [entries]
+        for entry in entries:
+            template = entry if isinstance(entry, str) else (entry.get('template', None)
+                                                             if isinstance(entry, dict) else None)
+            if not isinstance(template, str):
+                continue
+            if self.paths.resolve_path(template, self.plugin, kind) not in self.templates:
+                self.report(file, where, f"spawns {kind} template '{template}', which doesn't exist")
+
+    def check_map(self, map_key, data):
+        """
+        Returns:
+            destinations (list): (file, where, room path) of every gateway destination, which are
+                checked once every plugin's regions and maps are known.
+        """
+        base = f"maps/{map_key}"
+        destinations = list()
+        if not isinstance(data, dict):
+            self.report(f"{base}/map.yaml", map_key, "map data must be a mapping")
+            return destinations
+        sections = dict()
+        for section in MAP_SECTIONS:
+            if not isinstance(value := data.get(section, None) or dict(), dict):
+                self.report(f"{base}/{section}.yaml", map_key, f"must be a mapping, not {type(value).__name__}")
+                value = dict()
+            sections[section] = value
+        self.check('maps', sections['map'], f"{base}/map.yaml", map_key)
+
+        for key, area in sections['areas'].items():
+            self.check('areas', area, f"{base}/areas.yaml", key)
+
+        file = f"{base}/gateways.yaml"
+        for key, gateway in sections['gateways'].items():
+            if not self.check('gateways', gateway, file, key):
+                continue
+            if (destination := self.effective('gateways', gateway, 'destination')):
+                destinations.append((file, key, destination))
+            elif not self.effective('gateways', gateway, 'outside'):
+                self.report(file, key, "has neither a destination nor outside: true, so it leads nowhere")
+
+        file = f"{base}/rooms.yaml"
+        rooms, areas = sections['rooms'], sections['areas']
+        for key, room in rooms.items():
+            if not self.check('rooms', room, file, key):
+                continue
+            if (area := room.get('area', None)) is not None and isinstance(area, str) and area not in areas:
+                self.report(file, f"{key}.area", f"area '{area}' isn't in this map")
+            for kind in ('items', 'mobiles'):
+                if room.get(kind, None):
+                    self.check_population(kind, room[kind], file, f"{key}.{kind}")
+
+        file = f"{base}/exits.yaml"
+        for room_key, room_exits in sections['exits'].items():
+            if room_key not in rooms:
+                self.report(file, room_key, "has exits, but isn't a room in this map")
+            if not room_exits:
+                continue
+            if not isinstance(room_exits, dict):
+                self.report(file, room_key, "must be a mapping of destination room -> exit")
+                continue
+            for dest_key, exit_data in room_exits.items():
+                where = f"{room_key} -> {dest_key}"
+                if not self.check('exits', exit_data, file, where):
+                    continue
+                if (gateway := self.effective('exits', exit_data, 'gateway')) is not None:
+                    if gateway not in sections['gateways']:
+                        self.report(file, where, f"goes through gateway '{gateway}', which isn't in this map")
+                elif dest_key not in rooms:
+                    self.report(file, where, f"leads to '{dest_key}', which isn't a room in this map")
+        return destinations
+
+    def check_regions(self, regions, map_keys):
+        file = "regions.yaml"
+        if not isinstance(regions, dict):
+            self.report(file, "regions", "must be a mapping")
+            return
+        for key, region in regions.items():
+            if self.check('regions', region, file, key) and isinstance(map_key := region.get('map', None), str) \
+                    and map_key not in map_keys:
+                self.report(file, f"{key}.map", f"map '{map_key}' isn't in this plugin")
+
+
+def validate_job(job):
+    """
+    Runs one validation job. This is what validate_plugins() runs in its worker processes.
+
+    Args:
+        job (tuple): (plugin key, job kind, job data, raw templates). The job kind is
+            'templates' (job data unused), 'map' ((map key, raw map)) or 'regions' ((raw regions,
+            the plugin's map keys)).
+
+    Returns:
+        result (tuple): (problems, gateway destinations to check).
+    """
+    plugin_key, kind, data, templates = job
+    validator = Validator(plugin_key, templates)
+    destinations = list()
+    try:
+        if kind == 'templates':
+            validator.check_templates()
+        elif kind == 'map':
+            destinations = validator.check_map(*data)
+        else:
+            validator.check_regions(*data)
+    except Exception:
+        validator.report(kind, "", f"could not be checked:\n{traceback.format_exc()}")
+    return validator.problems, [(plugin_key,) + destination for destination in destinations]
+
+
+def validate_plugins(plugins, workers=0, templates=None, known_maps=None):
+    """
+    Validates raw plugin data.
+
+    Args:
+        plugins (dict): Plugin key -> raw plugin data: a dict which may hold 'templates' (kind ->
+            key -> data), 'maps' (key -> map data) and 'regions' (key -> region data).
+        workers (int): Worker processes to validate in. 0 validates in this process.
+        templates (dict, optional): (plugin, kind, key) -> raw template data for plugins which are
+            loaded but not being validated, so that references to them count. When given, gateway
+            destinations aren't reported for regions which aren't among plugins.
+        known_maps (dict, optional): Plugin key -> keys of maps which exist without being in its
+            data, such as maps shipped only in a bundle.
+
+    Returns:
+        problems (list): Every Problem found, sorted by plugin and file.
+    """
+    all_templates = dict(templates or dict())
+    for plugin_key, data in plugins.items():
+        for kind, kind_templates in (data.get('templates', None) or dict()).items():
+            for key, template in (kind_templates or dict()).items():
+                all_templates[(plugin_key, kind, key)] = template
+
+    jobs, problems = list(), list()
+    regions, region_maps = dict(), dict()
+    for plugin_key, data in plugins.items():
+        jobs.append((plugin_key, 'templates', None, all_templates))
+        maps = data.get('maps', None) or dict()
+        for map_key, map_data in maps.items():
+            jobs.append((plugin_key, 'map', (map_key, map_data), all_templates))
+        plugin_regions = data.get('regions', None) or dict()
+        map_keys = set(maps) | set((known_maps or dict()).get(plugin_key, ()))
+        jobs.append((plugin_key, 'regions', (plugin_regions, map_keys), all_templates))
+        for key, region in (plugin_regions.items() if isinstance(plugin_regions, dict) else ()):
+            if key in regions:
+                problems.append(Problem(plugin_key, "regions.yaml", key,
+                                        f"is also a region in plugin '{regions[key]}'. Region keys must be unique."))
+                continue
+            regions[key] = plugin_key
+            if isinstance(region, dict) and isinstance(map_data := maps.get(region.get('map', None), None), dict):
+                region_maps[key] = map_data.get('rooms', None) or dict()
+
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(validate_job, jobs))
+    else:
+        results = [validate_job(job) for job in jobs]
+
+    for job_problems, destinations in results:
+        problems.extend(job_problems)
+        for plugin_key, file, where, destination in destinations:
+            if not isinstance(destination, str):
+                continue
+            owner, _, room_key = destination.partition('/')
+            if owner.startswith('#'):
+                continue
+            if owner in region_maps:
+                if room_key not in region_maps[owner]:
+                    problems.append(Problem(plugin_key, file, where, f"leads to '{destination}', but region "
+                                                                     f"'{owner}' has no room '{room_key}'"))
+            elif templates is None and owner not in regions:
+                problems.append(Problem(plugin_key, file, where, f"leads to '{destination}', but there's no "
+                                                                 f"region '{owner}'"))
+    problems.sort(key=lambda problem: (problem.plugin, problem.file))
+    return problems
@@ -2,10 +2,7 @@ from django.conf import settings
 from evennia.utils.utils import class_from_module
 from athanor_entity.entities.base import AbstractMapEntity
 
-MIXINS = []
-
-for mixin in settings.MIXINS["ENTITY_AREA"]:
-    MIXINS.append(class_from_module(mixin))
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_AREA"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
@@ -15,3 +12,24 @@ class AthanorArea(*MIXINS, AbstractMapEntity):
         AbstractMapEntity.__init__(self, unique_key, handler, data)
         self.description = data.get("description", "")
         self.rooms = set()
+
+    def update_data(self, data):
+        AbstractMapEntity.update_data(self, data)
+        self.description = data.get("description", "")
+
+    def msg_area(self, text, exclude=None, from_obj=None, mapping=None, **kwargs):
+        """
+        Sends a message to every puppet anywhere in this area, such as a zone echo.
+
+        Args:
+            text (str or tuple): The message.
+            exclude (list, optional): Entities not to send to.
+            from_obj (entity, optional): Who it's from.
+            mapping (dict, optional): Per-recipient substitutions, as per msg_contents.
+            **kwargs: batch=True batches output per session until the next reactor turn.
+
+        Returns:
+            count (int): How many puppets were sent to.
+        """
+        return self.occupancy.msg(text, exclude=exclude, from_obj=from_obj, mapping=mapping, **kwargs)
+
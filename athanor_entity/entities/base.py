@@ -2,27 +2,32 @@ import datetime, re, time
 from django.conf import settings
 from collections import defaultdict
 
-from evennia.utils import ansi
+from evennia import GLOBAL_SCRIPTS
 from evennia.utils.utils import time_format, logger, lazy_property, make_iter, to_str, is_iter, list_to_string
 from evennia.utils.utils import class_from_module
+from evennia.typeclasses.tags import TagHandler, AliasHandler, PermissionHandler
+from evennia.typeclasses.attributes import AttributeHandler, NAttributeHandler, DbHolder
 from evennia.utils.ansi import ANSIString
 from evennia.commands.cmdsethandler import CmdSetHandler
-from evennia.typeclasses.tags import Tag, TagHandler, AliasHandler, PermissionHandler
 from evennia.objects.objects import _INFLECT, ObjectSessionHandler
 from evennia.commands import cmdhandler
 
 from athanor.utils.mixins import HasLocks
 from athanor_entity.mixins.abstract import HasInventory
-from athanor_entity.entities.handlers import GearHandler, AspectHandler, KeywordHandler
-from athanor_entity.entities.handlers import LocationHandler, MapHandler
+from athanor_entity.controllers.profiler import instrumented
+from athanor_entity.controllers.broadcast import BATCHER, propagate
+from athanor_entity.entities.handlers import GearHandler, AspectHandler, KeywordHandler, ItemHandler
+from athanor_entity.entities.handlers import LocationHandler, MapHandler, OccupancyHandler
 from athanor_entity.entities.handlers import FactionHandler, AllianceHandler, DivisionHandler
+from athanor_entity.entities.memory import MemoryTagHandler, MemoryAliasHandler, MemoryPermissionHandler
+from athanor_entity.entities.memory import MemoryAttributeHandler
 from athanor.utils.color import green_yellow_red, red_yellow_green
 from athanor.utils.time import utcnow
 from athanor.utils.text import partial_match
 
 from django.utils.translation import ugettext as _
 
-
+_ScriptDB = None
 
 
 BASE_MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_BASE"]]
@@ -35,6 +40,22 @@ MAPENT_MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_M
 MAPENT_MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
+class EntityGroup(object):
+    """
+    Stands in for a group of entities in message mappings, so that msg_contents can render
+    the group's names for each individual looker.
+    """
+
+    def __init__(self, entities):
+        self.entities = list(entities)
+
+    def __str__(self):
+        return list_to_string([str(ent) for ent in self.entities])
+
+    def get_display_name(self, looker, **kwargs):
+        return list_to_string([ent.get_display_name(looker, **kwargs) for ent in self.entities])
+
+
 class BaseGameEntity(*BASE_MIXINS, HasInventory):
     """
     This class is not meant to be used directly. It forms the foundation for Athanor's Entity system,
@@ -57,12 +78,37 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
     def entities(self):
         return set()
 
+    @lazy_property
+    def occupancy(self):
+        return OccupancyHandler(self)
+
     def at_register_entity(self, entity):
         pass
 
     def at_unregister_entity(self, entity):
         pass
 
+    def at_register_entities(self, entities):
+        """
+        Called once by LocationHandler.set_many() for every group of entities arriving here together.
+        The default just calls at_register_entity() for each, so override this for group-aware logic.
+
+        Args:
+            entities (list): The entities which were just registered.
+        """
+        for entity in entities:
+            self.at_register_entity(entity)
+
+    def at_unregister_entities(self, entities):
+        """
+        Called once by LocationHandler.set_many() for every group of entities leaving here together.
+
+        Args:
+            entities (list): The entities which were just unregistered.
+        """
+        for entity in entities:
+            self.at_unregister_entity(entity)
+
     @lazy_property
     def aspects(self):
         return AspectHandler(self)
@@ -175,7 +221,9 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
             return time.time() - float(min(conn))
         return None
 
-    def search_entities(self, searchdata, candidates=None, allow_here=True,  allow_me=True, allow_all=True):
+    @instrumented('search_entities', lambda self: self.location)
+    def search_entities(self, searchdata, candidates=None, allow_here=True,  allow_me=True, allow_all=True,
+                        allow_visible=False):
 
         if allow_here and searchdata.lower() in ("here",):
             return [self.location]
@@ -189,6 +237,8 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
             if self.location:
                 candidates += self.location.contents
                 candidates.remove(self)
+                if allow_visible and hasattr(self.location, 'visible_entities'):
+                    candidates += self.location.visible_entities(self)
 
         process_search = self.re_search.match(searchdata).groupdict()
 
@@ -238,7 +288,17 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
         if self.gear_location:
             self.gear_location.update(self)
 
+    def at_location_change(self, old_room, new_room):
+        """
+        Called by the LocationHandler after this entity's room has changed, however that happened.
 
+        Args:
+            old_room (AthanorRoom or None): Where it was.
+            new_room (AthanorRoom or None): Where it is now.
+        """
+        pass
+
+    @instrumented('move_to', lambda self: self.location)
     def move_to(self, destination, quiet=False, emit_to_obj=None, use_destination=False, to_none=False, move_hooks=True,
                 **kwargs):
         """
@@ -276,7 +336,6 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
             pass
 
         if isinstance(destination, str):
-            from evennia import GLOBAL_SCRIPTS
             destination = GLOBAL_SCRIPTS.plugin.resolve_room_path(destination)
 
         # Before the move, call eventual pre-commands.
@@ -349,6 +408,23 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
     def location(self, value):
         self.locations.set(value)
 
+    def find_path_to(self, destination):
+        """
+        Plans a walk from this entity's location to another room on the same map.
+
+        Args:
+            destination (AthanorRoom): Where to go.
+
+        Returns:
+            exits (list or None): The exits to traverse in order, or None if there's no route
+                this entity is allowed to take.
+        """
+        if not (room := self.location) or not hasattr(room, 'handler'):
+            return None
+        if destination.handler is not room.handler:
+            return None
+        return room.handler.find_path(room, destination, traverser=self)
+
     def at_pre_puppet(self, account, session=None, **kwargs):
         """
         Return the character from storage in None location in `at_post_unpuppet`.
@@ -379,6 +455,7 @@ class BaseGameEntity(*BASE_MIXINS, HasInventory):
             puppeting this Object.
 
         """
+        self.locations.set_puppeted(True)
         self.msg("\nYou become |c%s|n.\n" % self.name)
         self.msg((self.at_look(self.location), {"type": "look"}), options=None)
 
@@ -432,9 +509,17 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
     """
     persistent = False
     _is_deleted = False
+    tick_interval = None
+    snapshot_restore = True
+    # What nearby rooms hear when this entity says something, by distance. Set ENTITY_HEARING_RANGE to 0 to disable.
+    say_carry_messages = ('From nearby, you hear {object} say, "{speech}"',
+                          'Somewhere in the distance, someone says, "{speech}"',
+                          'You hear faint voices in the distance.')
 
     def __init__(self, data):
+        # id stays -1 since Evennia treats real ids as database rows. entity_id is our dense runtime id.
         self.id = -1
+        self.entity_id = GLOBAL_SCRIPTS.entity.ndb.registry.register(self)
         self.db_key = data.get("name", "Unknown Entity")
         self.db_lock_storage = data.get('locks', "")
         self.db_cmdset_storage = data.get('cmdsets', "")
@@ -446,6 +531,18 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
         self.db_destination = None
         self.inventory_location = None
         self.gear_location = None
+        # The plugin/kind/key of the template this was spawned from, if any.
+        self.template = data.get('template', None)
+        # Tags and permissions may come from templates as lists of keys or (key, category) pairs.
+        if (tags := data.get('tags', None)):
+            self.tags.batch_add(*tags)
+        if (permissions := data.get('permissions', None)):
+            self.permissions.batch_add(*permissions)
+        # Attributes may come as a dict of key -> value, or a list of (key, value, category...) tuples.
+        if (attributes := data.get('attributes', None)):
+            if isinstance(attributes, dict):
+                attributes = attributes.items()
+            self.attributes.batch_add(*attributes)
 
     def __str__(self):
         return self.db_key
@@ -453,10 +550,39 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
     def __repr__(self):
         return self.db_key
 
+    def snapshot_state(self):
+        """
+        Called when the live entity graph is snapshotted on reload. Returns the data that
+        __init__ needs to recreate this entity as it is right now. Sub-classes which keep
+        more state should extend this.
+
+        Returns:
+            state (dict)
+        """
+        return {
+            'name': self.db_key,
+            'locks': self.db_lock_storage,
+            'cmdsets': self.db_cmdset_storage,
+            'date_created': self.db_date_created,
+            'typeclass_path': self.db_typeclass_path,
+            'template': self.template,
+            'tags': self.tags.all(return_objs=True),
+            'permissions': self.permissions.all(return_key_and_category=True),
+            'attributes': self.attributes.export(),
+        }
+
     @lazy_property
     def dbref(self):
         return f"#{self.id}"
 
+    @property
+    def entity_ref(self):
+        """
+        A compact integer that can be stored in caches or messages in place of this entity,
+        and turned back into it with the controller's registry.resolve().
+        """
+        return GLOBAL_SCRIPTS.entity.ndb.registry.ref(self)
+
     @property
     def account(self):
         return self.db_account
@@ -498,9 +624,7 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
 
     def get_numbered_name(self, count, looker, **kwargs):
         key = kwargs.get("key", self.key)
-        key = ansi.ANSIString(
-            key
-        )  # this is needed to allow inflection of colored names
+        key = ANSIString(key)  # this is needed to allow inflection of colored names
         plural = _INFLECT.plural(key, 2)
         plural = "%s %s" % (_INFLECT.number_to_words(count, threshold=12), plural)
         singular = _INFLECT.an(key)
@@ -559,18 +683,41 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
     def cmdset(self):
         return CmdSetHandler(self, True)
 
+    # Runtime entities have no database row, so they keep their tags in memory.
+    @lazy_property
+    def tags(self):
+        return TagHandler(self) if self.persistent else MemoryTagHandler(self)
+
     @lazy_property
     def aliases(self):
-        return AliasHandler(self)
+        return AliasHandler(self) if self.persistent else MemoryAliasHandler(self)
 
     @lazy_property
     def permissions(self):
-        return PermissionHandler(self)
+        return PermissionHandler(self) if self.persistent else MemoryPermissionHandler(self)
+
+    # Likewise for Attributes.
+    @lazy_property
+    def attributes(self):
+        return AttributeHandler(self) if self.persistent else MemoryAttributeHandler(self)
+
+    @lazy_property
+    def nattributes(self):
+        return NAttributeHandler(self)
+
+    @lazy_property
+    def db(self):
+        return DbHolder(self, "attributes")
+
+    @lazy_property
+    def ndb(self):
+        return DbHolder(self, "nattrhandler", manager_name="nattributes")
 
     @property
     def is_superuser(self):
         return False
 
+    @instrumented('return_appearance', lambda self: self if hasattr(self, 'unique_key') else self.location)
     def return_appearance(self, looker, **kwargs):
         """
         This formats a description. It is the hook a 'look' command
@@ -697,8 +844,9 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
                     text = repr(text)
             kwargs['text'] = text
 
-        # relay to session(s)
+        # relay to session(s), after anything batched for them, so as not to overtake it
         sessions = make_iter(session) if session else self.sessions.all()
+        BATCHER.flush_sessions(sessions)
         for session in sessions:
             session.data_out(**kwargs)
 
@@ -721,6 +869,7 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
     def has_account(self):
         return self.sessions.count()
 
+    @instrumented('msg_contents', lambda self: self if hasattr(self, 'unique_key') else self.location)
     def msg_contents(self, text=None, exclude=None, from_obj=None, mapping=None, **kwargs):
         # we also accept an outcommand on the form (message, {kwargs})
         is_outcmd = text and is_iter(text)
@@ -1055,7 +1204,7 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
             puppeting this Object.
 
         """
-        pass
+        self.locations.set_puppeted(True)
 
     def at_pre_unpuppet(self, **kwargs):
         """
@@ -1088,7 +1237,8 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
                 overriding the call (unused by default).
 
         """
-        pass
+        if not self.sessions.count():
+            self.locations.set_puppeted(False)
 
     def at_server_reload(self):
         """
@@ -1107,6 +1257,14 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
         """
         pass
 
+    def at_tick(self):
+        """
+        Called by the entity controller's TickScheduler every `tick_interval` seconds,
+        but only while somebody is puppeting a character on this entity's map.
+
+        """
+        pass
+
     def at_access(self, result, accessing_obj, access_type, **kwargs):
         """
         This is called with the result of an access call, along with
@@ -1290,6 +1448,99 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
         """
         pass
 
+    def at_objects_leave(self, moved_objs, target_location, **kwargs):
+        """
+        Called once by a group move, just before a group of objects leaves from inside this object.
+        By default, this just calls at_object_leave() for each.
+
+        Args:
+            moved_objs (list): The objects leaving.
+            target_location (Object): Where `moved_objs` are going.
+            **kwargs (dict): Arbitrary, optional arguments for users
+                overriding the call (unused by default).
+
+        """
+        for moved_obj in moved_objs:
+            self.at_object_leave(moved_obj, target_location, **kwargs)
+
+    def at_objects_receive(self, moved_objs, source_location, **kwargs):
+        """
+        Called once by a group move, after a group of objects from the same source has been moved into
+        this object. By default, this just calls at_object_receive() for each.
+
+        Args:
+            moved_objs (list): The objects moved into this one.
+            source_location (Object): Where `moved_objs` came from.
+                Note that this could be `None`.
+            **kwargs (dict): Arbitrary, optional arguments for users
+                overriding the call (unused by default).
+
+        """
+        for moved_obj in moved_objs:
+            self.at_object_receive(moved_obj, source_location, **kwargs)
+
+    def announce_group_move_from(self, moved_objs, destination, msg=None, mapping=None, **kwargs):
+        """
+        Called on the source location of a group move to announce, in a single message, that
+        a group of objects is leaving. This is called while they are still here.
+
+        Args:
+            moved_objs (list): The objects leaving.
+            destination (Object): The place they are going to.
+            msg (str, optional): a replacement message.
+            mapping (dict, optional): additional mapping objects.
+            **kwargs (dict): Arbitrary, optional arguments for users
+                overriding the call (unused by default).
+
+        Notes:
+            Supports the same mappings as announce_move_from, except that {object} is the whole group.
+        """
+        string = msg or "{object} are leaving {origin}, heading for {destination}."
+        exits = [o for o in self.contents if o.destination is destination]
+        if not mapping:
+            mapping = {}
+
+        mapping.update({
+            "object": EntityGroup(moved_objs),
+            "exit": exits[0] if exits else "somewhere",
+            "origin": self,
+            "destination": destination or "nowhere",
+        })
+
+        self.msg_contents(string, exclude=moved_objs, mapping=mapping)
+
+    def announce_group_move_to(self, moved_objs, source_locations, msg=None, mapping=None, **kwargs):
+        """
+        Called on the destination of a group move to announce, in a single message, that a group
+        of objects has arrived. At this point they are already here.
+
+        Args:
+            moved_objs (list): The objects which arrived.
+            source_locations (list): The places they came from. May contain None.
+            msg (str, optional): a replacement message.
+            mapping (dict, optional): additional mapping objects.
+            **kwargs (dict): Arbitrary, optional arguments for users
+                overriding the call (unused by default).
+        """
+        origins = [source for source in source_locations if source]
+        if origins:
+            string = msg or "{object} arrive to {destination} from {origin}."
+        else:
+            string = msg or "{object} arrive to {destination}."
+        exits = [o for o in self.contents if o.destination in origins]
+
+        if not mapping:
+            mapping = {}
+
+        mapping.update({
+            "object": EntityGroup(moved_objs),
+            "exit": exits[0] if exits else "somewhere",
+            "origin": EntityGroup(origins) if origins else "nowhere",
+            "destination": self,
+        })
+
+        self.msg_contents(string, exclude=moved_objs, mapping=mapping)
+
     def at_traverse(self, traversing_object, target_location, **kwargs):
         """
         This hook is responsible for handling the actual traversal,
@@ -1397,6 +1648,7 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
     def get_description(self, looker):
         return f"{self} has no description!"
 
+    @instrumented('return_appearance', lambda self: self if hasattr(self, 'unique_key') else self.location)
     def return_appearance(self, looker, **kwargs):
         """
         This formats a description. It is the hook a 'look' command
@@ -1738,14 +1990,36 @@ class AthanorGameEntity(*ENTITY_MIXINS, HasLocks, BaseGameEntity):
                                        exclude=exclude,
                                        mapping=location_mapping)
 
+        if msg_type == 'say' and location and (carry := self.say_carry_messages[:settings.ENTITY_HEARING_RANGE]):
+            carry_mapping = {"object": self, "speech": message}
+            carry_mapping.update(custom_mapping)
+            propagate(location, [(text, {"type": "distant_say"}) if text else None for text in carry],
+                      from_obj=self, mapping=carry_mapping)
+
 
 class AbstractMapEntity(*MAPENT_MIXINS, AthanorGameEntity):
     """
     A sub-class of AthanorGameEntity that's specialized for being chunks of the map.
     """
+    # Map entities are rebuilt from plugin data by their MapHandler, not from snapshots.
+    snapshot_restore = False
 
     def __init__(self, unique_key, handler, data):
         AthanorGameEntity.__init__(self, data)
         self.unique_key = unique_key
         self.handler = handler
         self.instance = handler.owner
+
+    def update_data(self, data):
+        """
+        Applies reloaded map data to this entity in place, as per MapHandler.patch(). Sub-classes
+        should extend this for whatever else they read from their data.
+
+        Args:
+            data (dict): This entity's new prepared data.
+        """
+        self.db_key = data.get("name", "Unknown Entity")
+        if (locks := data.get('locks', "")) != self.db_lock_storage:
+            self.db_lock_storage = locks
+            if 'locks' in self.__dict__:
+                self.locks.reset()
@@ -0,0 +1,212 @@
+"""
+Columnar storage for numeric entity state.
+
+Large populations of non-persistent entities (mobiles, mostly) can keep numbers like hit points,
+regeneration rates or AI weights in a ComponentStore instead of in per-object attributes. Each
+registered entity gets a dense row, each piece of state is a NumPy column, and per-tick updates
+run as one vectorized operation over the whole column instead of a Python loop over objects.
+
+Game code keeps using plain attribute access through ComponentField descriptors.
+
+This requires NumPy, which is an optional dependency.
+"""
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ComponentStore(object):
+    """
+    A set of NumPy columns indexed by a dense row number per registered entity.
+    Rows are recycled when their entity is unregistered or garbage collected.
+    """
+    initial_capacity = 1024
+
+    def __init__(self, key):
+        if numpy is None:
+            raise ImportError("ComponentStore requires NumPy. Install it with: pip install numpy")
+        self.key = key
+        self.capacity = self.initial_capacity
+        self.size = 0
+        self.columns = dict()
+        self.defaults = dict()
+        self.rows = weakref.WeakKeyDictionary()
+        self.entities = [None] * self.capacity
+        self.finalizers = dict()
+        self.free = list()
+
+    def __str__(self):
+        return self.key
+
+    def add_column(self, name, dtype='float64', default=0):
+        """
+        Adds a column if it doesn't exist yet. Existing rows are filled with the default.
+
+        Args:
+            name (str): The column name.
+            dtype (str or numpy.dtype): The column's type.
+            default (number): Value for new rows.
+
+        Returns:
+            column (numpy.ndarray): The full column, including unused capacity.
+        """
+        if (found := self.columns.get(name, None)) is not None:
+            return found
+        column = numpy.full(self.capacity, default, dtype=dtype)
+        self.columns[name] = column
+        self.defaults[name] = default
+        return column
+
+    def grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            new_column = numpy.full(self.capacity, self.defaults[name], dtype=column.dtype)
+            new_column[:self.size] = column[:self.size]
+            self.columns[name] = new_column
+        self.entities.extend([None] * (self.capacity - len(self.entities)))
+
+    def register(self, entity, values=None):
+        """
+        Allocates a row for an entity.
+
+        Args:
+            entity (AthanorGameEntity): The entity to store state for.
+            values (dict, optional): Initial values for any columns. Others get their defaults.
+
+        Returns:
+            row (int)
+        """
+        if (row := self.rows.get(entity, None)) is not None:
+            return row
+        if values is None:
+            values = dict()
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size >= self.capacity:
+                self.grow()
+            row = self.size
+            self.size += 1
+        for name, column in self.columns.items():
+            column[row] = values.get(name, self.defaults[name])
+        self.rows[entity] = row
+        self.entities[row] = weakref.ref(entity)
+        self.finalizers[row] = weakref.finalize(entity, self.release, row)
+        return row
+
+    def release(self, row):
+        if self.entities[row] is None:
+            return
+        self.entities[row] = None
+        self.finalizers.pop(row).detach()
+        for name, column in self.columns.items():
+            column[row] = self.defaults[name]
+        self.free.append(row)
+
+    def unregister(self, entity):
+        if (row := self.rows.pop(entity, None)) is not None:
+            self.release(row)
+
+    def get(self, entity, name):
+        return self.columns[name][self.rows[entity]].item()
+
+    def set(self, entity, name, value):
+        self.columns[name][self.rows[entity]] = value
+
+    def view(self, name):
+        """
+        Returns the in-use part of a column. Operations on it write straight into the store.
+        Unused rows hold their column's default, so vectorized math over the whole view is safe
+        as long as defaults are neutral for that math.
+        """
+        return self.columns[name][:self.size]
+
+    def entity(self, row):
+        if (ref := self.entities[row]) is None:
+            return None
+        return ref()
+
+    def active_rows(self):
+        """
+        Returns:
+            rows (numpy.ndarray): Indices of all rows currently in use.
+        """
+        return numpy.fromiter(self.rows.values(), dtype='int64', count=len(self.rows))
+
+    def add(self, name, delta, minimum=None, maximum=None):
+        """
+        The workhorse for regeneration and decay: adds `delta` to a column in one vectorized step,
+        optionally clamping the result.
+
+        Args:
+            name (str): The column to modify.
+            delta (number or str): A constant, or the name of another column to add.
+            minimum (number or str, optional): Lower bound, constant or column name.
+            maximum (number or str, optional): Upper bound, constant or column name.
+        """
+        target = self.view(name)
+        target += self.view(delta) if isinstance(delta, str) else delta
+        if minimum is not None or maximum is not None:
+            lower = self.view(minimum) if isinstance(minimum, str) else minimum
+            upper = self.view(maximum) if isinstance(maximum, str) else maximum
+            numpy.clip(target, lower, upper, out=target)
+
+    def scale(self, name, factor):
+        target = self.view(name)
+        target *= self.view(factor) if isinstance(factor, str) else factor
+
+
+class ComponentField(object):
+    """
+    Declares a numeric attribute whose value lives in a ComponentStore column.
+
+    Usage:
+        class Goblin(AthanorMobile):
+            hp = ComponentField(default=10)
+            hp_regen = ComponentField(default=0.5)
+
+    The entity must have registered itself with the store (AthanorMobile does so in __init__)
+    before the attribute is used.
+    """
+
+    def __init__(self, default=0, dtype='float64', store='mobiles'):
+        self.default = default
+        self.dtype = dtype
+        self.store = store
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        store = instance.component_stores[self.store]
+        return store.columns[self.name][store.rows[instance]].item()
+
+    def __set__(self, instance, value):
+        store = instance.component_stores[self.store]
+        store.columns[self.name][store.rows[instance]] = value
+
+
+def component_fields(cls):
+    """
+    Gathers every ComponentField declared on a class and its parents.
+
+    Args:
+        cls (type): The class to inspect.
+
+    Returns:
+        fields (list of ComponentField)
+    """
+    if '_component_fields' not in cls.__dict__:
+        found = dict()
+        for klass in reversed(cls.__mro__):
+            for name, value in klass.__dict__.items():
+                if isinstance(value, ComponentField):
+                    found[name] = value
+        cls._component_fields = list(found.values())
+    return cls._component_fields
@@ -5,10 +5,7 @@ from evennia.objects.objects import ExitCommand
 
 from athanor_entity.entities.base import AbstractMapEntity
 
-MIXINS = []
-
-for mixin in settings.MIXINS["ENTITY_EXIT"]:
-    MIXINS.append(class_from_module(mixin))
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_EXIT"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
@@ -20,21 +17,58 @@ class AthanorExit(*MIXINS, AbstractMapEntity):
     def __init__(self, destination_key, handler, data, room):
         AbstractMapEntity.__init__(self, data.get("name"), handler, data)
         self.location = room
+        # On instanced maps the destination may not have been built yet, so it's looked up on first use.
+        self.destination_key = destination_key
         self.db_destination = self.handler.rooms.get(destination_key, None)
 
         self.description = data.get("description", "")
-        self.aliases = data.get('aliases', list())
+        self.aliases.batch_add(*data.get('aliases', list()))
+        self.transparent = data.get('transparent', False)
         self.gateway = self.handler.gateways.get(data.get('gateway', None), None)
         if self.gateway:
             self.gateway.exits[self] = self.db_destination
 
+    @property
+    def destination(self):
+        if self.gateway:
+            return self.gateway.destination
+        if self.db_destination is None and self.destination_key is not None:
+            self.db_destination = self.handler.get_room(self.destination_key)
+        return self.db_destination
+
+    @destination.setter
+    def destination(self, value):
+        self.destination_key = None
+        self.db_destination = value
+        if self.location:
+            self.location.invalidate_visibility()
+
+    @property
+    def see_through(self):
+        """
+        Whether the room on the other side can be seen from this exit's room.
+        """
+        if self.gateway:
+            return self.gateway.transparent
+        if self.transparent:
+            return True
+        return self.location.open_area and (destination := self.destination) is not None and destination.open_area
+
+    def set_transparent(self, value):
+        """
+        Opens or closes this exit to sight, such as a window's shutters. Keeps room visibility up to date.
+        """
+        self.transparent = value
+        if self.location:
+            self.location.invalidate_visibility()
+
     def create_exit_cmdset(self, exidbobj):
         cmd = self.exit_command(
             key=exidbobj.db_key.strip().lower(),
-            aliases=exidbobj.aliases,
+            aliases=exidbobj.aliases.all(),
             locks=str(exidbobj.locks),
             auto_help=False,
-            destination=exidbobj.db_destination,
+            destination=exidbobj.destination,
             arg_regex=r"^$",
             is_exit=True,
             obj=exidbobj,
@@ -0,0 +1,88 @@
+from django.conf import settings
+from evennia.utils.utils import class_from_module
+from evennia import GLOBAL_SCRIPTS
+from athanor_entity.entities.base import AbstractMapEntity
+
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_GATEWAY"]]
+MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
+
+
+class AthanorGateway(*MIXINS, AbstractMapEntity):
+    """
+    A connection from one map to another. Exits flagged with a gateway lead wherever the gateway
+    does instead of to a room on their own map.
+
+    Gateways either have a `destination` room path (REGION_KEY/ROOM_KEY or #DBREF/ROOM_KEY, as per
+    resolve_room_path) or are flagged `outside`, meaning they lead out of a structure into the
+    room the structure currently sits in.
+    """
+
+    def __init__(self, unique_key, handler, data):
+        AbstractMapEntity.__init__(self, unique_key, handler, data)
+        self.exits = dict()
+        self.destination_path = data.get('destination', None)
+        self.outside = data.get('outside', False)
+        self.transparent = data.get('transparent', False)
+        # (owner, room key) that destination_path resolves to. Resolving #DBREF paths means a
+        # database query, so it's done once; the room itself is looked up in its map every time.
+        self._target = None
+
+    def update_data(self, data):
+        AbstractMapEntity.update_data(self, data)
+        self.destination_path = data.get('destination', None)
+        self.outside = data.get('outside', False)
+        self.transparent = data.get('transparent', False)
+        self.forget_destination()
+
+    @property
+    def target(self):
+        if self._target is None:
+            owner, room_key = GLOBAL_SCRIPTS.entity.resolve_room_owner(self.destination_path)
+            owner.map.inbound.add(self)
+            self._target = (owner, room_key)
+        return self._target
+
+    @property
+    def destination(self):
+        if self.outside:
+            return self.handler.owner.location
+        if not self.destination_path:
+            return None
+        owner, room_key = self.target
+        if not (room := owner.map.get_room(room_key)):
+            raise ValueError(f"Cannot find that room_key in {owner}!")
+        return room
+
+    def peek_destination(self):
+        """
+        Like destination, but never loads another map.
+
+        Returns:
+            room (AthanorRoom or None): None if the room's map isn't loaded (or it has no such room).
+        """
+        if self.outside or not self.destination_path:
+            return self.destination
+        owner, room_key = self.target
+        if not owner.map.loaded:
+            return None
+        return owner.map.rooms.get(room_key, None)
+
+    def forget_destination(self):
+        """
+        Drops the resolved destination, such as when the map it led into is unloaded.
+        """
+        self._target = None
+        self.invalidate_visibility()
+
+    def set_transparent(self, value):
+        self.transparent = value
+        self.invalidate_visibility()
+
+    def invalidate_visibility(self):
+        """
+        Called whenever what this gateway leads to changes, so the rooms with exits through it stop
+        showing the old view.
+        """
+        for ex in self.exits:
+            ex.location.invalidate_visibility()
+
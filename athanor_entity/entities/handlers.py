@@ -1,7 +1,13 @@
+import weakref
+from collections import defaultdict
+
 from django.conf import settings
 from evennia import GLOBAL_SCRIPTS
 from evennia.utils.utils import class_from_module
-from evennia.objects.objects import ObjectSessionHandler
+
+from athanor_entity.controllers.profiler import instrumented
+from athanor_entity.entities.paths import MapGraph
+from athanor_entity.controllers.broadcast import broadcast
 
 
 class KeywordHandler(object):
@@ -10,7 +16,8 @@ class KeywordHandler(object):
         self.owner = owner
 
     def all(self, looker=None):
-        pass
+        name = self.owner.get_display_name(looker) if looker else self.owner.key
+        return name.lower().split()
 
 
 class BodyHandler(object):
@@ -45,7 +52,7 @@ class ItemHandler(object):
     def contents(self):
         all = set()
         for inv in self.inventories.values():
-            all += inv.contents
+            all |= inv.contents
         return list(all)
 
     def all(self, inv_name=None):
@@ -65,8 +72,11 @@ class ItemHandler(object):
         self.inventories[inv_name] = new_inv
         return new_inv
 
+    def is_carrying(self, entity):
+        return entity.inventory_location is not None and entity.inventory_location.handler is self
+
     def can_add(self, entity, inv_name):
-        if entity in self.contents:
+        if self.is_carrying(entity):
             raise ValueError(f"{self.owner} is already carrying {entity}!")
         inv = self.get_inventory(inv_name)
         for aspect in self.owner.aspects.all():
@@ -75,7 +85,7 @@ class ItemHandler(object):
         inv.can_add(entity)
 
     def can_transfer(self, entity, inv_name):
-        if entity not in self.contents:
+        if not self.is_carrying(entity):
             raise ValueError(f"{self.owner} is not carrying {entity}!")
         old_inv = entity.inventory_location
         old_inv.can_remove(entity)
@@ -83,34 +93,51 @@ class ItemHandler(object):
         inv.can_add(entity)
 
     def can_remove(self, entity):
-        if entity not in self.contents:
+        if not self.is_carrying(entity):
             raise ValueError(f"{self.owner} is not carrying {entity}!")
         old_inv = entity.inventory_location
         old_inv.can_remove(entity)
 
     def add(self, entity, inv_name=None, run_checks=True):
+        """
+        Returns:
+            entity (AthanorItem): What now holds the item. Stackable items may have merged into
+                an existing stack.
+        """
         if not inv_name:
             inv_name = entity.default_inventory
         if run_checks:
             self.can_add(entity, inv_name)
         inv = self.get_inventory(inv_name)
-        inv.add(entity)
-        self.contents.add(entity)
+        return inv.add(entity)
+
+    def transfer(self, entity, inv_name, count=None, run_checks=True):
+        """
+        Args:
+            count (int, optional): For stacks, only move this many.
 
-    def transfer(self, entity, inv_name, run_checks=True):
+        Returns:
+            entity (AthanorItem): What holds the moved items in their new inventory.
+        """
         if run_checks:
             self.can_transfer(entity, inv_name)
         dest = self.get_inventory(inv_name)
         inv = entity.inventory_location
-        inv.remove(entity)
-        dest.add(entity)
+        return dest.add(inv.remove(entity, count=count))
 
-    def remove(self, entity, run_checks=True):
+    def remove(self, entity, count=None, run_checks=True):
+        """
+        Args:
+            count (int, optional): For stacks, only remove this many.
+
+        Returns:
+            entity (AthanorItem): What was removed. For partial removals, a new stack split off
+                from the carried one.
+        """
         if run_checks:
             self.can_remove(entity)
         inv = entity.inventory_location
-        inv.remove(entity)
-        self.contents.remove(entity)
+        return inv.remove(entity, count=count)
 
 
 class EquipRequest(object):
@@ -181,7 +208,7 @@ class GearHandler(object):
     def can_equip(self, entity):
         if entity in self.contents:
             raise ValueError(f"{entity} is already equipped by {self.owner}!")
-        if entity not in self.owner.items.contents:
+        if not self.owner.items.is_carrying(entity):
             raise ValueError(f"{self.owner} is not carrying {entity}!")
         entity.inventory_location.can_remove(entity)
 
@@ -220,13 +247,40 @@ class MapHandler(object):
         self.rooms = dict()
         self.gateways = dict()
         self.areas = dict()
+        self.plugin = None
         self.loaded = False
+        self._graph = None
+        # Gateways elsewhere which have resolved their destination into this map.
+        self.inbound = weakref.WeakSet()
+
+    @property
+    def graph(self):
+        """
+        The MapGraph used for route finding, built on first use.
+        """
+        if self._graph is None:
+            if not self.loaded:
+                self.load()
+            self._graph = MapGraph(self, landmarks=settings.ENTITY_PATH_LANDMARKS,
+                                   hot_queries=settings.ENTITY_PATH_HOT_QUERIES,
+                                   budget=settings.ENTITY_PATH_LANDMARK_BUDGET)
+        return self._graph
+
+    def invalidate_paths(self):
+        """
+        Throws away the route finding graph. Call this whenever rooms or exits change.
+        """
+        self._graph = None
+
+    def find_path(self, start, goal, traverser=None):
+        return self.graph.find_path(start, goal, traverser)
 
     def get_room(self, room_key):
         if not self.loaded:
             self.load()
         return self.rooms.get(room_key, None)
 
+    @instrumented('map_load', lambda self: self.owner)
     def load(self):
         if self.loaded:
             return
@@ -238,6 +292,7 @@ class MapHandler(object):
         if not (inst := plugin.maps.get(bri.map_key, None)):
             raise ValueError(
                 f"Cannot load {self.owner} map data: {bri.plugin}/{bri.map_key} map not found.")
+        self.plugin = bri.plugin
 
         inst_data = inst.get('map', dict())
 
@@ -258,10 +313,180 @@ class MapHandler(object):
 
         self.loaded = True
 
+    def patch(self, map_data):
+        """
+        Brings a loaded map in line with new map data, in place. Rooms, exits, areas and gateways
+        are updated, added or removed, and everything in the map stays where it is. Whatever is in
+        a room which no longer exists is sent to settings.ENTITY_DEFAULT_HOME.
+
+        Args:
+            map_data (dict): The map's new prepared data, as per the controller's prepare_map.
+
+        Returns:
+            changes (dict): How many rooms were 'updated', 'added', 'replaced' (their class changed)
+                and 'removed'.
+        """
+        changes = defaultdict(int)
+        if not self.loaded:
+            return changes
+
+        for kind, current in (('areas', self.areas), ('gateways', self.gateways)):
+            new_data = map_data.get(kind, dict())
+            for key in [key for key in current if key not in new_data]:
+                del current[key]
+            for key, data in new_data.items():
+                if (found := current.get(key, None)) is not None and found.__class__ is data.get('class'):
+                    found.update_data(data)
+                else:
+                    current[key] = data.get('class')(key, self, data)
+
+        gone, added, rewired = list(), list(), list()
+        new_rooms = map_data.get('rooms', dict())
+        for key, room in list(self.rooms.items()):
+            if key not in new_rooms:
+                gone.append(room)
+                del self.rooms[key]
+                changes['removed'] += 1
+        for key, data in new_rooms.items():
+            if (room := self.rooms.get(key, None)) is not None and room.__class__ is data.get('class'):
+                if room.update_data(data):
+                    rewired.append(room)
+                changes['updated'] += 1
+                continue
+            if room is not None:
+                gone.append(room)
+                changes['replaced'] += 1
+            else:
+                changes['added'] += 1
+            self.rooms[key] = data.get('class')(key, self, data)
+            added.append(self.rooms[key])
+
+        for room in gone:
+            room.clear_exits()
+            room.set_area(None)
+            GLOBAL_SCRIPTS.entity.ndb.ticks.unschedule(room)
+        for room in rewired:
+            room.reload_exits()
+        for room in added:
+            room.load_exits()
+
+        # Exits into rooms that were replaced or removed are pointed at whatever has that key now.
+        for room in self.rooms.values():
+            for ex in room.room_exits:
+                if ex.gateway is not None:
+                    ex.gateway = self.gateways.get(ex.gateway.unique_key, None)
+                    if ex.gateway:
+                        ex.gateway.exits[ex] = ex.db_destination
+                elif ex.db_destination is not None and self.rooms.get(ex.destination_key, None) is not ex.db_destination:
+                    ex.db_destination = None
+            room.invalidate_visibility()
+
+        for room in gone:
+            if (occupants := [ent for ent in room.entities if not hasattr(ent, 'unique_key')]):
+                LocationHandler.set_many(occupants, self.rooms.get(room.unique_key, None) or settings.ENTITY_DEFAULT_HOME)
+
+        self.invalidate_paths()
+        return changes
+
+    def unload(self):
+        """
+        Throws away every room, exit, area and gateway, such as when the map was removed from its
+        plugin's data. Whatever was in the map is sent to settings.ENTITY_DEFAULT_HOME.
+        """
+        if not self.loaded:
+            return
+        self.patch(dict())
+        self.forget_inbound()
+        self.areas.clear()
+        self.gateways.clear()
+        self._graph = None
+        self.loaded = False
+
+    def forget_inbound(self):
+        """
+        Makes every gateway leading into this map resolve its destination again. Call this when
+        the map is unloaded.
+        """
+        for gateway in list(self.inbound):
+            gateway.forget_destination()
+        self.inbound.clear()
+
     def save(self):
         pass
 
 
+class OccupancyHandler(object):
+    """
+    Maintains occupancy counters for a room, area or map owner. LocationHandler keeps these
+    up to date as entities move and get (un)puppeted, so that all queries here are O(1).
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.total = 0
+        self.classes = defaultdict(int)
+        self.puppets = set()
+
+    def add(self, entity):
+        self.total += 1
+        self.classes[entity.__class__] += 1
+        if entity.has_account:
+            self.puppets.add(entity)
+
+    def add_many(self, entities):
+        for entity in entities:
+            self.add(entity)
+
+    def remove(self, entity):
+        self.total -= 1
+        ent_class = entity.__class__
+        self.classes[ent_class] -= 1
+        if self.classes[ent_class] <= 0:
+            del self.classes[ent_class]
+        self.puppets.discard(entity)
+
+    def remove_many(self, entities):
+        for entity in entities:
+            self.remove(entity)
+
+    def add_puppet(self, entity):
+        self.puppets.add(entity)
+
+    def remove_puppet(self, entity):
+        self.puppets.discard(entity)
+
+    @property
+    def puppeted(self):
+        return len(self.puppets)
+
+    def count(self, entity_class=None):
+        """
+        Args:
+            entity_class (type or None): If provided, only count entities of exactly this class.
+
+        Returns:
+            count (int)
+        """
+        if entity_class is None:
+            return self.total
+        return self.classes.get(entity_class, 0)
+
+    def has_puppets(self):
+        return bool(self.puppets)
+
+    def msg(self, text, exclude=None, from_obj=None, mapping=None, batch=False, **kwargs):
+        """
+        Messages every puppet counted here. See controllers.broadcast.broadcast for arguments.
+
+        Returns:
+            count (int): How many puppets were sent to.
+        """
+        if not self.puppets:
+            return 0
+        return broadcast(self.puppets, text, exclude=exclude, from_obj=from_obj, mapping=mapping, batch=batch,
+                         **kwargs)
+
+
 class LocationHandler(object):
 
     def __init__(self, owner):
@@ -277,6 +502,30 @@ class LocationHandler(object):
             return None
         return self.room.handler.owner
 
+    @staticmethod
+    def occupancy_levels(room, other=None):
+        """
+        Gathers the OccupancyHandlers of a room, its area and its map owner, skipping
+        any level that `other` shares with it. Used to figure out which counters an
+        entity enters or leaves when it moves from `other` to `room` (or vice versa).
+
+        Args:
+            room (AthanorRoom or None): The room to gather levels for.
+            other (AthanorRoom or None): The room on the other side of the move.
+
+        Returns:
+            levels (list of OccupancyHandler)
+        """
+        if not room:
+            return list()
+        levels = [room.occupancy]
+        area = getattr(room, 'area', None)
+        if area and (not other or getattr(other, 'area', None) != area):
+            levels.append(area.occupancy)
+        if not other or other.handler.owner != room.handler.owner:
+            levels.append(room.handler.owner.occupancy)
+        return levels
+
     def set(self, room, save=True):
         if isinstance(room, str):
             room = GLOBAL_SCRIPTS.entity.resolve_room_path(room)
@@ -287,6 +536,8 @@ class LocationHandler(object):
             return
         old_room = self.room
         if old_room:
+            for occupancy in self.occupancy_levels(old_room, room):
+                occupancy.remove(self.owner)
             old_room.entities.remove(self.owner)
             old_room.at_unregister_entity(self.owner)
             if not room or room.handler.owner != old_room.handler.owner:
@@ -294,14 +545,100 @@ class LocationHandler(object):
                 old_room.handler.owner.at_unregister_entity(self.owner)
         self.room = room
         if room:
-            if not old_room or old_room.map != room.map:
+            for occupancy in self.occupancy_levels(room, old_room):
+                occupancy.add(self.owner)
+            if not old_room or old_room.handler.owner != room.handler.owner:
                 room.handler.owner.entities.add(self.owner)
                 room.handler.owner.at_register_entity(self.owner)
             room.entities.add(self.owner)
             room.at_register_entity(self.owner)
         if room and save and room.fixed:
             self.save()
+        self.owner.at_location_change(old_room, room)
+
+    def set_puppeted(self, puppeted):
+        """
+        Called by the puppet hooks to keep the puppet counters of the current room,
+        area and map up to date.
+
+        Args:
+            puppeted (bool): Whether the owner is now puppeted or not.
+        """
+        for occupancy in self.occupancy_levels(self.room):
+            if puppeted:
+                occupancy.add_puppet(self.owner)
+            else:
+                occupancy.remove_puppet(self.owner)
+
+    @classmethod
+    def set_many(cls, entities, room, save=True):
+        """
+        Relocates a whole group of entities at once. Entities are grouped by their
+        current room so that every room and map owner involved has its entity sets
+        updated in bulk and its aggregate (un)register hooks called only once.
+
+        Args:
+            entities (iterable): The entities to relocate.
+            room (AthanorRoom or str or None): Where they're going. Strings are resolved
+                as per LocationHandler.set().
+            save (bool): Whether to save the new location of persistent entities.
+
+        Returns:
+            moved (dict): A dictionary of old_room -> list of entities which were moved
+                out of it. old_room may be None.
+        """
+        if isinstance(room, str):
+            room = GLOBAL_SCRIPTS.entity.resolve_room_path(room)
+        if room and not hasattr(room, 'map'):
+            return dict()
+        new_owner = room.handler.owner if room else None
+
+        moved = defaultdict(list)
+        for entity in entities:
+            old_room = entity.locations.room
+            if room and old_room == room:
+                continue
+            moved[old_room].append(entity)
+
+        arrived_map = list()
+        for old_room, group in moved.items():
+            if not old_room:
+                arrived_map.extend(group)
+                continue
+            for occupancy in cls.occupancy_levels(old_room, room):
+                occupancy.remove_many(group)
+            old_room.entities.difference_update(group)
+            old_room.at_unregister_entities(group)
+            old_owner = old_room.handler.owner
+            if old_owner != new_owner:
+                old_owner.entities.difference_update(group)
+                old_owner.at_unregister_entities(group)
+                arrived_map.extend(group)
+
+        for group in moved.values():
+            for entity in group:
+                entity.locations.room = room
 
+        if room:
+            for old_room, group in moved.items():
+                for occupancy in cls.occupancy_levels(room, old_room):
+                    occupancy.add_many(group)
+            if arrived_map:
+                new_owner.entities.update(arrived_map)
+                new_owner.at_register_entities(arrived_map)
+            arrivals = [entity for group in moved.values() for entity in group]
+            if arrivals:
+                room.entities.update(arrivals)
+                room.at_register_entities(arrivals)
+                if save and room.fixed:
+                    for entity in arrivals:
+                        entity.locations.save()
+        for old_room, group in moved.items():
+            for entity in group:
+                entity.at_location_change(old_room, room)
+        return moved
+
+    @instrumented('location_save', lambda self: self.room)
     def save(self, name="logout"):
         if not self.owner.persistent:
             return
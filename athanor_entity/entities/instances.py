@@ -0,0 +1,149 @@
+"""
+Instanced maps: many runtime copies of one map, such as a dungeon every party gets its own run of.
+
+A map's prepared data is compiled once into a MapBlueprint, which every instance of it shares
+read-only. An instance starts out with only its areas and gateways; rooms are built the first time
+something asks for them (someone walks in, a reset spawns there, an exit is looked through), so an
+instance costs next to nothing until it's used and never builds the parts nobody visits.
+
+Route finding and hearing use the blueprint's shared MapTopology, so they don't build rooms either.
+Once anything changes an instance's exits (invalidate_paths), it's copied on write: the instance
+builds the rest of its rooms and gets a graph of its own.
+
+Instances are runtime entities. They aren't saved, nor part of cross-map routing.
+"""
+from django.conf import settings
+
+from evennia import GLOBAL_SCRIPTS
+from evennia.utils.utils import lazy_property, class_from_module
+
+from athanor_entity.entities.base import AthanorGameEntity
+from athanor_entity.entities.handlers import MapHandler
+from athanor_entity.entities.paths import MapGraph, MapTopology
+
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_INSTANCE"]]
+MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
+
+
+class MapBlueprint(object):
+    """
+    A compiled map, as shared by all of its instances.
+    """
+
+    def __init__(self, plugin_key, map_key, map_data):
+        self.plugin = plugin_key
+        self.map_key = map_key
+        self.data = map_data
+        self.rooms = map_data.get('rooms', dict())
+        self._topology = None
+
+    def __str__(self):
+        return f"{self.plugin}/{self.map_key}"
+
+    @property
+    def topology(self):
+        if self._topology is None:
+            self._topology = MapTopology.from_data(self.data)
+        return self._topology
+
+
+class InstanceMapHandler(MapHandler):
+
+    def __init__(self, owner, blueprint, populate=True):
+        MapHandler.__init__(self, owner)
+        self.blueprint = blueprint
+        self.plugin = blueprint.plugin
+        # Whether rooms spawn their items and mobiles as they're built.
+        self.populate = populate
+        # Set once this instance's exits no longer match its blueprint's.
+        self.modified = False
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            if not self.loaded:
+                self.load()
+            if self.modified:
+                self.materialize_all()
+            self._graph = MapGraph(self, landmarks=settings.ENTITY_PATH_LANDMARKS,
+                                   hot_queries=settings.ENTITY_PATH_HOT_QUERIES,
+                                   budget=settings.ENTITY_PATH_LANDMARK_BUDGET,
+                                   topology=None if self.modified else self.blueprint.topology)
+        return self._graph
+
+    def invalidate_paths(self):
+        self.modified = True
+        self._graph = None
+
+    def get_room(self, room_key):
+        if not self.loaded:
+            self.load()
+        if (found := self.rooms.get(room_key, None)) is None and room_key in self.blueprint.rooms:
+            found = self.materialize(room_key)
+        return found
+
+    def materialize(self, room_key):
+        """
+        Builds one room of this instance, with its exits.
+
+        Returns:
+            room (AthanorRoom)
+        """
+        room_data = self.blueprint.rooms[room_key]
+        room = room_data.get('class')(room_key, self, room_data)
+        # Nothing in an instance outlives it, so nobody's location is ever saved here.
+        room.fixed = False
+        self.rooms[room_key] = room
+        room.load_exits()
+        if self._graph is not None:
+            self._graph.neighborhoods.clear()
+        if self.populate:
+            room.load_items()
+            room.load_mobiles()
+        return room
+
+    def materialize_all(self):
+        for room_key in self.blueprint.rooms:
+            if room_key not in self.rooms:
+                self.materialize(room_key)
+
+    def load(self):
+        if self.loaded:
+            return
+        for area_key, area_data in self.blueprint.data.get('areas', dict()).items():
+            self.areas[area_key] = area_data.get('class')(area_key, self, area_data)
+        for gateway_key, gateway_data in self.blueprint.data.get('gateways', dict()).items():
+            self.gateways[gateway_key] = gateway_data.get('class')(gateway_key, self, gateway_data)
+        self.loaded = True
+
+    def unload(self):
+        """
+        Throws away every room, exit, area and gateway. Called when the instance is destroyed.
+        """
+        self.forget_inbound()
+        ticks = GLOBAL_SCRIPTS.entity.ndb.ticks
+        for room in self.rooms.values():
+            ticks.unschedule(room)
+        self.rooms.clear()
+        self.areas.clear()
+        self.gateways.clear()
+        self._graph = None
+        self.loaded = False
+
+
+class AthanorInstance(*MIXINS, AthanorGameEntity):
+    """
+    The owner of an instanced map. Create and destroy these through the entity controller's
+    create_instance() and destroy_instance().
+    """
+    snapshot_restore = False
+
+    def __init__(self, instance_key, blueprint, data):
+        AthanorGameEntity.__init__(self, data)
+        self.instance_key = instance_key
+        self.blueprint = blueprint
+        self.populate = data.get('populate', True)
+
+    @lazy_property
+    def map(self):
+        return InstanceMapHandler(self, self.blueprint, populate=self.populate)
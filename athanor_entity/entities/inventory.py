@@ -23,22 +23,48 @@ class Inventory(HasLocks):
         self.equipped = set()
         self.slots = defaultdict(dict)
         self.prototype_index = defaultdict(set)
+        # Stackable items are indexed by their stack_key, so that identical ones merge.
+        self.stacks = dict()
+        self.stack_keys = dict()
         self.weight = 0
         self.db_lock_storage = self.lockstring
 
     def __str__(self):
         return self.name
 
+    def can_add(self, entity):
+        pass
+
+    def can_remove(self, entity):
+        pass
+
     def at_before_add(self, entity):
         pass
 
     def add(self, entity, sort_index=None):
+        """
+        Args:
+            entity (AthanorItem): The item to add.
+
+        Returns:
+            entity (AthanorItem): What now holds it. A stackable item merges into an identical stack
+                already here, if there is one, and should be discarded by the caller.
+        """
         if entity in self.contents:
             raise ValueError(f"{entity} is already in {self.handler.owner}'s {self} inventory!")
         self.at_before_add(entity)
+        if getattr(entity, 'stackable', False):
+            key = entity.stack_key
+            if (stack := self.stacks.get(key, None)) is not None:
+                stack.merge(entity)
+                self.at_after_add(stack)
+                return stack
+            self.stacks[key] = entity
+            self.stack_keys[entity] = key
         self.contents.add(entity)
         entity.inventory_location = self
         self.at_after_add(entity)
+        return entity
 
     def at_after_add(self, entity):
         pass
@@ -46,16 +72,50 @@ class Inventory(HasLocks):
     def at_before_remove(self, entity):
         pass
 
-    def remove(self, entity):
+    def remove(self, entity, count=None):
+        """
+        Args:
+            entity (AthanorItem): The item to remove.
+            count (int, optional): For stacks, how many to take. The rest stay behind.
+
+        Returns:
+            entity (AthanorItem): What was removed: the item itself, or a new stack split off it.
+        """
         if entity not in self.contents:
             raise ValueError(f"{entity} is not in {self.handler.owner}'s {self} inventory!")
         self.at_before_remove(entity)
+        if count is not None and getattr(entity, 'stackable', False) and count < entity.stack_count:
+            removed = entity.split(count)
+            self.at_after_remove(removed)
+            return removed
         self.contents.remove(entity)
+        if (key := self.stack_keys.pop(entity, None)) is not None:
+            del self.stacks[key]
         entity.inventory_location = None
         self.at_after_remove(entity)
+        return entity
 
     def at_after_remove(self, entity):
         pass
 
+    def update(self, entity):
+        """
+        Called via at_entity_change when something about a carried item changes. Stacks are
+        re-keyed, and merged if they've become identical to another stack here.
+        """
+        if (old_key := self.stack_keys.get(entity, None)) is None:
+            return
+        if (key := entity.stack_key) == old_key:
+            return
+        del self.stacks[old_key]
+        if (stack := self.stacks.get(key, None)) is not None:
+            del self.stack_keys[entity]
+            self.contents.remove(entity)
+            entity.inventory_location = None
+            stack.merge(entity)
+            return
+        self.stacks[key] = entity
+        self.stack_keys[entity] = key
+
     def all(self):
         return list(self.contents)
@@ -3,12 +3,71 @@ from evennia.utils.utils import class_from_module
 from athanor_entity.entities.base import AthanorGameEntity
 
 
-MIXINS = []
-
-for mixin in settings.MIXINS["ENTITY_ITEM"]:
-    MIXINS.append(class_from_module(mixin))
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_ITEM"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
-class AthanorItem(AthanorGameEntity):
-    pass
+class AthanorItem(*MIXINS, AthanorGameEntity):
+    """
+    Stackable items (such as arrows or coins) represent any number of identical items with a single
+    entity and a stack_count. Inventories merge identical stacks as they're added and split them on
+    partial removal.
+    """
+    stackable = False
+
+    def __init__(self, data):
+        AthanorGameEntity.__init__(self, data)
+        self.stackable = data.get('stackable', self.stackable)
+        self.stack_count = data.get('count', 1)
+
+    def snapshot_state(self):
+        state = AthanorGameEntity.snapshot_state(self)
+        state['stackable'] = self.stackable
+        state['count'] = self.stack_count
+        return state
+
+    def stack_state(self):
+        """
+        Everything which must be identical for two items to stack. Sub-classes with more state that
+        matters should extend this.
+
+        Returns:
+            state (tuple): Must be hashable.
+        """
+        return (self.db_key, self.db_lock_storage, tuple(sorted(self.tags.all(return_key_and_category=True), key=str)),
+                repr(sorted(self.attributes.export(), key=lambda x: (x[0], str(x[2])))))
+
+    @property
+    def stack_key(self):
+        # The state itself rather than its hash, so that inventories' dict lookups compare it for
+        # equality and items whose states merely hash alike never merge.
+        return self.__class__, self.template, self.stack_state()
+
+    def merge(self, other):
+        """
+        Absorbs another stack. The other entity is left empty and should be discarded.
+        """
+        self.stack_count += other.stack_count
+        other.stack_count = 0
+
+    def split(self, count):
+        """
+        Splits some items off this stack into a new one.
+
+        Args:
+            count (int): How many to split off. Must be less than the stack's count.
+
+        Returns:
+            stack (AthanorItem): The new stack. It isn't in any inventory.
+        """
+        if not 0 < count < self.stack_count:
+            raise ValueError(f"Cannot split {count} off a stack of {self.stack_count} {self}!")
+        state = self.snapshot_state()
+        state['count'] = count
+        self.stack_count -= count
+        return self.__class__(state)
+
+    def get_numbered_name(self, count, looker, **kwargs):
+        # A stack counts for as many items as it holds, and is never "an arrow" when it's 2000 of them.
+        singular, plural = AthanorGameEntity.get_numbered_name(self, count * self.stack_count, looker, **kwargs)
+        return (plural if self.stack_count > 1 else singular), plural
@@ -0,0 +1,333 @@
+"""
+In-memory stand-ins for Evennia's DB-backed handlers, for entities which have no database row.
+
+They implement the same API as the handlers in evennia.typeclasses.tags and
+evennia.typeclasses.attributes, so code written against obj.tags, obj.aliases, obj.permissions,
+obj.attributes or obj.db works on runtime entities without ever touching the tag or attribute
+tables. Everything is indexed by category, and keys and categories are normalized exactly as
+Evennia does (stripped and lowercased, with None as a category of its own).
+"""
+from collections import defaultdict
+from copy import deepcopy
+
+from evennia.utils.utils import make_iter
+
+
+def _normalize(value):
+    return value.strip().lower() if value else None
+
+
+# Attribute values of these types can be shared between entities instead of copied.
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+class MemoryTagHandler(object):
+    _tagtype = None
+
+    def __init__(self, obj):
+        self.obj = obj
+        # category -> key -> data
+        self._tags = defaultdict(dict)
+
+    def __str__(self):
+        return ",".join(self.all())
+
+    def reset_cache(self):
+        pass
+
+    def has(self, tag=None, category=None, return_list=False):
+        """
+        Checks if the given tag(s) are set, in the given category.
+
+        Returns:
+            has (bool or list): One bool per tag given, or a single bool if only one was given.
+        """
+        found = self._tags.get(_normalize(category), dict())
+        result = [_normalize(key) in found for key in make_iter(tag)]
+        return result[0] if len(result) == 1 and not return_list else result
+
+    def get(self, key=None, default=None, category=None, return_tagobj=False, return_list=False):
+        """
+        Retrieves tag(s). With no key, returns every tag in the category.
+
+        Returns:
+            tags (str, list or None): A single match, a list of several, or default if none.
+                return_tagobj gets (key, category, data) tuples instead of keys.
+        """
+        category = _normalize(category)
+        found = self._tags.get(category, dict())
+        keys = list(found.keys()) if key is None else [k for k in map(_normalize, make_iter(key)) if k in found]
+        if return_tagobj:
+            result = [(k, category, found[k]) for k in keys]
+        else:
+            result = keys
+        if return_list:
+            return result if result else ([default] if default is not None else [])
+        if not result:
+            return default
+        return result[0] if len(result) == 1 else result
+
+    def add(self, tag=None, category=None, data=None):
+        if not tag:
+            return
+        category = _normalize(category)
+        for key in make_iter(tag):
+            if (key := _normalize(str(key))):
+                self._tags[category][key] = data
+
+    def batch_add(self, *args):
+        """
+        Args:
+            *args: Tags as strings, or tuples of (tag, category) or (tag, category, data).
+        """
+        for entry in args:
+            if isinstance(entry, str):
+                self.add(entry)
+            else:
+                self.add(*entry)
+
+    def remove(self, key=None, category=None):
+        category = _normalize(category)
+        if not (found := self._tags.get(category, None)):
+            return
+        if key is None:
+            del self._tags[category]
+            return
+        for k in make_iter(key):
+            found.pop(_normalize(k), None)
+        if not found:
+            del self._tags[category]
+
+    def clear(self, category=None):
+        """
+        Removes all tags, or only those in one category if given.
+        """
+        if category is None:
+            self._tags.clear()
+        else:
+            self._tags.pop(_normalize(category), None)
+
+    def all(self, return_key_and_category=False, return_objs=False):
+        """
+        Returns:
+            tags (list): Every tag key, or (key, category) tuples, or (key, category, data) tuples
+                if return_objs.
+        """
+        if return_objs:
+            return [(k, cat, data) for cat, found in self._tags.items() for k, data in found.items()]
+        if return_key_and_category:
+            return [(k, cat) for cat, found in self._tags.items() for k in found]
+        return [k for found in self._tags.values() for k in found]
+
+    def categories(self):
+        return list(self._tags.keys())
+
+    def copy_from(self, other):
+        """
+        Replaces every tag with those of another MemoryTagHandler, which are already normalized.
+        """
+        self._tags = defaultdict(dict, {cat: dict(found) for cat, found in other._tags.items()})
+
+
+class MemoryAliasHandler(MemoryTagHandler):
+    _tagtype = "alias"
+
+
+class MemoryPermissionHandler(MemoryTagHandler):
+    _tagtype = "permission"
+
+    def check(self, *permissions, require_all=False):
+        """
+        Checks permissions the same way Evennia's PermissionHandler does: superusers pass
+        everything, otherwise each permission is looked up directly.
+        """
+        if getattr(self.obj, 'is_superuser', False):
+            return True
+        found = [self.has(perm) for perm in permissions]
+        return all(found) if require_all else any(found)
+
+
+class MemoryAttribute(object):
+    """
+    What MemoryAttributeHandler returns when asked for attribute objects instead of values.
+    """
+    __slots__ = ('key', 'category', 'value', 'strvalue', 'lock_storage')
+
+    def __init__(self, key, category, value, strvalue=False, lock_storage=""):
+        self.key = key
+        self.category = category
+        self.value = value
+        self.strvalue = strvalue
+        self.lock_storage = lock_storage
+
+    def __repr__(self):
+        return f"<MemoryAttribute {self.key}({self.category})>"
+
+
+class MemoryAttributeHandler(object):
+    """
+    A dict-backed AttributeHandler.
+
+    Changes can optionally be tracked per key, so that something wanting to persist or snapshot a
+    few hot fields only has to look at what changed. Like Evennia's handler (without its saver
+    wrappers), in-place mutation of a stored dict or list isn't noticed; add() it again or
+    mark_dirty() it.
+    """
+    _attrtype = None
+
+    def __init__(self, obj):
+        self.obj = obj
+        # category -> key -> MemoryAttribute
+        self._attrs = defaultdict(dict)
+        self.tracked = set()
+        self.dirty = set()
+
+    def reset_cache(self):
+        pass
+
+    def _lookup(self, key, category):
+        return self._attrs.get(_normalize(category), dict()).get(_normalize(key), None)
+
+    def has(self, key=None, category=None):
+        result = [self._lookup(k, category) is not None for k in make_iter(key)]
+        return result[0] if len(result) == 1 else result
+
+    def get(self, key=None, default=None, category=None, return_obj=False, strattr=False,
+            raise_exception=False, accessing_obj=None, default_access=True, return_list=False):
+        """
+        Retrieves attribute value(s). With no key, returns every attribute in the category.
+
+        Returns:
+            value (any or list): One value, a list of values if several keys were asked for, or
+                default for anything not found. return_obj gets MemoryAttributes instead.
+        """
+        if key is None:
+            found = list(self._attrs.get(_normalize(category), dict()).values())
+        else:
+            found = list()
+            for k in make_iter(key):
+                if (attr := self._lookup(k, category)) is None:
+                    if raise_exception:
+                        raise AttributeError(f"{self.obj} has no attribute {k}")
+                    found.append(None)
+                else:
+                    found.append(attr)
+        if accessing_obj:
+            found = [attr for attr in found if attr is None or not attr.lock_storage
+                     or self._access(attr, accessing_obj, default_access)]
+        if return_obj:
+            result = found
+        else:
+            result = [default if attr is None else attr.value for attr in found]
+        if return_list:
+            return result
+        if not result:
+            return default
+        return result[0] if len(result) == 1 else result
+
+    def _access(self, attr, accessing_obj, default_access):
+        from evennia.locks.lockhandler import LockHandler
+        return LockHandler(attr).check(accessing_obj, "attrread", default=default_access)
+
+    def add(self, key, value, category=None, lockstring="", strattr=False, accessing_obj=None,
+            default_access=True):
+        category, key = _normalize(category), _normalize(key)
+        if not key:
+            return
+        self._attrs[category][key] = MemoryAttribute(key, category, value, strattr, lockstring)
+        if (key, category) in self.tracked:
+            self.dirty.add((key, category))
+
+    def batch_add(self, *args, **kwargs):
+        """
+        Args:
+            *args: Tuples of (key, value), (key, value, category) or (key, value, category, lockstring).
+        """
+        for entry in args:
+            self.add(*entry, **kwargs)
+
+    def remove(self, key=None, category=None, raise_exception=False, accessing_obj=None,
+               default_access=True, **kwargs):
+        category = _normalize(category)
+        if not (found := self._attrs.get(category, None)):
+            if raise_exception:
+                raise AttributeError(f"{self.obj} has no attributes in category {category}")
+            return
+        keys = list(found.keys()) if key is None else [_normalize(k) for k in make_iter(key)]
+        for k in keys:
+            if found.pop(k, None) is None:
+                if raise_exception:
+                    raise AttributeError(f"{self.obj} has no attribute {k}")
+            elif (k, category) in self.tracked:
+                self.dirty.add((k, category))
+        if not found:
+            del self._attrs[category]
+
+    def clear(self, category=None, accessing_obj=None, default_access=True):
+        if category is None:
+            categories = list(self._attrs.keys())
+        else:
+            categories = [_normalize(category)]
+        for cat in categories:
+            for k in self._attrs.pop(cat, dict()):
+                if (k, cat) in self.tracked:
+                    self.dirty.add((k, cat))
+
+    def all(self, accessing_obj=None, default_access=True):
+        """
+        Returns:
+            attributes (list): Every MemoryAttribute, across all categories.
+        """
+        return [attr for found in self._attrs.values() for attr in found.values()]
+
+    def copy_from(self, other):
+        """
+        Replaces every attribute with a copy of another MemoryAttributeHandler's. Mutable values
+        are deep-copied so that the two don't share them.
+        """
+        self._attrs = defaultdict(dict)
+        for category, found in other._attrs.items():
+            self._attrs[category] = {
+                key: MemoryAttribute(key, category, attr.value if isinstance(attr.value, _IMMUTABLE)
+                                     else deepcopy(attr.value), attr.strvalue, attr.lock_storage)
+                for key, attr in found.items()}
+
+    def track(self, key, category=None):
+        """
+        Starts recording changes to an attribute.
+        """
+        self.tracked.add((_normalize(key), _normalize(category)))
+
+    def untrack(self, key, category=None):
+        entry = (_normalize(key), _normalize(category))
+        self.tracked.discard(entry)
+        self.dirty.discard(entry)
+
+    def mark_dirty(self, key, category=None):
+        self.dirty.add((_normalize(key), _normalize(category)))
+
+    def pop_dirty(self):
+        """
+        Collects what changed since the last call. Removed attributes come back as deleted.
+
+        Returns:
+            changes (dict): (key, category) -> current value, or DELETED.
+        """
+        changes = dict()
+        for key, category in self.dirty:
+            attr = self._attrs.get(category, dict()).get(key, None)
+            changes[(key, category)] = DELETED if attr is None else attr.value
+        self.dirty = set()
+        return changes
+
+    def export(self):
+        """
+        Returns:
+            attributes (list): (key, value, category, lockstring) tuples, suitable for batch_add.
+        """
+        return [(attr.key, attr.value, attr.category, attr.lock_storage) for attr in self.all()]
+
+
+# Marks removed attributes in MemoryAttributeHandler.pop_dirty().
+DELETED = object()
+
@@ -1,13 +1,32 @@
 from django.conf import settings
 from evennia.utils.utils import class_from_module
+from evennia import GLOBAL_SCRIPTS
 from athanor_entity.entities.base import AthanorGameEntity
+from athanor_entity.entities.components import component_fields
 
-MIXINS = []
-
-for mixin in settings.MIXINS["ENTITY_MOBILE"]:
-    MIXINS.append(class_from_module(mixin))
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_MOBILE"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
 class AthanorMobile(*MIXINS, AthanorGameEntity):
-    pass
+
+    def __init__(self, data):
+        AthanorGameEntity.__init__(self, data)
+        self.component_stores = dict()
+        for field in component_fields(self.__class__):
+            if not (store := self.component_stores.get(field.store, None)):
+                store = GLOBAL_SCRIPTS.entity.get_component_store(field.store)
+                self.component_stores[field.store] = store
+            store.add_column(field.name, field.dtype, field.default)
+        for store in self.component_stores.values():
+            store.register(self, data)
+        self.tick_interval = data.get('tick_interval', self.tick_interval)
+        if self.tick_interval:
+            GLOBAL_SCRIPTS.entity.ndb.ticks.schedule(self)
+
+    def snapshot_state(self):
+        state = AthanorGameEntity.snapshot_state(self)
+        state['tick_interval'] = self.tick_interval
+        for field in component_fields(self.__class__):
+            state[field.name] = getattr(self, field.name)
+        return state
@@ -0,0 +1,591 @@
+"""
+Route finding over a map's exits.
+
+Each MapHandler lazily builds a MapGraph: its rooms are numbered and the exits between them are
+packed into CSR arrays (an offsets array indexed by room, pointing into flat arrays of source and
+destination rooms and the exits that lead there), which keeps a 100k room map down to a few MB and makes
+neighbor iteration cheap. Exits through gateways lead off the map, so they aren't edges; they're
+kept aside per room for cross-map routing.
+
+The graph's shape lives in a MapTopology. For an ordinary map it's built from the live rooms, but
+instanced maps share one topology compiled straight from their map data, and resolve rooms and
+exits from it only when a query actually returns them, so that routing doesn't force an instance
+to build rooms nobody has visited.
+
+Queries start out as plain breadth-first searches. Once a map has answered enough queries to be
+considered hot, a handful of landmark rooms are picked and distances to and from each of them are
+precomputed, after which queries run as A* with the landmark (ALT) heuristic and visit a small
+fraction of the rooms. Precomputing walks the whole map twice per landmark (about 1.8s for 8
+landmarks on a 100k room map), so it's done in slices across reactor iterations, never spending more
+than the budget in one go, and queries keep using breadth-first search until it's finished.
+"""
+import heapq
+import time
+from array import array
+from collections import deque
+
+from athanor_entity.mapdata import iter_room_exits
+from athanor_entity.controllers.profiler import instrumented
+
+
+def _open_lock(lockstring):
+    """
+    Whether a lockstring lets everyone traverse, so that the lock check can be skipped entirely.
+    """
+    for lock in (lockstring or "").split(';'):
+        access_type, _, func = lock.partition(':')
+        if access_type.strip() == 'traverse':
+            return func.strip() == 'all()'
+    return True
+
+
+class MapTopology(object):
+    """
+    Room keys, and the exits between those rooms packed into CSR arrays. Once finished it's
+    treated as read-only, so that any number of MapGraphs can share it.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        self.sources = array('l')
+        # The key (in its room's exit data) of the exit behind every edge.
+        self.edge_keys = list()
+        self.locked = set()
+        # Room index -> keys of the exits there which lead through gateways.
+        self.gateways = dict()
+        self.landmarks = None
+
+    def add_edge(self, source, target, exit_key, lockstring):
+        if not _open_lock(lockstring):
+            self.locked.add(len(self.targets))
+        self.targets.append(target)
+        self.sources.append(source)
+        self.edge_keys.append(exit_key)
+
+    def end_room(self):
+        self.offsets.append(len(self.targets))
+
+    def finish(self):
+        # The reversed graph is needed for distances *to* landmarks.
+        count = len(self.keys)
+        degree = [0] * (count + 1)
+        for target in self.targets:
+            degree[target + 1] += 1
+        for i in range(count):
+            degree[i + 1] += degree[i]
+        self.rev_offsets = array('l', degree)
+        self.rev_targets = array('l', bytes(len(self.targets) * self.targets.itemsize))
+        fill = list(degree)
+        for source, target in zip(self.sources, self.targets):
+            self.rev_targets[fill[target]] = source
+            fill[target] += 1
+        return self
+
+    @classmethod
+    def from_data(cls, map_data):
+        """
+        Compiles a topology from prepared map data, as made by the controller's prepare_maps.
+        """
+        gateways = map_data.get('gateways', dict())
+        topology = cls(list(map_data.get('rooms', dict()).keys()))
+        for i, (room_key, room_exits) in enumerate(iter_room_exits(map_data, 'gateway', 'locks')):
+            for exit_key, (gateway, locks) in room_exits:
+                if gateway in gateways:
+                    topology.gateways.setdefault(i, list()).append(exit_key)
+                    continue
+                if (target := topology.index.get(exit_key, None)) is None:
+                    continue
+                topology.add_edge(i, target, exit_key, locks or "")
+            topology.end_room()
+        return topology.finish()
+
+
+class LazyRooms(object):
+    """
+    Stands in for MapGraph.rooms on a shared topology. Rooms are fetched from the handler by key,
+    which builds them on instanced maps.
+    """
+
+    def __init__(self, handler, keys):
+        self.handler = handler
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        return self.handler.get_room(self.keys[i])
+
+    def peek(self, i):
+        """
+        Returns:
+            room (AthanorRoom or None): The room, only if it's already been built.
+        """
+        return self.handler.rooms.get(self.keys[i], None)
+
+
+class LazyIndex(object):
+    """
+    Stands in for MapGraph.index on a shared topology, finding rooms by their unique_key.
+    """
+
+    def __init__(self, handler, index):
+        self.handler = handler
+        self.index = index
+
+    def get(self, room, default=None):
+        if getattr(room, 'handler', None) is not self.handler:
+            return default
+        return self.index.get(room.unique_key, default)
+
+    def __contains__(self, room):
+        return self.get(room) is not None
+
+    def __getitem__(self, room):
+        if (found := self.get(room)) is None:
+            raise KeyError(room)
+        return found
+
+
+class LazyExits(object):
+    """
+    Stands in for MapGraph.edge_exits on a shared topology.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.found = dict()
+
+    def __getitem__(self, edge):
+        if (ex := self.found.get(edge, None)) is None:
+            topology = self.graph.topology
+            ex = self.found[edge] = self.graph.find_exit(topology.sources[edge], topology.edge_keys[edge])
+        return ex
+
+
+class MapGraph(object):
+    # Rooms a landmark walk visits between checks of the time budget.
+    walk_slice = 1024
+
+    def __init__(self, handler, landmarks=8, hot_queries=50, topology=None, budget=0.01):
+        """
+        Args:
+            handler (MapHandler): The map to route over. It must be loaded.
+            landmarks (int): How many landmarks to precompute once the map is hot. 0 disables them.
+            hot_queries (int): How many queries a map must answer before landmarks are built.
+            topology (MapTopology, optional): A shared topology to use instead of building one from
+                the handler's rooms. Its rooms are looked up by key.
+            budget (float): Seconds of landmark precomputation to do per reactor iteration.
+        """
+        self.handler = handler
+        self.landmark_count = landmarks
+        self.hot_queries = hot_queries
+        self.budget = budget
+        self.queries = 0
+        self.landmarks = None
+        # The landmark precomputation in progress, as per landmark_steps().
+        self.landmark_builder = None
+        self.build(topology)
+
+    def build(self, topology=None):
+        self.lazy = topology is not None
+        if self.lazy:
+            self.rooms = LazyRooms(self.handler, topology.keys)
+            self.index = LazyIndex(self.handler, topology.index)
+            self.edge_exits = LazyExits(self)
+            self.gateways = topology.gateways
+        else:
+            topology = self.build_topology()
+        self.topology = topology
+        self.offsets, self.targets, self.sources = topology.offsets, topology.targets, topology.sources
+        self.rev_offsets, self.rev_targets = topology.rev_offsets, topology.rev_targets
+        self.locked = topology.locked
+        # Landmarks only depend on the topology, so graphs sharing one share them too.
+        self.landmarks = topology.landmarks
+        self.neighborhoods = dict()
+
+    def build_topology(self):
+        self.rooms = list(self.handler.rooms.values())
+        self.index = {room: i for i, room in enumerate(self.rooms)}
+        self.edge_exits = list()
+        self.gateways = dict()
+        topology = MapTopology([getattr(room, 'unique_key', i) for i, room in enumerate(self.rooms)])
+
+        for i, room in enumerate(self.rooms):
+            for ex in room.room_exits:
+                if ex.gateway:
+                    self.gateways.setdefault(i, list()).append(ex)
+                    continue
+                if (target := self.index.get(ex.destination, None)) is None:
+                    continue
+                topology.add_edge(i, target, getattr(ex, 'destination_key', None), ex.db_lock_storage)
+                self.edge_exits.append(ex)
+            topology.end_room()
+        return topology.finish()
+
+    def find_exit(self, room_idx, exit_key):
+        for ex in self.rooms[room_idx].room_exits:
+            if ex.destination_key == exit_key:
+                return ex
+        return None
+
+    def __len__(self):
+        return len(self.rooms)
+
+    @property
+    def edges(self):
+        return len(self.targets)
+
+    def _passable(self, edge, traverser, checked):
+        if traverser is None or edge not in self.locked:
+            return True
+        ex = self.edge_exits[edge]
+        if (result := checked.get(ex, None)) is None:
+            result = bool(ex.access(traverser, 'traverse'))
+            checked[ex] = result
+        return result
+
+    def _walk(self, start, offsets, targets, dist):
+        """
+        Unweighted distances from one room index to all others over the given CSR arrays,
+        ignoring locks, filled into dist. Used to precompute landmarks. Yields every walk_slice
+        rooms, so that it can be spread across reactor iterations.
+        """
+        dist[start] = 0
+        queue = deque((start,))
+        visited = 0
+        while queue:
+            node = queue.popleft()
+            step = dist[node] + 1
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                if dist[target] < 0:
+                    dist[target] = step
+                    queue.append(target)
+            visited += 1
+            if visited % self.walk_slice == 0:
+                yield
+
+    def build_landmarks(self, count=None):
+        """
+        Picks landmarks by farthest-point selection and precomputes distances from and to each,
+        all at once. See schedule_landmarks() for doing it in the background.
+
+        Args:
+            count (int, optional): Overrides the number of landmarks set at creation.
+        """
+        for _ in self.landmark_steps(count):
+            pass
+
+    def landmark_steps(self, count=None):
+        """
+        Does the work of build_landmarks() a slice at a time, yielding between slices. Landmarks
+        are only set once it's finished.
+
+        Args:
+            count (int, optional): Overrides the number of landmarks set at creation.
+        """
+        count = self.landmark_count if count is None else count
+        landmarks = list()
+        if not self.rooms or count <= 0:
+            self.landmarks = landmarks
+            return
+        # Distance of every room to its nearest chosen landmark, treating unreachable as far away.
+        size = len(self.rooms)
+        nearest = array('l', [size]) * size
+        candidate = 0
+        for _ in range(min(count, size)):
+            forward = array('l', [-1]) * size
+            yield from self._walk(candidate, self.offsets, self.targets, forward)
+            backward = array('l', [-1]) * size
+            yield from self._walk(candidate, self.rev_offsets, self.rev_targets, backward)
+            landmarks.append((candidate, forward, backward))
+            # The next landmark is the room farthest from all chosen so far.
+            farthest, candidate = -1, 0
+            for i, d in enumerate(forward):
+                if 0 <= d < nearest[i]:
+                    nearest[i] = d
+                if nearest[i] > farthest:
+                    farthest, candidate = nearest[i], i
+                if i % self.walk_slice == 0:
+                    yield
+            if farthest == 0:
+                break
+        self.landmarks = self.topology.landmarks = landmarks
+
+    def schedule_landmarks(self):
+        """
+        Starts precomputing landmarks in the background, a budget's worth per reactor iteration.
+        """
+        if self.landmark_builder is None:
+            # Imported here so that the graph itself can be used (and benchmarked) without Twisted.
+            from twisted.internet import reactor
+            self.landmark_builder = self.landmark_steps()
+            reactor.callLater(0, self.drain_landmarks)
+
+    def drain_landmarks(self):
+        """
+        Works on the landmark precomputation until done or out of time, then reschedules itself.
+        Gives up if the handler has thrown this graph away in the meantime.
+        """
+        if self.landmark_builder is None or self.handler._graph is not self:
+            self.landmark_builder = None
+            return
+        from twisted.internet import reactor
+        start = time.perf_counter()
+        try:
+            for _ in self.landmark_builder:
+                if time.perf_counter() - start > self.budget:
+                    reactor.callLater(0, self.drain_landmarks)
+                    return
+        except Exception:
+            from evennia.utils import logger
+            logger.log_trace(f"Could not precompute landmarks for {self.handler.owner}")
+            # Don't keep trying on every query; plain searches still work.
+            self.landmarks = list()
+        self.landmark_builder = None
+
+    def _heuristic(self, start, goal, active=4):
+        """
+        Builds the landmark heuristic for one query. Only the landmarks giving the tightest bound at
+        the start are used, since evaluating all of them for every visited room costs more than the
+        slightly better estimates save.
+
+        Returns:
+            heuristic (callable): Takes a room index, returns a lower bound on its distance to goal.
+        """
+        bounds = list()
+        for _, forward, backward in self.landmarks:
+            # Triangle inequality, in both directions since exits needn't be two-way.
+            if (lf_goal := forward[goal]) >= 0:
+                bounds.append((max(0, lf_goal - forward[start]) if forward[start] >= 0 else 0,
+                               forward, lf_goal, 1))
+            if (lb_goal := backward[goal]) >= 0:
+                bounds.append((max(0, backward[start] - lb_goal), backward, lb_goal, -1))
+        bounds.sort(key=lambda x: x[0], reverse=True)
+        chosen = [(dist, value, sign) for _, dist, value, sign in bounds[:active]]
+
+        def heuristic(node):
+            best = 0
+            for dist, value, sign in chosen:
+                if (here := dist[node]) >= 0:
+                    estimate = (value - here) * sign
+                    if estimate > best:
+                        best = estimate
+            return best
+
+        return heuristic
+
+    def _unwind(self, parents, goal):
+        path = list()
+        node = goal
+        while (edge := parents[node]) is not None:
+            path.append(self.edge_exits[edge])
+            node = self.sources[edge]
+        path.reverse()
+        return path
+
+    def search(self, start, goals, traverser=None, limit=None):
+        """
+        Breadth-first search from one room index to the nearest of several.
+
+        Args:
+            start (int): Room index to start from.
+            goals (set): Room indexes to stop at.
+            traverser (entity, optional): If given, locked exits are checked against it.
+            limit (int, optional): Give up after this many steps.
+
+        Returns:
+            result (tuple or None): (goal index reached, parents dict) or None if none was reached.
+        """
+        parents = {start: None}
+        if start in goals:
+            return start, parents
+        checked = dict()
+        frontier = [start]
+        depth = 0
+        offsets, targets = self.offsets, self.targets
+        while frontier and (limit is None or depth < limit):
+            depth += 1
+            next_frontier = list()
+            for node in frontier:
+                for edge in range(offsets[node], offsets[node + 1]):
+                    target = targets[edge]
+                    if target in parents or not self._passable(edge, traverser, checked):
+                        continue
+                    parents[target] = edge
+                    if target in goals:
+                        return target, parents
+                    next_frontier.append(target)
+            frontier = next_frontier
+        return None
+
+    def astar(self, start, goal, traverser=None):
+        """
+        A* between two room indexes using the landmark heuristic.
+
+        Returns:
+            parents (dict or None): Edge used to reach each visited room, or None if unreachable.
+        """
+        parents = {start: None}
+        cost = {start: 0}
+        checked = dict()
+        heuristic = self._heuristic(start, goal)
+        # Ties are broken toward the deepest room, which matters a lot on grid-like maps.
+        heap = [(heuristic(start), 0, start)]
+        offsets, targets = self.offsets, self.targets
+        while heap:
+            _, depth, node = heapq.heappop(heap)
+            if node == goal:
+                return parents
+            g = -depth
+            if g > cost[node]:
+                continue
+            step = g + 1
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                if step >= cost.get(target, step + 1) or not self._passable(edge, traverser, checked):
+                    continue
+                cost[target] = step
+                parents[target] = edge
+                heapq.heappush(heap, (step + heuristic(target), -step, target))
+        return None
+
+    def _count_query(self):
+        self.queries += 1
+        if self.landmarks is None and self.topology.landmarks is not None:
+            # Another graph sharing this topology has finished them.
+            self.landmarks = self.topology.landmarks
+        if self.landmarks is None and self.landmark_count and self.queries >= self.hot_queries:
+            self.schedule_landmarks()
+
+    @instrumented('find_path', lambda self: self.handler.owner)
+    def find_path(self, start, goal, traverser=None):
+        """
+        Finds the shortest route between two rooms on this map.
+
+        Args:
+            start (AthanorRoom): Where to start.
+            goal (AthanorRoom): Where to go.
+            traverser (entity, optional): If given, only use exits this entity may traverse.
+
+        Returns:
+            exits (list or None): The exits to walk through in order, or None if there's no route.
+        """
+        if (start_idx := self.index.get(start, None)) is None or (goal_idx := self.index.get(goal, None)) is None:
+            return None
+        self._count_query()
+        if start_idx == goal_idx:
+            return list()
+        if self.landmarks:
+            parents = self.astar(start_idx, goal_idx, traverser)
+        else:
+            found = self.search(start_idx, {goal_idx}, traverser)
+            parents = found[1] if found else None
+        if parents is None:
+            return None
+        return self._unwind(parents, goal_idx)
+
+    def find_nearest(self, start, goals, traverser=None, limit=None):
+        """
+        Finds the route to whichever of several rooms is closest.
+
+        Args:
+            start (AthanorRoom): Where to start.
+            goals (iterable): Candidate AthanorRooms on this map.
+            traverser (entity, optional): If given, only use exits this entity may traverse.
+            limit (int, optional): Maximum number of steps.
+
+        Returns:
+            result (tuple or None): (room reached, list of exits), or None if none are reachable.
+        """
+        if (start_idx := self.index.get(start, None)) is None:
+            return None
+        goal_idx = {self.index[room] for room in goals if room in self.index}
+        if not goal_idx:
+            return None
+        self._count_query()
+        if not (found := self.search(start_idx, goal_idx, traverser, limit)):
+            return None
+        reached, parents = found
+        return self.rooms[reached], self._unwind(parents, reached)
+
+    def distance(self, start, goal, traverser=None):
+        """
+        Returns:
+            steps (int or None): Number of exits between two rooms, or None if there's no route.
+        """
+        path = self.find_path(start, goal, traverser)
+        return None if path is None else len(path)
+
+    def gateway_exits(self):
+        """
+        Returns:
+            exits (list): Every exit on this map which leads through a gateway.
+        """
+        if self.lazy:
+            return [self.find_exit(i, key) for i, keys in self.gateways.items() for key in keys]
+        return [ex for exits in self.gateways.values() for ex in exits]
+
+    def neighborhood(self, room, depth):
+        """
+        Every room within `depth` exits of a room, regardless of locks. Computed once per room and
+        depth, then cached until the graph is rebuilt. On a shared topology, rooms which haven't been
+        built yet are left out (nobody can be in them), and the cache is cleared as rooms get built.
+
+        Returns:
+            rooms (dict): AthanorRoom -> distance, not including the room itself.
+        """
+        if (found := self.neighborhoods.get((room, depth), None)) is not None:
+            return found
+        found = dict()
+        if (start := self.index.get(room, None)) is not None:
+            seen = {start}
+            frontier = [start]
+            offsets, targets = self.offsets, self.targets
+            room_at = self.rooms.peek if self.lazy else self.rooms.__getitem__
+            for distance in range(1, depth + 1):
+                next_frontier = list()
+                for node in frontier:
+                    for edge in range(offsets[node], offsets[node + 1]):
+                        if (target := targets[edge]) not in seen:
+                            seen.add(target)
+                            next_frontier.append(target)
+                            if (other := room_at(target)) is not None:
+                                found[other] = distance
+                frontier = next_frontier
+        self.neighborhoods[(room, depth)] = found
+        return found
+
+    def audience(self, room, depth, puppets):
+        """
+        Groups the puppets within earshot of a room by distance.
+
+        Only whichever is smaller gets walked: the cached neighborhood (checking each room's
+        puppets), or the puppets on the map (checking each one's room against the neighborhood).
+        So the cost per call is bounded by both the size of the neighborhood and the number of
+        players on the map.
+
+        Args:
+            room (AthanorRoom): Where the sound starts.
+            depth (int): How many exits away it carries.
+            puppets (set): The puppets on this map, as per the owner's OccupancyHandler.
+
+        Returns:
+            audience (dict): distance -> list of puppets.
+        """
+        near = self.neighborhood(room, depth)
+        audience = dict()
+        if len(puppets) < len(near):
+            for puppet in puppets:
+                if (distance := near.get(puppet.location, None)) is not None:
+                    audience.setdefault(distance, list()).append(puppet)
+        else:
+            for other, distance in near.items():
+                if (found := other.occupancy.puppets):
+                    audience.setdefault(distance, list()).extend(found)
+        return audience
+
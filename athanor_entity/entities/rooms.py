@@ -1,11 +1,11 @@
 from django.conf import settings
-from evennia.utils.utils import class_from_module
-from athanor_entity.entities.base import AbstractMapEntity
+from collections import defaultdict
 
-MIXINS = []
+from evennia import GLOBAL_SCRIPTS
+from evennia.utils.utils import list_to_string, class_from_module
+from athanor_entity.entities.base import AbstractMapEntity
 
-for mixin in settings.MIXINS["ENTITY_ROOM"]:
-    MIXINS.append(class_from_module(mixin))
+MIXINS = [class_from_module(mixin) for mixin in settings.MIXINS["ENTITY_ROOM"]]
 MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
@@ -17,23 +17,170 @@ class AthanorRoom(*MIXINS, AbstractMapEntity):
         self.description = data.get("description", "")
         self.item_data = data.get('items', list())
         self.mobile_data = data.get('mobiles', list())
+        # What item_data and mobile_data compile to, and who's here by the template they came from.
+        # Both are used by the ResetEngine.
+        self.population = None
+        self.template_index = defaultdict(set)
         self.exit_data = data.get('exits', dict())
+        self.room_exits = list()
         self.lock_storage = data.get("locks", "")
+        # Open areas can see into any adjacent open area, as if every exit between them were a window.
+        self.open_area = data.get('open', False)
+        self.visibility = None
         area_key = data.get('area', None)
         self.area = handler.areas.get(area_key, None)
         if self.area:
             self.area.rooms.add(self)
+        self.tick_interval = data.get('tick_interval', self.tick_interval)
+        if self.tick_interval:
+            GLOBAL_SCRIPTS.entity.ndb.ticks.schedule(self)
 
     def load_items(self):
-        pass
+        """
+        Spawns this room's items as listed in its map data.
+
+        Returns:
+            items (list)
+        """
+        return GLOBAL_SCRIPTS.entity.ndb.spawner.spawn_list(self.item_data, self, self.handler.plugin, 'items')
 
     def load_mobiles(self):
-        pass
+        """
+        Spawns this room's mobiles as listed in its map data.
+
+        Returns:
+            mobiles (list)
+        """
+        return GLOBAL_SCRIPTS.entity.ndb.spawner.spawn_list(self.mobile_data, self, self.handler.plugin, 'mobiles')
+
+    def update_data(self, data):
+        """
+        Applies reloaded map data in place. Everything in the room stays put.
+
+        Returns:
+            exits_changed (bool): Whether the exits need rebuilding with reload_exits().
+        """
+        AbstractMapEntity.update_data(self, data)
+        self.description = data.get("description", "")
+        self.lock_storage = data.get("locks", "")
+        self.item_data = data.get('items', list())
+        self.mobile_data = data.get('mobiles', list())
+        self.population = None
+        self.open_area = data.get('open', False)
+        self.set_area(self.handler.areas.get(data.get('area', None), None))
+        tick_interval = data.get('tick_interval', self.__class__.tick_interval)
+        if tick_interval != self.tick_interval:
+            self.tick_interval = tick_interval
+            ticks = GLOBAL_SCRIPTS.entity.ndb.ticks
+            if tick_interval:
+                ticks.schedule(self)
+            else:
+                ticks.unschedule(self)
+        exits_changed = self.exit_data != data.get('exits', dict())
+        self.exit_data = data.get('exits', dict())
+        return exits_changed
+
+    def set_area(self, area):
+        """
+        Moves this room to another area (or none), carrying its occupancy counts along.
+        """
+        if area is self.area:
+            return
+        occupants = list(self.entities)
+        if self.area:
+            self.area.rooms.discard(self)
+            self.area.occupancy.remove_many(occupants)
+        self.area = area
+        if area:
+            area.rooms.add(self)
+            area.occupancy.add_many(occupants)
+
+    def clear_exits(self):
+        for ex in self.room_exits:
+            if ex.gateway:
+                ex.gateway.exits.pop(ex, None)
+            ex.location = None
+        self.room_exits = list()
+
+    def reload_exits(self):
+        self.clear_exits()
+        self.load_exits()
+
+    def at_register_entity(self, entity):
+        if (template := getattr(entity, 'template', None)):
+            self.template_index[template].add(entity)
+
+    def at_unregister_entity(self, entity):
+        if (template := getattr(entity, 'template', None)) and (found := self.template_index.get(template, None)):
+            found.discard(entity)
+            if not found:
+                del self.template_index[template]
 
     def load_exits(self):
         for destination_key, exit_data in self.exit_data.items():
             exit_class = exit_data.get('class')
-            exit_class(destination_key, self.handler, exit_data, self)
+            self.room_exits.append(exit_class(destination_key, self.handler, exit_data, self))
 
     def get_description(self, looker):
         return self.description
+
+    def build_visibility(self):
+        """
+        Works out which adjacent rooms can be seen from here. Called on first use, and again after
+        invalidate_visibility().
+
+        Transparent gateways never load the map on the other side. Until it's loaded by something
+        else, there's nothing to see through them, and visibility isn't kept, so the next look
+        works it out again.
+
+        Returns:
+            visibility (list): (exit, room) pairs for every exit which can be seen through.
+        """
+        visibility, complete = list(), True
+        for ex in self.room_exits:
+            if not ex.see_through:
+                continue
+            if ex.gateway:
+                destination = ex.gateway.peek_destination()
+                complete = complete and destination is not None
+            else:
+                destination = ex.destination
+            if destination is not None:
+                visibility.append((ex, destination))
+        self.visibility = visibility if complete else None
+        return visibility
+
+    def invalidate_visibility(self):
+        self.visibility = None
+
+    @property
+    def visible_rooms(self):
+        if self.visibility is None:
+            return self.build_visibility()
+        return self.visibility
+
+    def viewable_by(self, looker):
+        """
+        Returns:
+            entities (list): What looker may view in this room from elsewhere, leaving out exits.
+        """
+        exits = set(self.room_exits)
+        return [ent for ent in self.entities
+                if ent is not looker and ent not in exits and ent.access(looker, "view")]
+
+    def visible_entities(self, looker):
+        """
+        Returns:
+            entities (list): Everything (except exits) in adjacent visible rooms that looker may view.
+        """
+        return [ent for _, room in self.visible_rooms for ent in room.viewable_by(looker)]
+
+    def return_appearance(self, looker, **kwargs):
+        string = super().return_appearance(looker, **kwargs)
+        if not looker:
+            return string
+        for ex, room in self.visible_rooms:
+            if (seen := room.viewable_by(looker)):
+                names = list_to_string([ent.get_display_name(looker) for ent in seen])
+                string += f"\n|wTo the {ex.get_display_name(looker)}:|n {names}"
+        return string
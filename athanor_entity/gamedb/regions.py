@@ -1,5 +1,5 @@
 from django.conf import settings
-
+from evennia import GLOBAL_SCRIPTS
 from evennia.utils.utils import lazy_property, class_from_module
 
 from athanor.gamedb.objects import AthanorObject
@@ -31,7 +31,18 @@ class AthanorRegion(*MIXINS, BaseGameEntity, AthanorObject):
         return region
 
     def update_data(self, data):
-        pass
+        """
+        Called with this region's plugin data whenever plugins are (re)loaded.
+
+        Args:
+            data (dict): The region's data. Only 'map' matters here.
+        """
+        if not (map_key := data.get('map', None)) or map_key == self.map_bridge.map_key:
+            return
+        self.map_bridge.map_key = map_key
+        self.map_bridge.save(update_fields=['map_key'])
+        if (handler := self.__dict__.get('map', None)) is not None and handler.loaded:
+            handler.patch(GLOBAL_SCRIPTS.entity.ndb.plugins[self.map_bridge.plugin].maps[map_key])
 
     @lazy_property
     def entities(self):
@@ -41,4 +52,20 @@ class AthanorRegion(*MIXINS, BaseGameEntity, AthanorObject):
         self.entities.add(entity)
 
     def unregister_entity(self, entity):
-        self.entities.remove(entity)
\ No newline at end of file
+        self.entities.remove(entity)
+
+    def msg_region(self, text, exclude=None, from_obj=None, mapping=None, **kwargs):
+        """
+        Sends a message to every puppet anywhere on this region's map, such as weather or a shout.
+
+        Args:
+            text (str or tuple): The message.
+            exclude (list, optional): Entities not to send to.
+            from_obj (entity, optional): Who it's from.
+            mapping (dict, optional): Per-recipient substitutions, as per msg_contents.
+            **kwargs: batch=True batches output per session until the next reactor turn.
+
+        Returns:
+            count (int): How many puppets were sent to.
+        """
+        return self.occupancy.msg(text, exclude=exclude, from_obj=from_obj, mapping=mapping, **kwargs)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.conf import settings
-
 from evennia.utils.utils import class_from_module
+from evennia import GLOBAL_SCRIPTS
 from athanor.gamedb.objects import AthanorObject
 from athanor_entity.entities.base import BaseGameEntity
 
@@ -9,4 +9,12 @@ MIXINS.sort(key=lambda x: getattr(x, "mixin_priority", 0))
 
 
 class AthanorStructure(*MIXINS, BaseGameEntity, AthanorObject):
-    pass
+
+    def at_location_change(self, old_room, new_room):
+        # Structures with an interior carry their gateways along with them.
+        if hasattr(self, 'map_bridge'):
+            GLOBAL_SCRIPTS.entity.update_structure(self)
+            if self.map.loaded:
+                for gateway in self.map.gateways.values():
+                    if gateway.outside:
+                        gateway.invalidate_visibility()
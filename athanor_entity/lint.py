@@ -0,0 +1,98 @@
+"""
+Checks plugin data for mistakes without booting the server:
+
+    python -m athanor_entity.lint path/to/gamedata/myplugin [path/to/otherplugin ...] [--workers 4]
+
+Each path is a plugin's data directory, laid out as the gamedata controller expects:
+templates/<kind>.yaml, regions.yaml and maps/<map>/{map,areas,rooms,gateways,exits}.yaml. Files may
+hold several YAML documents, which are merged. The plugin key is the directory's name, unless given
+as KEY=PATH. Pass every plugin the game uses, so references between plugins can be checked.
+
+Every problem is printed as plugin/file: key: message. Exits with status 1 if there were any.
+"""
+import argparse
+import os
+import sys
+import time
+
+import yaml
+
+from athanor_entity.controllers.validation import MAP_SECTIONS, Problem, validate_plugins
+
+
+def load_yaml(directory, filename, plugin_key, problems):
+    """
+    Reads a plugin's YAML file, merging all of its documents into one mapping.
+
+    Returns:
+        data (dict)
+    """
+    data = dict()
+    try:
+        with open(os.path.join(directory, filename)) as f:
+            for document in yaml.safe_load_all(f):
+                if document is None:
+                    continue
+                if not isinstance(document, dict):
+                    problems.append(Problem(plugin_key, filename, "", "documents must be mappings"))
+                    continue
+                data.update(document)
+    except yaml.YAMLError as err:
+        mark = getattr(err, 'problem_mark', None)
+        where = f"line {mark.line + 1}, column {mark.column + 1}" if mark else ""
+        problems.append(Problem(plugin_key, filename, where, f"is not valid YAML: {getattr(err, 'problem', err)}"))
+    return data
+
+
+def load_plugin(directory, plugin_key, problems):
+    """
+    Reads a plugin's data directory into the shape the entity controller gets from plugins.
+
+    Returns:
+        data (dict): With 'templates', 'maps' and 'regions'.
+    """
+    data = {'templates': dict(), 'maps': dict(), 'regions': dict()}
+    if os.path.isdir(os.path.join(directory, "templates")):
+        for filename in sorted(os.listdir(os.path.join(directory, "templates"))):
+            kind, extension = os.path.splitext(filename)
+            if extension in ('.yaml', '.yml'):
+                data['templates'][kind] = load_yaml(directory, f"templates/{filename}", plugin_key, problems)
+    if os.path.isdir(os.path.join(directory, "maps")):
+        for map_key in sorted(os.listdir(os.path.join(directory, "maps"))):
+            if not os.path.isdir(os.path.join(directory, "maps", map_key)):
+                continue
+            data['maps'][map_key] = map_data = dict()
+            for section in MAP_SECTIONS:
+                if os.path.exists(os.path.join(directory, filename := f"maps/{map_key}/{section}.yaml")):
+                    map_data[section] = load_yaml(directory, filename, plugin_key, problems)
+    if os.path.exists(os.path.join(directory, "regions.yaml")):
+        data['regions'] = load_yaml(directory, "regions.yaml", plugin_key, problems)
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check plugin data for mistakes.")
+    parser.add_argument("plugins", nargs="+", help="Plugin data directories, as PATH or KEY=PATH.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes to check in. 0 checks in this process.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    problems, plugins = list(), dict()
+    for spec in args.plugins:
+        plugin_key, _, path = spec.rpartition('=')
+        plugin_key = plugin_key or os.path.basename(os.path.normpath(path))
+        if not os.path.isdir(path):
+            parser.error(f"{path} is not a directory")
+        plugins[plugin_key] = load_plugin(path, plugin_key, problems)
+
+    problems.extend(validate_plugins(plugins, workers=args.workers))
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problem(s) in {len(plugins)} plugin(s), checked in {time.perf_counter() - start:.2f}s.",
+          file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
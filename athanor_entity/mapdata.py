@@ -0,0 +1,25 @@
+"""
+Helpers for reading prepared map data, shared by the controllers and the entities which route over
+it. This module must stay importable without Django or Evennia being set up.
+"""
+
+
+def iter_room_exits(map_data, *fields):
+    """
+    Walks a map's exits without preparing any rooms, whether the map is a prepared dict or a
+    BundledMap (which reads them straight from its exit tables).
+
+    Args:
+        map_data (dict or BundledMap): The map.
+        *fields (str): Exit data to fetch, such as 'gateway'.
+
+    Yields:
+        room (tuple): (room key, [(destination key, (value of each field, ...)), ...]) for every
+            room, in map order.
+    """
+    if hasattr(map_data, 'room_exits'):
+        yield from map_data.room_exits(*fields)
+        return
+    for room_key, room_data in map_data.get('rooms', dict()).items():
+        yield room_key, [(dest_key, tuple(exit_data.get(name, None) for name in fields))
+                         for dest_key, exit_data in (room_data.get('exits', None) or dict()).items()]
@@ -0,0 +1,80 @@
+"""
+Compares a per-object Python regen loop against the vectorized ComponentStore update.
+
+Only needs NumPy:
+    python benchmarks/bench_components.py --count 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_entity.entities.components import ComponentStore, ComponentField, component_fields
+
+
+class PlainMobile(object):
+
+    def __init__(self):
+        self.hp = 50.0
+        self.hp_max = 100.0
+        self.hp_regen = 1.5
+
+
+class StoredMobile(object):
+    hp = ComponentField(default=50.0)
+    hp_max = ComponentField(default=100.0)
+    hp_regen = ComponentField(default=1.5)
+
+    def __init__(self, store):
+        self.component_stores = {'mobiles': store}
+        for field in component_fields(self.__class__):
+            store.add_column(field.name, field.dtype, field.default)
+        store.register(self)
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    plain = [PlainMobile() for _ in range(args.count)]
+
+    def plain_tick():
+        for mob in plain:
+            mob.hp = min(mob.hp + mob.hp_regen, mob.hp_max)
+
+    store = ComponentStore('mobiles')
+    stored = [StoredMobile(store) for _ in range(args.count)]
+
+    def stored_tick():
+        store.add('hp', 'hp_regen', maximum='hp_max')
+
+    def attribute_tick():
+        for mob in stored[:1000]:
+            mob.hp = min(mob.hp + mob.hp_regen, mob.hp_max)
+
+    plain_time = timed(plain_tick, args.repeat)
+    stored_time = timed(stored_tick, args.repeat)
+    attr_time = timed(attribute_tick, args.repeat)
+
+    print(f"mobiles:                 {args.count}")
+    print(f"python loop regen:       {plain_time * 1000:.3f} ms")
+    print(f"vectorized regen:        {stored_time * 1000:.3f} ms ({plain_time / stored_time:.1f}x)")
+    print(f"attribute access (1000): {attr_time * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
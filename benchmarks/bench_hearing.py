@@ -0,0 +1,96 @@
+"""
+Measures the cost of working out who hears an utterance, against a naive BFS per utterance.
+
+Uses lightweight stand-ins for rooms, exits and puppets, so it doesn't need Evennia:
+    python benchmarks/bench_hearing.py --rooms 100000 --puppets 2000 --depth 3
+
+The cached neighborhoods make the per-utterance cost depend only on the hearing range and the
+number of players on the map, not on the size of the map.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_entity.entities.paths import MapGraph
+from benchmarks.bench_paths import StubMap
+from benchmarks.worldgen import generate_world
+
+
+class StubOccupancy(object):
+
+    def __init__(self):
+        self.puppets = set()
+
+
+class StubPuppet(object):
+
+    def __init__(self, room):
+        self.location = room
+        room.occupancy.puppets.add(self)
+
+
+def naive(room, depth):
+    audience = dict()
+    seen = {room}
+    frontier = deque([(room, 0)])
+    while frontier:
+        node, distance = frontier.popleft()
+        if distance == depth:
+            continue
+        for ex in node.room_exits:
+            if (target := ex.destination) not in seen:
+                seen.add(target)
+                frontier.append((target, distance + 1))
+                if target.occupancy.puppets:
+                    audience.setdefault(distance + 1, list()).extend(target.occupancy.puppets)
+    return audience
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=100000)
+    parser.add_argument("--puppets", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--says", type=int, default=20000)
+    args = parser.parse_args()
+
+    handler = StubMap(generate_world(rooms=args.rooms, exit_density=0.5)['maps']['map_0'])
+    for room in handler.rooms.values():
+        room.occupancy = StubOccupancy()
+    graph = MapGraph(handler)
+    rng = random.Random(0)
+    rooms = list(handler.rooms.values())
+    puppets = {StubPuppet(rng.choice(rooms)) for _ in range(args.puppets)}
+    speakers = [rng.choice(rooms) for _ in range(args.says)]
+
+    start = time.perf_counter()
+    for room in speakers:
+        naive(room, args.depth)
+    base = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for room in speakers:
+        graph.audience(room, args.depth, puppets)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    heard = 0
+    for room in speakers:
+        heard += sum(len(found) for found in graph.audience(room, args.depth, puppets).values())
+    warm = time.perf_counter() - start
+
+    sizes = [len(graph.neighborhood(room, args.depth)) for room in speakers]
+    print(f"{len(rooms)} rooms, {len(puppets)} puppets, range {args.depth}, "
+          f"neighborhoods of {min(sizes)}-{max(sizes)} rooms")
+    print(f"naive BFS:        {base / args.says * 1000000:8.1f} us/say")
+    print(f"cached (cold):    {cold / args.says * 1000000:8.1f} us/say")
+    print(f"cached (warm):    {warm / args.says * 1000000:8.1f} us/say, {heard / args.says:.2f} listeners/say")
+
+
+if __name__ == "__main__":
+    main()
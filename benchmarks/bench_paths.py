@@ -0,0 +1,92 @@
+"""
+Times MapGraph construction and route finding on large synthetic grids.
+
+Uses lightweight stand-ins for rooms and exits, so it doesn't need Evennia:
+    python benchmarks/bench_paths.py --rooms 100000 --queries 200
+
+Reports graph build time and size, breadth-first query time, landmark precomputation time and
+landmark A* query time, and checks that both searches agree on route lengths.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_entity.entities.paths import MapGraph
+from benchmarks.worldgen import generate_world
+
+
+class StubRoom(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.room_exits = list()
+
+
+class StubExit(object):
+    gateway = None
+    db_lock_storage = ""
+
+    def __init__(self, destination):
+        self.destination = destination
+
+    def access(self, accessing_obj, access_type):
+        return True
+
+
+class StubMap(object):
+
+    def __init__(self, map_data):
+        self.owner = "bench"
+        self.rooms = {key: StubRoom(key) for key in map_data['rooms']}
+        for key, exits in map_data['exits'].items():
+            for dest_key in exits:
+                if dest_key in self.rooms:
+                    self.rooms[key].room_exits.append(StubExit(self.rooms[dest_key]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=100000)
+    parser.add_argument("--density", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--landmarks", type=int, default=8)
+    args = parser.parse_args()
+
+    data = generate_world(rooms=args.rooms, exit_density=args.density)
+    handler = StubMap(data['maps']['map_0'])
+    start = time.perf_counter()
+    graph = MapGraph(handler, landmarks=args.landmarks, hot_queries=args.queries * 10)
+    build = time.perf_counter() - start
+    size = sum(arr.itemsize * len(arr) for arr in (graph.offsets, graph.targets, graph.sources,
+                                                   graph.rev_offsets, graph.rev_targets))
+    print(f"{len(graph)} rooms, {graph.edges} exits: built in {build * 1000:.1f} ms, "
+          f"CSR arrays {size / 1024 / 1024:.1f} MB")
+
+    rng = random.Random(0)
+    pairs = [tuple(rng.sample(graph.rooms, 2)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    bfs_lengths = [len(graph.find_path(a, b)) for a, b in pairs]
+    bfs = time.perf_counter() - start
+    print(f"BFS: {bfs / args.queries * 1000:.2f} ms/query, mean route {sum(bfs_lengths) / len(bfs_lengths):.0f} exits")
+
+    start = time.perf_counter()
+    graph.build_landmarks()
+    print(f"{len(graph.landmarks)} landmarks precomputed in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    alt_lengths = [len(graph.find_path(a, b)) for a, b in pairs]
+    alt = time.perf_counter() - start
+    print(f"A* (landmarks): {alt / args.queries * 1000:.2f} ms/query, {bfs / alt:.1f}x faster than BFS")
+
+    if alt_lengths != bfs_lengths:
+        print("MISMATCH: A* and BFS disagree on route lengths!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
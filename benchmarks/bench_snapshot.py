@@ -0,0 +1,61 @@
+"""
+Measures the entity snapshot format: file size, capture encode time and decode time for a
+synthetic entity graph shaped like EntitySnapshot.capture() output.
+
+Restoring into a live server additionally costs one entity __init__ per record plus one
+LocationHandler.set_many() per occupied room. The server-side suite (benchmarks/run.py) times
+that against respawning the same entities from templates, in its snapshot case.
+
+    python benchmarks/bench_snapshot.py --count 100000 --rooms 10000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_entity.controllers.snapshot import SNAPSHOT_VERSION, encode_snapshot, decode_snapshot
+
+
+def build_payload(count, rooms):
+    created = datetime.datetime.now(datetime.timezone.utc)
+    records = list()
+    for i in range(count):
+        state = {'name': f"goblin {i}", 'locks': "view:all()", 'cmdsets': "", 'date_created': created,
+                 'typeclass_path': "", 'tick_interval': 10, 'hp': 50.0}
+        if i % 4:
+            location = (('obj', 1), f"room_{i % rooms}")
+            holder = None
+        else:
+            location = None
+            holder = ('items', ('ent', i - 1 if i else 0), 'backpack')
+        records.append(("athanor_entity.entities.mobiles.AthanorMobile", state, location, holder))
+    return {'version': SNAPSHOT_VERSION, 'entities': records}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--rooms", type=int, default=10000)
+    args = parser.parse_args()
+
+    payload = build_payload(args.count, args.rooms)
+
+    start = time.perf_counter()
+    raw = encode_snapshot(payload)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decode_snapshot(raw)
+    decode_time = time.perf_counter() - start
+
+    print(f"entities:      {args.count}")
+    print(f"snapshot size: {len(raw) / 1024:.1f} KiB ({len(raw) / args.count:.1f} bytes/entity)")
+    print(f"encode:        {encode_time * 1000:.1f} ms")
+    print(f"decode:        {decode_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
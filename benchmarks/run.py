@@ -0,0 +1,502 @@
+"""
+Benchmark suite for the entity subsystem.
+
+Runs against a throwaway SQLite database (see benchmarks/settings.py) from inside your game
+directory, so that your real settings and plugins are in effect:
+
+    cd mygame
+    python /path/to/athanor_entity/benchmarks/run.py --output results.json
+    python /path/to/athanor_entity/benchmarks/run.py --sizes 1000 10000 --compare results.json
+
+Results are written as JSON: one entry per case, with its parameters, elapsed seconds, number of
+operations and operations per second. --compare prints the ratio against an earlier result file.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.worldgen import SyntheticPlugin, PuppetSimulator, generate_world
+
+
+def template_chain(count, depth):
+    """
+    Builds plugin data containing `count` room templates, each inheriting from a chain `depth` long.
+    """
+    templates = dict()
+    for i in range(count):
+        parent = None
+        for level in range(depth):
+            key = f"t{i}_{level}"
+            templates[key] = {f"field_{level}": level, 'description': key}
+            if parent:
+                templates[key]['templates'] = [parent]
+            parent = key
+    return {'templates': {'rooms': templates}}
+
+
+class Suite(object):
+
+    def __init__(self, sizes, occupants, repeat):
+        self.sizes = sizes
+        self.occupants = occupants
+        self.repeat = repeat
+        self.results = dict()
+
+    def record(self, name, params, seconds, ops):
+        self.results[name] = {'params': params, 'seconds': seconds, 'ops': ops,
+                              'ops_per_sec': ops / seconds if seconds else None}
+        print(f"{name:<40} {seconds * 1000:>10.2f} ms {ops:>9} ops")
+
+    def fail(self, name, params, err):
+        self.results[name] = {'params': params, 'error': repr(err)}
+        print(f"{name:<40} ERROR {err!r}")
+
+    def run_case(self, name, params, func):
+        try:
+            func(name, params)
+        except Exception as err:
+            self.fail(name, params, err)
+
+    def timed(self, func, number=1):
+        best = None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def load_world(self, rooms):
+        """
+        Loads a fresh grid world into the controller and returns (region, MapHandler load seconds).
+        """
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.entities.handlers import MapHandler
+
+        controller = GLOBAL_SCRIPTS.entity
+        data = generate_world(rooms=rooms, exit_density=1.0, prefix=f"bench_{rooms}")
+        controller.load(plugins={'bench': SyntheticPlugin('bench', data)})
+        region = controller.ndb.regions[f"bench_{rooms}_0"]
+        handler = MapHandler(region)
+        start = time.perf_counter()
+        handler.load()
+        elapsed = time.perf_counter() - start
+        # Swap in the freshly loaded map and forget about anything from earlier runs.
+        region.__dict__['map'] = handler
+        region.__dict__['entities'] = set()
+        region.__dict__.pop('occupancy', None)
+        return region, elapsed
+
+    def spawn(self, count, prefix="goblin", room=None):
+        from athanor_entity.entities.mobiles import AthanorMobile
+        mobs = [AthanorMobile({'name': f"{prefix} {i}", 'locks': "view:all()"}) for i in range(count)]
+        if room:
+            for mob in mobs:
+                mob.location = room
+        return mobs
+
+    def bench_templates(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        controller = GLOBAL_SCRIPTS.entity
+
+        def run():
+            controller.ndb.plugins = {'bench': SyntheticPlugin('bench', template_chain(params['count'], params['depth']))}
+            controller.ndb.class_cache = defaultdict(dict)
+            controller.prepare_templates()
+
+        self.record(name, params, self.timed(run), params['count'] * params['depth'])
+
+    def bench_maps(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        controller = GLOBAL_SCRIPTS.entity
+        plugin = SyntheticPlugin('bench', generate_world(rooms=params['rooms'], exit_density=1.0,
+                                                         prefix=f"bench_{params['rooms']}"))
+        controller.ndb.plugins = {'bench': plugin}
+        controller.ndb.class_cache = defaultdict(dict)
+        controller.prepare_templates()
+        start = time.perf_counter()
+        controller.prepare_maps()
+        self.record(f"{name}.prepare", params, time.perf_counter() - start, params['rooms'])
+        region, elapsed = self.load_world(params['rooms'])
+        self.record(f"{name}.load", params, elapsed, params['rooms'])
+
+    def bench_move(self, name, params):
+        region, _ = self.load_world(100)
+        room_a, room_b = region.map.get_room("r0_0"), region.map.get_room("r1_0")
+        self.spawn(params['occupants'], "bystander", room_a)
+        self.spawn(params['occupants'], "bystander", room_b)
+        mover = self.spawn(1, "mover", room_a)[0]
+
+        def run():
+            mover.move_to(room_b if mover.location == room_a else room_a)
+
+        self.record(name, params, self.timed(run, params['moves']), params['moves'])
+
+    def bench_msg_contents(self, name, params):
+        region, _ = self.load_world(100)
+        room = region.map.get_room("r0_0")
+        speaker = self.spawn(params['occupants'], room=room)[0]
+
+        def run():
+            room.msg_contents("{speaker} says hello.", mapping={'speaker': speaker})
+
+        self.record(name, params, self.timed(run, params['messages']), params['messages'] * params['occupants'])
+
+    def bench_search(self, name, params):
+        region, _ = self.load_world(100)
+        room = region.map.get_room("r0_0")
+        searcher = self.spawn(params['occupants'], "goblin", room)[0]
+        self.spawn(params['occupants'], "orc", room)
+
+        def run():
+            searcher.search_entities("2.orc")
+
+        self.record(name, params, self.timed(run, params['searches']), params['searches'])
+
+    def bench_appearance(self, name, params):
+        region, _ = self.load_world(100)
+        room = region.map.get_room("r0_0")
+        looker = self.spawn(params['occupants'], "goblin", room)[0]
+
+        def run():
+            room.return_appearance(looker)
+
+        self.record(name, params, self.timed(run, params['looks']), params['looks'])
+
+    def bench_inventory(self, name, params):
+        from athanor_entity.entities.items import AthanorItem
+        holder = self.spawn(1, "porter")[0]
+        items = [AthanorItem({'name': f"arrow {i}"}) for i in range(params['items'])]
+        inv = holder.items.get_inventory('backpack')
+        gearset = holder.gear.get_gearset('worn')
+
+        def inventory_run():
+            for item in items:
+                inv.add(item)
+            for item in items:
+                inv.remove(item)
+
+        def gear_run():
+            for item in items:
+                gearset.equip(item)
+            for item in items:
+                gearset.unequip(item)
+
+        stacked = [AthanorItem({'name': "arrow", 'stackable': True}) for i in range(params['items'])]
+
+        def stack_run():
+            stack = None
+            for item in stacked:
+                item.stack_count = 1
+                stack = inv.add(item)
+            while stack.stack_count > 1:
+                inv.remove(stack, count=1)
+            inv.remove(stack)
+
+        self.record(f"{name}.items", params, self.timed(inventory_run), params['items'] * 2)
+        self.record(f"{name}.stacks", params, self.timed(stack_run), params['items'] * 2)
+        self.record(f"{name}.gear", params, self.timed(gear_run), params['items'] * 2)
+
+    def bench_spawn(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.entities.handlers import LocationHandler
+        controller = GLOBAL_SCRIPTS.entity
+        region, _ = self.load_world(100)
+        room = region.map.get_room("r0_0")
+        plugin = region.map.plugin
+        count = params['count']
+
+        def naive_run():
+            mobs = list()
+            for _ in range(count):
+                data = controller.prepare_data('mobiles', {'templates': ['goblin']}, plugin)
+                mobs.append(data['class'](data))
+            for mob in mobs:
+                mob.location = room
+            LocationHandler.set_many(mobs, None)
+
+        def blueprint_run():
+            LocationHandler.set_many(controller.spawn_many('goblin', count, room, plugin, 'mobiles'), None)
+
+        self.record(f"{name}.naive", params, self.timed(naive_run), count)
+        self.record(f"{name}.blueprint", params, self.timed(blueprint_run), count)
+
+    def bench_snapshot(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.controllers.snapshot import EntitySnapshot, encode_snapshot, decode_snapshot
+        controller = GLOBAL_SCRIPTS.entity
+        region, _ = self.load_world(params['rooms'])
+        rooms = list(region.map.rooms.values())
+        plugin = region.map.plugin
+        per_room = params['count'] // len(rooms)
+        snapshot = EntitySnapshot(controller)
+
+        def cold_spawn():
+            # What a reload costs without a snapshot: every room respawns its population from templates.
+            return [mob for room in rooms for mob in controller.spawn_many('goblin', per_room, room, plugin, 'mobiles')]
+
+        spawned = cold_spawn()
+        start = time.perf_counter()
+        raw = encode_snapshot(snapshot.capture())
+        capture_time = time.perf_counter() - start
+        stats = dict(params, snapshot_bytes=len(raw))
+        self.record(f"{name}.capture", stats, capture_time, params['count'])
+
+        def run(label, func):
+            best = None
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                entities = func()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+                controller.despawn_many(entities)
+            self.record(f"{name}.{label}", stats, best, params['count'])
+
+        controller.despawn_many(spawned)
+        run("restore", lambda: snapshot.restore(decode_snapshot(raw)))
+        run("cold_spawn", cold_spawn)
+
+    def bench_reset(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        resets = GLOBAL_SCRIPTS.entity.ndb.resets
+        region, _ = self.load_world(params['rooms'])
+        for room in region.map.rooms.values():
+            room.mobile_data = ['goblin']
+            room.item_data = [{'template': 'arrow', 'count': 20}]
+            room.population = None
+
+        def run(label):
+            # Drive the drain loop by hand, timing each step as the reactor would see it.
+            resets.reset(region)
+            steps, longest, start = 0, 0.0, time.perf_counter()
+            while resets.groups or resets.actions:
+                step = time.perf_counter()
+                resets.drain()
+                longest = max(longest, time.perf_counter() - step)
+                steps += 1
+            self.record(f"{name}.{label}", dict(params, steps=steps, longest_step=longest),
+                        time.perf_counter() - start, params['rooms'])
+
+        run("populate")
+        run("unchanged")
+        resets.spawner.despawn_many([ent for room in list(region.map.rooms.values())[::10]
+                                     for ent in list(room.template_index.get('bench/mobiles/goblin', ()))])
+        run("partial")
+
+    def bench_instances(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.entities.handlers import MapHandler
+        controller = GLOBAL_SCRIPTS.entity
+        region, _ = self.load_world(params['rooms'])
+        plugin, map_key = region.map.plugin, region.map_bridge.map_key
+        count = params['instances']
+
+        def eager_run():
+            # What ten separate copies cost when every copy builds its whole map.
+            for _ in range(10):
+                MapHandler(region).load()
+
+        instances = list()
+
+        def create_run():
+            instances.extend(controller.create_instance(plugin, map_key, populate=False) for _ in range(count))
+
+        def enter_run():
+            for instance in instances:
+                instance.map.get_room("r0_0")
+                instance.map.find_path(instance.map.get_room("r0_0"), instance.map.get_room("r1_0"))
+
+        def destroy_run():
+            for instance in instances:
+                controller.destroy_instance(instance)
+            instances.clear()
+
+        self.record(f"{name}.eager_x10", params, self.timed(eager_run), 10)
+        for label, func in (("create", create_run), ("enter", enter_run), ("destroy", destroy_run)):
+            start = time.perf_counter()
+            func()
+            self.record(f"{name}.{label}", params, time.perf_counter() - start, count)
+
+    def bench_bundle(self, name, params):
+        import tempfile
+        import tracemalloc
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.controllers.bundles import BundleWriter, MapBundle
+        from athanor_entity.entities.handlers import MapHandler
+        controller = GLOBAL_SCRIPTS.entity
+        region, _ = self.load_world(params['rooms'])
+        plugin = controller.ndb.plugins['bench']
+        maps = generate_world(rooms=params['rooms'], exit_density=1.0, prefix=f"bench_{params['rooms']}")['maps']
+        path = os.path.join(tempfile.gettempdir(), "athanor_entity_bench.athb")
+
+        def resident(func):
+            # Bytes still allocated by whatever func returns.
+            tracemalloc.start()
+            try:
+                result = func()
+                return result, tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+
+        def prepare():
+            return {key: controller.prepare_map('bench', data) for key, data in maps.items()}
+
+        def read_bundle():
+            with MapBundle(path) as bundle:
+                return {key: bundle.load(controller, key) for key in bundle.maps}
+
+        size = BundleWriter(controller, 'bench').write(maps, path)
+        _, prepared_bytes = resident(prepare)
+        _, bundled_bytes = resident(read_bundle)
+        stats = dict(params, file_bytes=size, prepared_bytes=prepared_bytes, bundled_bytes=bundled_bytes)
+        self.record(f"{name}.prepare", stats, self.timed(prepare), params['rooms'])
+        self.record(f"{name}.read", stats, self.timed(read_bundle), params['rooms'])
+
+        plugin.maps.update(read_bundle())
+        start = time.perf_counter()
+        MapHandler(region).load()
+        self.record(f"{name}.load", stats, time.perf_counter() - start, params['rooms'])
+        os.remove(path)
+
+    def bench_compile(self, name, params):
+        from evennia import GLOBAL_SCRIPTS
+        from athanor_entity.controllers.routing import GatewayRouter
+        controller = GLOBAL_SCRIPTS.entity
+        per_plugin = params['rooms'] // params['plugins']
+
+        def run(workers):
+            best = None
+            for _ in range(self.repeat):
+                controller.ndb.plugins = {f"bench{i}": SyntheticPlugin(f"bench{i}", generate_world(
+                    rooms=per_plugin, exit_density=1.0, prefix=f"bench{i}")) for i in range(params['plugins'])}
+                controller.ndb.class_cache = defaultdict(dict)
+                controller.ndb.routes = GatewayRouter()
+                start = time.perf_counter()
+                if workers:
+                    controller.compile_plugins(workers)
+                else:
+                    controller.prepare_templates()
+                    controller.prepare_maps()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        serial = run(0)
+        self.record(f"{name}.serial", params, serial, params['rooms'])
+        for workers in params['workers']:
+            elapsed = run(workers)
+            self.record(f"{name}.workers_{workers}", dict(params, speedup=serial / elapsed), elapsed, params['rooms'])
+
+    def bench_location_save(self, name, params):
+        from evennia.utils import create
+        from athanor_entity.gamedb.characters import EntityPlayerCharacter
+        region, _ = self.load_world(100)
+        room = region.map.get_room("r0_0")
+        char = create.create_object(EntityPlayerCharacter, key="BenchSaver")
+        try:
+            char.locations.room = room
+
+            def run():
+                char.locations.save()
+
+            self.record(name, params, self.timed(run, params['saves']), params['saves'])
+        finally:
+            char.delete()
+
+    def bench_simulation(self, name, params):
+        region, _ = self.load_world(params['rooms'])
+        sim = PuppetSimulator(list(region.map.rooms.values()), params['puppets'], seed=params['seed'])
+        try:
+            start = time.perf_counter()
+            sim.run(params['steps'])
+            self.record(name, dict(params, **sim.stats()), time.perf_counter() - start,
+                        params['steps'] * params['puppets'])
+        finally:
+            sim.despawn()
+
+    def run(self):
+        occupants = self.occupants
+        self.run_case("prepare_templates", {'count': 1000, 'depth': 3}, self.bench_templates)
+        for size in self.sizes:
+            self.run_case(f"maps.{size}", {'rooms': size}, self.bench_maps)
+        self.run_case("move_to", {'occupants': occupants, 'moves': 1000}, self.bench_move)
+        self.run_case("msg_contents", {'occupants': occupants, 'messages': 100}, self.bench_msg_contents)
+        self.run_case("search_entities", {'occupants': occupants, 'searches': 1000}, self.bench_search)
+        self.run_case("return_appearance", {'occupants': occupants, 'looks': 100}, self.bench_appearance)
+        self.run_case("inventory", {'items': 1000}, self.bench_inventory)
+        self.run_case("spawn", {'count': 1000}, self.bench_spawn)
+        self.run_case("snapshot", {'rooms': 1000, 'count': 10000}, self.bench_snapshot)
+        self.run_case("reset", {'rooms': 5000}, self.bench_reset)
+        self.run_case("instances", {'rooms': 1000, 'instances': 1000}, self.bench_instances)
+        for size in self.sizes:
+            self.run_case(f"bundle.{size}", {'rooms': size}, self.bench_bundle)
+        self.run_case("compile", {'rooms': max(self.sizes), 'plugins': 8, 'workers': [2, 4, 8]}, self.bench_compile)
+        self.run_case("simulation", {'rooms': 1000, 'puppets': 500, 'steps': 20, 'seed': 0},
+                      self.bench_simulation)
+        self.run_case("location_save", {'saves': 100}, self.bench_location_save)
+        return self.results
+
+
+def setup():
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0, interactive=False)
+    import evennia
+    evennia._init()
+
+
+def metadata():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                  text=True).stdout.strip()
+    except OSError:
+        revision = None
+    with open(os.path.join(REPO_DIR, "athanor_entity", "VERSION.txt")) as f:
+        version = f.read().strip()
+    return {'version': version, 'revision': revision, 'python': platform.python_version(),
+            'platform': platform.platform(), 'date': datetime.datetime.utcnow().isoformat()}
+
+
+def compare(results, path):
+    with open(path) as f:
+        old = json.load(f)['results']
+    print(f"\nCompared to {path}:")
+    for name, data in results.items():
+        before = old.get(name, dict())
+        if data.get('seconds') and before.get('seconds'):
+            print(f"{name:<40} {data['seconds'] / before['seconds']:>6.2f}x time")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--occupants", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Write JSON results to this file.")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against.")
+    args = parser.parse_args()
+
+    setup()
+    results = Suite(args.sizes, args.occupants, args.repeat).run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
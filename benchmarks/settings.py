@@ -0,0 +1,29 @@
+"""
+Settings for the entity benchmark suite.
+
+Takes your game's settings (so that athanor, athanor_entity and any plugins are set up exactly as
+they are in production) and swaps the database for a throwaway local SQLite file, so benchmarks
+never touch real data. Point ATHANOR_BENCH_BASE_SETTINGS at your settings module if it isn't the
+default `server.conf.settings`.
+"""
+import importlib
+import os
+import tempfile
+
+_base = importlib.import_module(os.environ.get("ATHANOR_BENCH_BASE_SETTINGS", "server.conf.settings"))
+globals().update({key: value for key, value in vars(_base).items() if key.isupper()})
+
+BENCH_DB = os.environ.get("ATHANOR_BENCH_DB", os.path.join(tempfile.gettempdir(), "athanor_entity_bench.db3"))
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BENCH_DB,
+    }
+}
+
+# Instrumentation would skew the numbers.
+ENTITY_PROFILING = False
+
+# The map cases measure preparing maps from plugin data. Bundles are measured separately.
+ENTITY_MAP_BUNDLE_DIR = None
@@ -0,0 +1,246 @@
+"""
+Synthetic world generator for load testing.
+
+generate_world() emits plugin data in the same shape the gamedata controller hands to
+AthanorEntityController (templates, maps with map/areas/rooms/gateways/exits, and regions), so a
+world of any size can be loaded without writing YAML:
+
+    from benchmarks.worldgen import generate_world, SyntheticPlugin, PuppetSimulator
+    data = generate_world(rooms=10000, maps=4, template_depth=3, exit_density=0.6, gateways=8)
+    GLOBAL_SCRIPTS.entity.load(plugins={'synth': SyntheticPlugin('synth', data)})
+
+PuppetSimulator then fills the loaded rooms with fake puppets which wander around and talk, so
+the movement and messaging paths see realistic traffic.
+"""
+import math
+import random
+from collections import defaultdict
+
+DIRECTIONS = (('n', 'North', 0, -1), ('s', 'South', 0, 1), ('e', 'East', 1, 0), ('w', 'West', -1, 0))
+OPPOSITE = {'n': 's', 's': 'n', 'e': 'w', 'w': 'e'}
+
+
+class SyntheticPlugin(object):
+    """
+    Quacks like a gamedata plugin: the entity controller only needs these four attributes.
+    """
+
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data
+        self.templates = defaultdict(dict)
+        self.maps = dict()
+
+
+def room_key(x, y):
+    return f"r{x}_{y}"
+
+
+def generate_templates(depth):
+    """
+    Builds room and exit templates. Rooms use 'room_{depth-1}', which inherits through a chain of
+    `depth` templates so that template resolution has real work to do.
+    """
+    rooms = dict()
+    for level in range(max(1, depth)):
+        rooms[f"room_{level}"] = {f"level_{level}": level, 'locks': "view:all()"}
+        if level:
+            rooms[f"room_{level}"]['templates'] = [f"room_{level - 1}"]
+    exits = {'base': {'locks': "traverse:all();puppet:false();get:false();call:all()"},
+             'gate': {'name': "Gate", 'aliases': ['gate'], 'templates': ['base']}}
+    for direction, name, dx, dy in DIRECTIONS:
+        exits[direction] = {'name': name, 'aliases': [direction], 'templates': ['base']}
+    mobiles = {'base': {'locks': "view:all();get:false()", 'tags': [('npc', 'role')]},
+               'goblin': {'name': "Goblin", 'templates': ['base'], 'tags': [('npc', 'role'), ('goblin', 'race')],
+                          'attributes': {'hp': 10, 'loot': ['arrow'], 'faction': "goblins"}}}
+    items = {'arrow': {'name': "Arrow", 'locks': "view:all()", 'stackable': True, 'tags': ['ammo']}}
+    return {'rooms': rooms, 'exits': exits, 'mobiles': mobiles, 'items': items}
+
+
+def generate_map(rng, rooms, width, room_template, exit_density, areas):
+    """
+    Lays `rooms` rooms out on a grid `width` wide. Every row is connected east-west and the first
+    column north-south, which keeps the map connected; the remaining north-south links are kept
+    with probability `exit_density`. All exits are two-way.
+    """
+    room_data, exit_data, area_data = dict(), defaultdict(dict), dict()
+    rows = int(math.ceil(rooms / width))
+    band = max(1, int(math.ceil(rows / max(1, areas))))
+    for i in range(rooms):
+        x, y = i % width, i // width
+        key = room_key(x, y)
+        area_key = f"area_{y // band}" if areas else None
+        room_data[key] = {'name': f"Room {x},{y}", 'description': f"Synthetic room at {x},{y}.",
+                          'templates': room_template}
+        if area_key:
+            room_data[key]['area'] = area_key
+            area_data.setdefault(area_key, {'name': f"Area {y // band}"})
+        exit_data[key] = dict()
+
+    def link(a, b, direction):
+        exit_data[a][b] = {'templates': direction}
+        exit_data[b][a] = {'templates': OPPOSITE[direction]}
+
+    for i in range(rooms):
+        x, y = i % width, i // width
+        if x + 1 < width and i + 1 < rooms:
+            link(room_key(x, y), room_key(x + 1, y), 'e')
+        if i + width < rooms and (x == 0 or rng.random() < exit_density):
+            link(room_key(x, y), room_key(x, y + 1), 's')
+
+    return {'map': {'name': "Synthetic Map"}, 'areas': area_data, 'rooms': room_data,
+            'gateways': dict(), 'exits': dict(exit_data)}
+
+
+def generate_world(rooms=1000, maps=1, template_depth=2, exit_density=0.5, gateways=0, areas=4,
+                   seed=0, prefix="synth"):
+    """
+    Generates plugin data for a synthetic world.
+
+    Args:
+        rooms (int): Total number of rooms, split evenly across maps.
+        maps (int): How many maps (each gets its own region).
+        template_depth (int): Length of the room template inheritance chain.
+        exit_density (float): Between 0 and 1. Chance of each optional north-south link existing.
+        gateways (int): Number of one-way gateways between randomly chosen maps.
+        areas (int): Areas per map. Rooms are assigned to them in horizontal bands.
+        seed (int): Random seed, so that runs are reproducible.
+        prefix (str): Prefix for the region keys, which must be unique in the database.
+
+    Returns:
+        data (dict): Plugin data with 'templates', 'maps' and 'regions' keys.
+    """
+    rng = random.Random(seed)
+    per_map = max(1, rooms // max(1, maps))
+    width = max(1, int(math.ceil(math.sqrt(per_map))))
+    room_template = f"room_{max(1, template_depth) - 1}"
+
+    map_data, region_data = dict(), dict()
+    for m in range(max(1, maps)):
+        map_key = f"map_{m}"
+        map_data[map_key] = generate_map(rng, per_map, width, room_template, exit_density, areas)
+        region_data[f"{prefix}_{m}"] = {'name': f"Synthetic Region {m}", 'map': map_key}
+
+    # A gateway exit points at a room key that doesn't exist in its own map. The gateway carries
+    # the real destination as a region/room path instead.
+    region_keys = list(region_data.keys())
+    for g in range(gateways if len(region_keys) > 1 else 0):
+        source, target = rng.sample(range(len(region_keys)), 2)
+        source_map = map_data[f"map_{source}"]
+        gateway_key = f"gate_{g}"
+        origin = rng.choice(list(source_map['rooms'].keys()))
+        landing = rng.choice(list(map_data[f"map_{target}"]['rooms'].keys()))
+        source_map['gateways'][gateway_key] = {'name': f"Gate {g}",
+                                               'destination': f"{region_keys[target]}/{landing}"}
+        source_map['exits'][origin][gateway_key] = {'templates': 'gate', 'gateway': gateway_key}
+
+    return {'templates': generate_templates(template_depth), 'maps': map_data, 'regions': region_data}
+
+
+class PuppetSimulator(object):
+    """
+    Spawns fake puppets into loaded rooms and drives them around.
+
+    The puppets claim to have an account, so they are counted as players by occupancy tracking,
+    the tick scheduler and anything else that cares, but they swallow their output instead of
+    sending it to a session.
+    """
+
+    def __init__(self, rooms, count, move_chance=0.3, talk_chance=0.2, seed=0):
+        """
+        Args:
+            rooms (list): AthanorRooms to spread the puppets across.
+            count (int): How many puppets to spawn.
+            move_chance (float): Per step, the chance of a puppet walking through a random exit.
+            talk_chance (float): Per step, the chance of a puppet saying something to its room.
+            seed (int): Random seed.
+        """
+        self.rng = random.Random(seed)
+        self.move_chance = move_chance
+        self.talk_chance = talk_chance
+        self.moves = 0
+        self.says = 0
+        self.steps = 0
+        self.puppets = list()
+        self.task = None
+        puppet_class = simulated_puppet_class()
+        for i in range(count):
+            puppet = puppet_class({'name': f"Puppet{i}", 'locks': "view:all()"})
+            puppet.location = self.rng.choice(rooms)
+            self.puppets.append(puppet)
+
+    @property
+    def delivered(self):
+        return sum(puppet.received for puppet in self.puppets)
+
+    def step(self):
+        """
+        Gives every puppet one chance to act.
+        """
+        rng = self.rng
+        for puppet in self.puppets:
+            roll = rng.random()
+            if roll < self.move_chance:
+                exits = [ent for ent in puppet.location.entities if ent.destination]
+                if exits and puppet.move_to(rng.choice(exits).destination):
+                    self.moves += 1
+            elif roll < self.move_chance + self.talk_chance:
+                puppet.location.msg_contents(f"{puppet.key} says, \"Testing, testing.\"", from_obj=puppet)
+                self.says += 1
+        self.steps += 1
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+
+    def start(self, interval=1.0):
+        """
+        Steps the simulation on the reactor until stop() is called. For use inside a running server.
+        """
+        from twisted.internet.task import LoopingCall
+        self.task = LoopingCall(self.step)
+        self.task.start(interval, now=False)
+
+    def stop(self):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.task = None
+
+    def despawn(self):
+        self.stop()
+        for puppet in self.puppets:
+            puppet.location = None
+        self.puppets = list()
+
+    def stats(self):
+        return {'puppets': len(self.puppets), 'steps': self.steps, 'moves': self.moves, 'says': self.says,
+                'delivered': self.delivered}
+
+
+_PUPPET_CLASS = None
+
+
+def simulated_puppet_class():
+    """
+    Builds the puppet class on first use, since the entity classes need Django to be set up.
+    """
+    global _PUPPET_CLASS
+    if _PUPPET_CLASS:
+        return _PUPPET_CLASS
+    from athanor_entity.entities.mobiles import AthanorMobile
+
+    class SimulatedPuppet(AthanorMobile):
+
+        def __init__(self, data):
+            AthanorMobile.__init__(self, data)
+            self.received = 0
+
+        @property
+        def has_account(self):
+            return True
+
+        def msg(self, text=None, from_obj=None, session=None, options=None, **kwargs):
+            self.received += 1
+
+    _PUPPET_CLASS = SimulatedPuppet
+    return _PUPPET_CLASS